@@ -0,0 +1,218 @@
+"""
+Micro-benchmarks for the team chess engine.
+
+Run from the project root with:
+    python -m engine.benchmarks [--nps-target N] [--search-time SECONDS] [--fen-positions N]
+"""
+import argparse
+import random
+import time
+from typing import Callable, List, Tuple
+
+import chess
+
+from .board import TeamChessBoard
+from .constants import PLAYER_SYMBOLS
+from .search import Searcher, NODES_PER_SECOND_TARGET
+
+
+def build_mid_game_corpus(size: int = 200, plies: Tuple[int, int] = (16, 48), seed: int = 0) -> List[Tuple[str, str]]:
+    """
+    Plays seeded random games from freshly allocated boards and returns a list of (custom fen, turn player symbol)
+    tuples, taken at a random ply inside the passed range.
+    """
+    rng = random.Random(seed)
+    # piece allocation of new boards uses the global random module
+    random.seed(seed)
+    corpus = []
+    while len(corpus) < size:
+        board = TeamChessBoard()
+        for _ in range(rng.randint(*plies)):
+            moves = list(board.generate_legal_moves())
+            if not moves:
+                break
+            board.push_san(board.san(rng.choice(moves)))
+        corpus.append((board.fen(), board.current_turn_player.symbol))
+    return corpus
+
+
+def _filtered_legal_moves(board: TeamChessBoard) -> List[chess.Move]:
+    """
+    The previous approach: generate every legal move for the side to move, then drop the ones whose from square is
+    not owned by the current turn player.
+    """
+    squares = board.current_turn_player.squares
+    return [
+        move for move in chess.Board.generate_legal_moves(board)
+        if squares & chess.BB_SQUARES[move.from_square]
+    ]
+
+
+def _masked_legal_moves(board: TeamChessBoard) -> List[chess.Move]:
+    return list(board.generate_legal_moves())
+
+
+def _moves_per_second(boards: List[TeamChessBoard], generate: Callable, rounds: int) -> float:
+    moves = 0
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for board in boards:
+            moves += len(generate(board))
+    return moves / (time.perf_counter() - start)
+
+
+def bench_legal_move_generation(corpus: List[Tuple[str, str]], rounds: int = 20) -> None:
+    boards = [TeamChessBoard(fen, current_turn_player_symbol=symbol) for fen, symbol in corpus]
+    for board in boards:
+        assert set(_masked_legal_moves(board)) == set(_filtered_legal_moves(board))
+
+    filtered = _moves_per_second(boards, _filtered_legal_moves, rounds)
+    masked = _moves_per_second(boards, _masked_legal_moves, rounds)
+    print(f'legal move generation over {len(boards)} positions:')
+    print(f'    filter after generation: {filtered:>12,.0f} moves/sec')
+    print(f'    from mask narrowing:     {masked:>12,.0f} moves/sec ({masked / filtered:.2f}x)')
+
+
+def _legacy_set_board_fen(board: TeamChessBoard, fen: str) -> None:
+    """
+    The previous custom FEN parser: a validation pass and a placement pass, character by character.
+    """
+    for row in fen.split("/"):
+        field_sum = 0
+        previous_was_digit = previous_was_piece = previous_was_symbol = False
+        for c in row:
+            if c in ["1", "2", "3", "4", "5", "6", "7", "8"]:
+                if previous_was_digit:
+                    raise ValueError(fen)
+                field_sum += int(c)
+                previous_was_digit, previous_was_piece, previous_was_symbol = True, False, False
+            elif c == "~":
+                if not previous_was_piece:
+                    raise ValueError(fen)
+                previous_was_digit = previous_was_piece = previous_was_symbol = False
+            elif c.lower() in chess.PIECE_SYMBOLS:
+                field_sum += 1
+                previous_was_digit, previous_was_piece, previous_was_symbol = False, True, False
+            elif c in PLAYER_SYMBOLS:
+                if previous_was_symbol or not previous_was_piece:
+                    raise ValueError(fen)
+                previous_was_symbol = True
+            else:
+                raise ValueError(fen)
+        if field_sum != 8:
+            raise ValueError(fen)
+
+    board._clear_board()
+    square_index = 0
+    for c in fen:
+        if c in ["1", "2", "3", "4", "5", "6", "7", "8"]:
+            square_index += int(c)
+        elif c.lower() in chess.PIECE_SYMBOLS:
+            piece = chess.Piece.from_symbol(c)
+            board._set_piece_at(chess.SQUARES_180[square_index], piece.piece_type, piece.color)
+            square_index += 1
+        elif c in PLAYER_SYMBOLS:
+            board.get_player_by_symbol(c).squares |= chess.BB_SQUARES[chess.SQUARES_180[square_index - 1]]
+        elif c == "~":
+            board.promoted |= chess.BB_SQUARES[chess.SQUARES_180[square_index - 1]]
+
+
+def _legacy_board_fen(board: TeamChessBoard) -> str:
+    """
+    The previous custom FEN serializer, piece by piece over SQUARES_180.
+    """
+    builder = []
+    empty = 0
+    for square in chess.SQUARES_180:
+        piece = board.piece_at(square)
+        if not piece:
+            empty += 1
+        else:
+            if empty:
+                builder.append(str(empty))
+                empty = 0
+            builder.append(piece.symbol())
+            builder.append(board._player_at(square).symbol)
+        if chess.BB_SQUARES[square] & chess.BB_FILE_H:
+            if empty:
+                builder.append(str(empty))
+                empty = 0
+            if square != chess.H1:
+                builder.append("/")
+    return "".join(builder)
+
+
+def _timed(function: Callable, arguments: List, positions: int) -> float:
+    start = time.perf_counter()
+    for index in range(positions):
+        function(*arguments[index % len(arguments)])
+    return time.perf_counter() - start
+
+
+def _report(name: str, legacy: float, current: float, positions: int) -> None:
+    speedup = legacy / current
+    print(f'    {name:<16} {positions / legacy:>12,.0f}/sec -> {positions / current:>12,.0f}/sec ({speedup:.2f}x)')
+
+
+def bench_custom_fen(corpus: List[Tuple[str, str]], positions: int) -> None:
+    board_fens = [fen.split(' ')[0] for fen, _ in corpus]
+    boards = [TeamChessBoard(fen, current_turn_player_symbol=symbol) for fen, symbol in corpus]
+    for board, board_fen in zip(boards, board_fens):
+        assert _legacy_board_fen(board) == board_fen
+
+    parsed = TeamChessBoard(None)
+    print(f'custom fen over {positions:,} positions ({len(corpus)} distinct):')
+    _report(
+        'parse',
+        _timed(_legacy_set_board_fen, [(parsed, fen) for fen in board_fens], positions),
+        _timed(parsed._set_board_fen, [(fen,) for fen in board_fens], positions),
+        positions
+    )
+    _report(
+        'serialize',
+        _timed(_legacy_board_fen, [(board,) for board in boards], positions),
+        _timed(TeamChessBoard._build_board_fen, [(board, False) for board in boards], positions),
+        positions
+    )
+    _report(
+        'serialize cached',
+        _timed(_legacy_board_fen, [(board,) for board in boards], positions),
+        _timed(TeamChessBoard.board_fen, [(board,) for board in boards], positions),
+        positions
+    )
+
+
+def bench_search(corpus: List[Tuple[str, str]], time_limit: float, target: int) -> bool:
+    """
+    Runs a timed search on every position with a fresh searcher and reports the aggregated nodes per second against
+    the target, returns whether the target was met.
+    """
+    nodes = 0
+    elapsed = 0.0
+    depths = []
+    for fen, symbol in corpus:
+        result = Searcher().search(TeamChessBoard(fen, current_turn_player_symbol=symbol), time_limit=time_limit)
+        nodes += result.nodes
+        elapsed += result.elapsed
+        depths.append(result.depth)
+
+    nodes_per_second = nodes / elapsed
+    met = nodes_per_second >= target
+    print(f'search over {len(corpus)} positions, {time_limit}s each:')
+    print(f'    {nodes_per_second:>12,.0f} nodes/sec, average depth {sum(depths) / len(depths):.1f}')
+    print(f'    target {target:,} nodes/sec: {"met" if met else "NOT MET"}')
+    return met
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--nps-target', type=int, default=NODES_PER_SECOND_TARGET)
+    parser.add_argument('--search-time', type=float, default=0.25)
+    parser.add_argument('--fen-positions', type=int, default=100000)
+    args = parser.parse_args()
+
+    corpus = build_mid_game_corpus()
+    bench_legal_move_generation(corpus)
+    bench_custom_fen(corpus, args.fen_positions)
+    if not bench_search(corpus[:20], args.search_time, args.nps_target):
+        raise SystemExit(1)
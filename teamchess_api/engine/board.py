@@ -1,11 +1,18 @@
 import random
 import chess
-from typing import List, Dict, Optional, Iterator
+from typing import Iterable, List, Mapping, Optional, Iterator, Sequence, Tuple, Union
 
-from chess import Square, PieceType, Move, Bitboard, BB_ALL
+from chess import Square, PieceType, Move, Bitboard, BB_ALL, BB_EMPTY, BB_SQUARES
 
 from .constants import *
-from .definitions import Player, PlayerSquareValue
+from .definitions import Player, PlayerState
+from . import zobrist
+
+# What the previous character of a custom FEN was, while parsing it.
+_FEN_PIECE = 1
+_FEN_PROMOTED = 2
+_FEN_SYMBOL = 3
+_FEN_DIGIT = 4
 
 
 class TeamChessBoard(chess.Board):
@@ -14,7 +21,10 @@ class TeamChessBoard(chess.Board):
     player_of_diamonds: Player
     player_of_clubs: Player
 
-    player_squares: Dict[chess.Square, PlayerSquareValue] = {}
+    players: List[Player]
+    _player_stack: List[PlayerState]
+    _zobrist_key: Optional[int]
+    _board_fen_cache: Optional[Tuple[bool, str]]
 
     current_turn_player: Player
 
@@ -27,22 +37,63 @@ class TeamChessBoard(chess.Board):
         player symbol, piece name and color.
         """
         pieces = []
-        for square, player_square_value in self.player_squares.items():
-            square_name = chess.square_name(square)
-            piece_name = chess.piece_name(player_square_value['piece'].piece_type)
-            player_symbol = player_square_value['player'].symbol
-            color = player_square_value['piece'].color
-            pieces.append(dict(square=square_name, player=player_symbol, piece=piece_name, color=color))
+        for player in self.players:
+            for square in chess.scan_forward(player.squares):
+                piece = self.piece_at(square)
+                square_name = chess.square_name(square)
+                piece_name = chess.piece_name(piece.piece_type)
+                pieces.append(dict(square=square_name, player=player.symbol, piece=piece_name, color=piece.color))
         return pieces
 
     def get_original_fen(self):
         """
-        A simple get method that will return the original fen of the board without player symbols.
+        A simple get method that will return the original fen of the board without player symbols, stripped from the
+        custom FEN in a single pass.
+        """
+        return self.fen().translate(FEN_WITHOUT_PLAYER_SYMBOLS)
+
+    @classmethod
+    def from_game_fen(cls, custom_fen: str) -> 'TeamChessBoard':
+        """
+        Restores the board of a game from its custom FEN. Every game starts from the standard starting position with
+        the player of spades, and every ply rotates the turn player, so the turn player follows from the ply.
+        """
+        board = cls(custom_fen)
+        board._set_current_turn_player(PLAYER_SYMBOLS[board.ply() % len(PLAYER_SYMBOLS)])
+        return board
+
+    @classmethod
+    def from_move_log(
+        cls,
+        moves: Sequence[Move],
+        keyframes: Mapping[int, bytes],
+        ply: Optional[int] = None
+    ) -> 'TeamChessBoard':
+        """
+        Rebuilds a game from its move log, where moves[i] is the move of ply i + 1, up to the given ply (the whole log
+        by default). Keyframes map a ply to the position after it, encoded by engine.encoding, and must include the
+        starting position at ply 0 since the pieces are randomly allocated to the players. The game is replayed from
+        the latest keyframe at or before the ply, so the move stack of the returned board only holds the moves after it.
         """
-        fen = self.fen()
-        for player_symbol in PLAYER_SYMBOLS:
-            fen = fen.replace(player_symbol, '')
-        return fen
+        # engine.encoding depends on this module
+        from .encoding import decode_board
+
+        ply = len(moves) if ply is None else ply
+        if not 0 <= ply <= len(moves):
+            raise ValueError(f'ply {ply} is out of the move log of {len(moves)} moves')
+        if 0 not in keyframes:
+            raise ValueError('keyframes must include the starting position at ply 0')
+
+        keyframe_ply = max(keyframe for keyframe in keyframes if keyframe <= ply)
+        return decode_board(keyframes[keyframe_ply]).replay(moves[keyframe_ply:ply])
+
+    def replay(self, moves: Iterable[Move]) -> 'TeamChessBoard':
+        """
+        Pushes moves of a trusted move log, skipping the legality checks, and returns the board.
+        """
+        for move in moves:
+            self.push(move)
+        return self
 
     def _set_players(self):
         """
@@ -53,6 +104,8 @@ class TeamChessBoard(chess.Board):
         self.player_of_diamonds = Player(DIAMOND)
         self.player_of_clubs = Player(CLUB)
 
+        self.players = [self.player_of_spades, self.player_of_hearts, self.player_of_diamonds, self.player_of_clubs]
+
         self.white_team_players = [self.player_of_spades, self.player_of_diamonds]
         self.black_team_players = [self.player_of_hearts, self.player_of_clubs]
 
@@ -74,6 +127,7 @@ class TeamChessBoard(chess.Board):
         self.current_turn_player = self.player_of_spades
         if symbol is not None:
             self.current_turn_player = self._find_player_node_by_symbol(self.current_turn_player, symbol)
+        self._clear_position_caches()
 
     @classmethod
     def _find_player_node_by_symbol(cls, player: Player, symbol: str) -> Player:
@@ -110,16 +164,7 @@ class TeamChessBoard(chess.Board):
         Each player will receive half of the pawns and half of the pieces, in a normal chess game that adds up to
         8 pieces per player, that they will be randomly assigned.
 
-        Once assignment is done, iterates over squares and populates the player_squares dictionary, with the following
-        structure:
-            ```
-                {
-                    square(int): {
-                        'player': Player instance
-                        'piece': chess.Piece instance
-                    }
-                }
-            ```
+        Once assignment is done, sets the bit of every assigned square on the bitboard of the player that owns it.
         """
         player1_pawns = random.sample(pawns, k=int(len(pawns) / 2))
         player1_pieces = random.sample(pieces, k=int(len(pieces) / 2))
@@ -128,18 +173,26 @@ class TeamChessBoard(chess.Board):
         player2_pieces = list(set(pieces).difference(player1_pieces))
 
         for player1_square, player2_square in zip(player1_pawns + player1_pieces, player2_pawns+ player2_pieces):
-            self.player_squares.update(
-                {
-                    player1_square: PlayerSquareValue(
-                        player=player1,
-                        piece=self.piece_at(player1_square)
-                    ),
-                    player2_square: PlayerSquareValue(
-                        player=player2,
-                        piece=self.piece_at(player2_square)
-                    )
-                }
-            )
+            player1.squares |= BB_SQUARES[player1_square]
+            player2.squares |= BB_SQUARES[player2_square]
+        self._clear_position_caches()
+
+    def _clear_position_caches(self) -> None:
+        """
+        Invalidates the zobrist key and the cached custom FEN, whenever the position changes other than by push/pop.
+        """
+        self._zobrist_key = None
+        self._board_fen_cache = None
+
+    def _player_at(self, square: Square) -> Optional[Player]:
+        """
+        Returns the player node that owns the piece on the passed square, or None if the square is not owned.
+        """
+        mask = BB_SQUARES[square]
+        for player in self.players:
+            if player.squares & mask:
+                return player
+        return None
 
     def get_player_by_symbol(self, symbol: str) -> Player:
         """
@@ -161,112 +214,131 @@ class TeamChessBoard(chess.Board):
         (e.g.,
         ``r♥n♣b♥q♥k♣b♣n♣r♥/p♥p♣p♣p♥p♥p♥p♣p♣/8/8/8/8/P♠P♦P♦P♦P♠P♦P♠P♠/R♦N♠B♠Q♦K♦B♠N♦R♠``
         ).
-        """
-        builder = []
-        empty = 0
-
-        for square in chess.SQUARES_180:
-            piece = self.piece_at(square)
-
-            if not piece:
-                empty += 1
-            else:
-                if empty:
-                    builder.append(str(empty))
-                    empty = 0
-                builder.append(piece.symbol())
-                if promoted and chess.BB_SQUARES[square] & self.promoted:
-                    builder.append("~")
-
-                # Check which player this piece belongs to, and add their symbol to the builder string
-                builder.append(self.player_squares[square]['player'].symbol)
-
-            if chess.BB_SQUARES[square] & chess.BB_FILE_H:
-                if empty:
-                    builder.append(str(empty))
-                    empty = 0
-
-                if square != chess.H1:
-                    builder.append("/")
-
-        return "".join(builder)
+        The last produced custom FEN is cached until the board changes.
+        """
+        promoted = bool(promoted)
+        if self._board_fen_cache is None or self._board_fen_cache[0] != promoted:
+            self._board_fen_cache = (promoted, self._build_board_fen(promoted))
+        return self._board_fen_cache[1]
+
+    def _build_board_fen(self, promoted: bool) -> str:
+        """
+        Builds the custom FEN in a single pass over the squares, the cell of each occupied square (piece symbol,
+        promotion marker and player symbol) is filled from the piece and player bitboards beforehand.
+        """
+        cells: List[Optional[str]] = [None] * 64
+        bitboards = (self.pawns, self.knights, self.bishops, self.rooks, self.queens, self.kings)
+        for color in chess.COLORS:
+            occupied = self.occupied_co[color]
+            for bitboard, piece_symbol in zip(bitboards, FEN_PIECE_SYMBOLS[color]):
+                for square in chess.scan_forward(bitboard & occupied):
+                    cells[square] = piece_symbol
+        if promoted:
+            for square in chess.scan_forward(self.promoted & self.occupied):
+                cells[square] += "~"
+        for player in self.players:
+            for square in chess.scan_forward(player.squares):
+                cells[square] += player.symbol
+
+        rows = []
+        for rank_start in range(56, -1, -8):
+            builder = []
+            empty = 0
+            for cell in cells[rank_start:rank_start + 8]:
+                if cell is None:
+                    empty += 1
+                else:
+                    if empty:
+                        builder.append(FEN_EMPTY_SQUARES[empty])
+                        empty = 0
+                    builder.append(cell)
+            if empty:
+                builder.append(FEN_EMPTY_SQUARES[empty])
+            rows.append("".join(builder))
+        return "/".join(rows)
 
     def _set_board_fen(self, fen: str) -> None:
+        """
+        Parses and validates the custom FEN in a single pass, collecting the piece, color, promotion and player
+        bitboards, the board is only changed once the whole FEN is valid.
+        """
         # Compatibility with set_fen().
         fen = fen.strip()
         if " " in fen:
             raise ValueError(f"expected position part of fen, got multiple parts: {fen!r}")
 
-        # Ensure the FEN is valid.
-        rows = fen.split("/")
-        if len(rows) != 8:
-            raise ValueError(f"expected 8 rows in position part of fen: {fen!r}")
-
-        # Validate each row.
-        for row in rows:
-            field_sum = 0
-            previous_was_digit = False
-            previous_was_piece = False
-            previous_was_symbol = False
-
-            for c in row:
-                if c in ["1", "2", "3", "4", "5", "6", "7", "8"]:
-                    if previous_was_digit:
-                        raise ValueError(f"two subsequent digits in position part of fen: {fen!r}")
-                    field_sum += int(c)
-                    previous_was_digit = True
-                    previous_was_piece = False
-                    previous_was_symbol = False
-                elif c == "~":
-                    if not previous_was_piece:
-                        raise ValueError(f"'~' not after piece in position part of fen: {fen!r}")
-                    previous_was_digit = False
-                    previous_was_piece = False
-                    previous_was_symbol = False
-                elif c.lower() in chess.PIECE_SYMBOLS:
-                    field_sum += 1
-                    previous_was_digit = False
-                    previous_was_piece = True
-                    previous_was_symbol = False
-                elif c in PLAYER_SYMBOLS:
-                    # validating player symbols inside fen
-                    if previous_was_symbol:
-                        raise ValueError(f"two subsequent player symbols in position part of fen: {fen!r}")
-                    if not previous_was_piece:
-                        raise ValueError(f"expected a piece before player symbol in position part of fen: {fen!r}")
-                    previous_was_symbol = True
+        pieces = [BB_EMPTY] * 7
+        occupied_co = [BB_EMPTY, BB_EMPTY]
+        owned = {symbol: BB_EMPTY for symbol in PLAYER_SYMBOLS}
+        promoted = BB_EMPTY
 
-                else:
-                    raise ValueError(f"invalid character in position part of fen: {fen!r}")
-
-            if field_sum != 8:
-                raise ValueError(f"expected 8 columns per row in position part of fen: {fen!r}")
+        rank_start = 56
+        file = 0
+        mask = BB_EMPTY
+        previous = None
+        for c in fen:
+            if c in FEN_PIECES:
+                if file >= 8:
+                    raise ValueError(f"expected 8 columns per row in position part of fen: {fen!r}")
+                piece_type, color = FEN_PIECES[c]
+                mask = BB_SQUARES[rank_start + file]
+                pieces[piece_type] |= mask
+                occupied_co[color] |= mask
+                file += 1
+                previous = _FEN_PIECE
+            elif c in owned:
+                # validating player symbols inside fen, they follow a piece or its promotion marker
+                if previous == _FEN_SYMBOL:
+                    raise ValueError(f"two subsequent player symbols in position part of fen: {fen!r}")
+                if previous != _FEN_PIECE and previous != _FEN_PROMOTED:
+                    raise ValueError(f"expected a piece before player symbol in position part of fen: {fen!r}")
+                owned[c] |= mask
+                previous = _FEN_SYMBOL
+            elif c in FEN_DIGITS:
+                if previous == _FEN_DIGIT:
+                    raise ValueError(f"two subsequent digits in position part of fen: {fen!r}")
+                file += FEN_DIGITS[c]
+                if file > 8:
+                    raise ValueError(f"expected 8 columns per row in position part of fen: {fen!r}")
+                previous = _FEN_DIGIT
+            elif c == "/":
+                if file != 8:
+                    raise ValueError(f"expected 8 columns per row in position part of fen: {fen!r}")
+                if not rank_start:
+                    raise ValueError(f"expected 8 rows in position part of fen: {fen!r}")
+                rank_start -= 8
+                file = 0
+                previous = None
+            elif c == "~":
+                if previous != _FEN_PIECE:
+                    raise ValueError(f"'~' not after piece in position part of fen: {fen!r}")
+                promoted |= mask
+                previous = _FEN_PROMOTED
+            else:
+                raise ValueError(f"invalid character in position part of fen: {fen!r}")
 
-        # Clear the board.
-        self._clear_board()
+        if rank_start:
+            raise ValueError(f"expected 8 rows in position part of fen: {fen!r}")
+        if file != 8:
+            raise ValueError(f"expected 8 columns per row in position part of fen: {fen!r}")
 
         # Put pieces on the board.
-        last_piece: chess.Piece | None = None
-        square_index = 0
-        for c in fen:
-            if c in ["1", "2", "3", "4", "5", "6", "7", "8"]:
-                square_index += int(c)
-            elif c.lower() in chess.PIECE_SYMBOLS:
-                piece = chess.Piece.from_symbol(c)
-                last_piece = piece
-                self._set_piece_at(chess.SQUARES_180[square_index], piece.piece_type, piece.color)
-                square_index += 1
-            elif c in PLAYER_SYMBOLS:
-                # handling player symbols by appending the piece that prefixes them to the player squares
-                # dictionary.
-                self.player_squares.update({
-                    chess.SQUARES_180[square_index-1]: PlayerSquareValue(
-                        player=self.get_player_by_symbol(c),
-                        piece=last_piece
-                    )
-                })
-            elif c == "~":
-                self.promoted |= chess.BB_SQUARES[chess.SQUARES_180[square_index - 1]]
+        _, self.pawns, self.knights, self.bishops, self.rooks, self.queens, self.kings = pieces
+        self.occupied_co[chess.WHITE] = occupied_co[chess.WHITE]
+        self.occupied_co[chess.BLACK] = occupied_co[chess.BLACK]
+        self.occupied = occupied_co[chess.WHITE] | occupied_co[chess.BLACK]
+        self.promoted = promoted
+        for player in self.players:
+            player.squares = owned[player.symbol]
+        self._clear_position_caches()
+
+    def _clear_board(self) -> None:
+        """
+        Clear every player's bitboard along with the board.
+        """
+        super()._clear_board()
+        for player in self.players:
+            player.squares = BB_EMPTY
 
     def _remove_piece_at(self, square: Square) -> Optional[PieceType]:
         """
@@ -274,63 +346,200 @@ class TeamChessBoard(chess.Board):
         """
         piece_type = super()._remove_piece_at(square)
         if piece_type is not None:
-            del self.player_squares[square]
+            mask = ~BB_SQUARES[square]
+            for player in self.players:
+                player.squares &= mask
         return piece_type
 
-    def push_san(self, san: str) -> chess.Move:
+    def _player_state(self) -> PlayerState:
         """
-        Update the player squares by adding the to square to the dictionary with the ownership of the same player.
-        Also rotating the player turn to the player next in line.
+        Returns a snapshot of the player bitboards (in turn order), the zobrist key and the current turn player node.
         """
-        move = super().push_san(san)
-        player = self.player_squares[move.from_square]['player']
-        self.player_squares[move.to_square] = PlayerSquareValue(
-            player=player,
-            piece=self.piece_at(move.to_square)
+        spades, hearts, diamonds, clubs = self.players
+        return (
+            spades.squares, hearts.squares, diamonds.squares, clubs.squares, self._zobrist_key,
+            self.current_turn_player
         )
 
+    def _restore_player_state(self, state: PlayerState) -> None:
+        """
+        Restores a snapshot taken by _player_state.
+        """
+        spades, hearts, diamonds, clubs = self.players
+        (
+            spades.squares, hearts.squares, diamonds.squares, clubs.squares, self._zobrist_key,
+            self.current_turn_player
+        ) = state
+
+    def zobrist_hash(self) -> int:
+        """
+        Returns the team aware 64-bit zobrist key of the position, which covers the owner of every piece, the
+        castling rights, the file of a legal en passant capture and the current turn player.
+        The key is updated incrementally on push and restored on pop, it is only fully computed again after the board
+        is changed by any other means.
+        """
+        if self._zobrist_key is None:
+            self._zobrist_key = self._zobrist_partial_key(self.occupied)
+        return self._zobrist_key
+
+    def _zobrist_partial_key(self, mask: Bitboard) -> int:
+        """
+        Returns the zobrist key of the pieces on the passed mask, combined with the keys of the castling rights, the
+        en passant file and the current turn player.
+        """
+        key = zobrist.TURN_KEYS[self.current_turn_player.symbol]
+        for player in self.players:
+            piece_keys = zobrist.PIECE_KEYS[player.symbol]
+            for square in chess.scan_forward(player.squares & mask):
+                key ^= piece_keys[self.piece_type_at(square)][square]
+        for square in chess.scan_forward(self.clean_castling_rights()):
+            key ^= zobrist.CASTLING_KEYS[square]
+        if self.ep_square is not None and self.has_legal_en_passant():
+            key ^= zobrist.EP_KEYS[chess.square_file(self.ep_square)]
+        return key
+
+    def push(self, move: Move) -> None:
+        """
+        Transfer the ownership of the moved piece to its destination square, when castling the king and the rook
+        keep their respective owners. Also rotating the player turn to the player next in line.
+        A snapshot of the player state is kept, so the ownership, the turn and the zobrist key can be restored on pop.
+
+        Every other move path (push_san, push_uci, push_xboard) ends up here.
+        """
+        key = self.zobrist_hash()
+        self._player_stack.append(self._player_state())
+        self._board_fen_cache = None
+
+        player = rook_player = None
+        castling = False
+        changed = BB_EMPTY
+        if move:
+            move = self._to_chess960(move)
+            from_bb = BB_SQUARES[move.from_square]
+            to_bb = BB_SQUARES[move.to_square]
+            player = self._player_at(move.from_square)
+            castling = self.kings & from_bb and self.occupied_co[self.turn] & to_bb
+            changed = from_bb | to_bb
+            if castling:
+                rook_player = self._player_at(move.to_square)
+                changed |= chess.BB_RANK_1 if self.turn == chess.WHITE else chess.BB_RANK_8
+            elif move.to_square == self.ep_square and self.pawns & from_bb:
+                changed |= BB_SQUARES[self.ep_square + (-8 if self.turn == chess.WHITE else 8)]
+
+        # only the pieces on the changed squares need to be hashed out and back in
+        key ^= self._zobrist_partial_key(changed)
         self.current_turn_player = self.current_turn_player.next_player
 
+        super().push(move)
+
+        if castling:
+            backrank = 0 if self.turn == chess.BLACK else 7
+            a_side = chess.square_file(move.to_square) < chess.square_file(move.from_square)
+            player.squares |= BB_SQUARES[chess.square(2 if a_side else 6, backrank)]
+            rook_player.squares |= BB_SQUARES[chess.square(3 if a_side else 5, backrank)]
+        elif player is not None:
+            player.squares |= to_bb
+
+        self._zobrist_key = key ^ self._zobrist_partial_key(changed)
+
+    def pop(self) -> Move:
+        """
+        Restore the player bitboards, the zobrist key and the current turn player from before the last move.
+        """
+        move = super().pop()
+        self._restore_player_state(self._player_stack.pop())
+        self._board_fen_cache = None
         return move
 
-    def _check_move_against_current_player(self, move: chess.Move) -> bool:
-        return self.player_squares[move.from_square]['player'] == self.current_turn_player
+    def clear_stack(self) -> None:
+        """
+        Every change to the board other than push and pop clears the stack, so the position caches are invalidated as
+        well.
+        """
+        super().clear_stack()
+        self._player_stack.clear()
+        self._clear_position_caches()
+
+    def is_repetition(self, count: int = 3) -> bool:
+        """
+        Overriding the repetition check, comparing zobrist keys of the positions since the last irreversible move, so
+        positions only repeat when the owners of the pieces and the turn player repeat as well.
+        """
+        key = self.zobrist_hash()
+        repetitions = 1
+        for state in reversed(self._player_stack[max(len(self._player_stack) - self.halfmove_clock, 0):]):
+            if state[4] == key:
+                repetitions += 1
+                if repetitions >= count:
+                    return True
+        return repetitions >= count
+
+    def root(self) -> 'TeamChessBoard':
+        """
+        Returns a copy of the root position, including the ownership and the turn player of that position.
+        """
+        if not self._player_stack:
+            return self.copy(stack=False)
+
+        board = super().root()
+        board._restore_player_state(self._translate_player_state(self._player_stack[0], board))
+        return board
+
+    def copy(self, *, stack: Union[bool, int] = True) -> 'TeamChessBoard':
+        """
+        Creates a copy of the board, with its own player nodes carrying the same ownership and turn player.
+        """
+        board = super().copy(stack=stack)
+        board._restore_player_state(self._translate_player_state(self._player_state(), board))
+
+        if stack:
+            stack = len(self.move_stack) if stack is True else stack
+            board._player_stack = [
+                self._translate_player_state(state, board) for state in self._player_stack[-stack:]
+            ]
+        return board
+
+    def _translate_player_state(self, state: PlayerState, board: 'TeamChessBoard') -> PlayerState:
+        """
+        Swaps the turn player node of a snapshot of this board with the matching player node of the passed board.
+        """
+        *values, current_turn_player = state
+        return (*values, board.players[self.players.index(current_turn_player)])
+
+    def is_pseudo_legal(self, move: Move) -> bool:
+        """
+        Overriding the pseudo legality check, in order to reject moves of pieces that do not belong to the current
+        turn player, so is_legal, parse_uci and push_uci validate ownership as well.
+        """
+        return bool(self.current_turn_player.squares & BB_SQUARES[move.from_square]) and super().is_pseudo_legal(move)
 
     def generate_legal_moves(self, from_mask: Bitboard = BB_ALL, to_mask: Bitboard = BB_ALL) -> Iterator[Move]:
         """
-        Overriding the generation of legal moves, in order to filter out moves of pieces that
-        do not belong to the current turn player.
+        Overriding the generation of legal moves, narrowing the from mask to the squares owned by the current turn
+        player, so moves of pieces that do not belong to them are never generated.
         """
-        for move in super().generate_legal_moves(from_mask, to_mask):
-            if self._check_move_against_current_player(move):
-                yield move
+        return super().generate_legal_moves(from_mask & self.current_turn_player.squares, to_mask)
 
     def generate_legal_ep(self, from_mask: Bitboard = BB_ALL, to_mask: Bitboard = BB_ALL) -> Iterator[Move]:
         """
-        Overriding the generation of legal ep moves, in order to filter out moves of pieces that
-        do not belong to the current turn player.
+        Overriding the generation of legal ep moves, narrowing the from mask to the squares owned by the current turn
+        player.
         """
-        for move in super().generate_legal_ep(from_mask, to_mask):
-            if self._check_move_against_current_player(move):
-                yield move
+        return super().generate_legal_ep(from_mask & self.current_turn_player.squares, to_mask)
 
     def generate_castling_moves(self, from_mask: Bitboard = BB_ALL, to_mask: Bitboard = BB_ALL) -> Iterator[Move]:
         """
-        Overriding the generation of legal castling moves, in order to filter out moves of pieces that
-        do not belong to the current turn player.
+        Overriding the generation of legal castling moves, narrowing the from mask to the squares owned by the
+        current turn player, castling is only generated when they own the king.
         """
-        for move in super().generate_castling_moves(from_mask, to_mask):
-            if self._check_move_against_current_player(move):
-                yield move
+        return super().generate_castling_moves(from_mask & self.current_turn_player.squares, to_mask)
 
     def generate_legal_captures(self, from_mask: Bitboard = BB_ALL, to_mask: Bitboard = BB_ALL) -> Iterator[Move]:
         """
-        Overriding the generation of legal captures, in order to filter out moves of pieces that
-        do not belong to the current turn player.
+        Overriding the generation of legal captures, narrowing the from mask to the squares owned by the current turn
+        player.
         """
-        for move in super().generate_legal_captures(from_mask, to_mask):
-            if self._check_move_against_current_player(move):
-                yield move
+        return super().generate_legal_captures(from_mask & self.current_turn_player.squares, to_mask)
 
     def __init__(
         self,
@@ -342,6 +551,7 @@ class TeamChessBoard(chess.Board):
         self._set_players()
         self._set_player_turns()
         self._set_current_turn_player(current_turn_player_symbol)
+        self._player_stack = []
         super().__init__(fen, chess960=chess960)
 
         if fen == chess.STARTING_FEN:
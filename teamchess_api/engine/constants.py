@@ -11,3 +11,19 @@ SYMBOL_COLOR_MAPPING = {
     DIAMOND: 'white',
     CLUB: 'black',
 }
+
+# Transposition table entry bounds
+EXACT = 0
+LOWER_BOUND = 1
+UPPER_BOUND = 2
+
+# Custom FEN parsing and serializing lookups
+FEN_PIECES = {
+    symbol: (piece_type, symbol.isupper())
+    for piece_type, symbol in enumerate('pnbrqk', start=1)
+    for symbol in (symbol, symbol.upper())
+}
+FEN_PIECE_SYMBOLS = ['pnbrqk', 'PNBRQK']  # indexed by color, in piece type order
+FEN_DIGITS = {str(empty): empty for empty in range(1, 9)}
+FEN_EMPTY_SQUARES = [None] + [str(empty) for empty in range(1, 9)]
+FEN_WITHOUT_PLAYER_SYMBOLS = str.maketrans('', '', ''.join(PLAYER_SYMBOLS))  # str.translate table
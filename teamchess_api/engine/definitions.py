@@ -1,6 +1,6 @@
 import dataclasses
-from chess import Piece
-from typing import TypedDict
+from chess import Bitboard, BB_EMPTY, Move
+from typing import Optional, Tuple
 
 
 @dataclasses.dataclass
@@ -9,14 +9,31 @@ class Player:
     A Player node class that will act like a node that can be used for certain data structures such as linked lists.
     In this case it will be used inside a Circular Linked List structure which will be used to iterate over player
     turns.
+
+    Each node also holds the bitboard of the squares occupied by the pieces this player owns.
     """
     symbol: str
     next_player: 'Player' = None
+    squares: Bitboard = dataclasses.field(default=BB_EMPTY, compare=False)
 
     def __repr__(self):
         return self.symbol
 
 
-class PlayerSquareValue(TypedDict):
-    player: Player
-    piece: Piece
+# Snapshot of the player bitboards in turn order (spades, hearts, diamonds, clubs), followed by the zobrist key and the
+# current turn player.
+PlayerState = Tuple[Bitboard, Bitboard, Bitboard, Bitboard, Optional[int], Player]
+
+
+@dataclasses.dataclass(slots=True)
+class TranspositionEntry:
+    """
+    A transposition table entry, holding the score of a searched position along with the depth it was searched to,
+    whether the score is exact or a bound, and the best move found.
+    """
+    key: int
+    depth: int
+    score: int
+    bound: int
+    move: Optional[Move] = None
+    generation: int = 0
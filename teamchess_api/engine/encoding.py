@@ -0,0 +1,122 @@
+"""
+Compact fixed-size binary encoding of TeamChessBoard positions, used for snapshots, move logs and websocket deltas.
+
+Layout (little endian, 37 bytes):
+    occupied    8 bytes   occupancy bitboard
+    pieces     16 bytes   one nibble per occupied square in ascending square order: piece type (3 bits) and whether
+                          it is promoted (1 bit), the color is implied by the owner
+    owners      8 bytes   two bits per occupied square in the same order: index of the owning player in turn order
+    castling    1 byte    low nibble: castling rights of a1, h1, a8, h8; high nibble: en passant file + 1 (0 is none)
+    turn        1 byte    bits 0-1: index of the current turn player, bit 2: side to move is white
+    halfmove    1 byte    halfmove clock, saturated at 255
+    fullmove    2 bytes   fullmove number
+
+Moves are packed into 16 bits: from square (6 bits), to square (6 bits) and promotion piece type (3 bits, 0 is none).
+"""
+import struct
+
+import chess
+from chess import BB_EMPTY, BB_SQUARES, Move
+
+from .board import TeamChessBoard
+from .constants import PLAYER_SYMBOLS, SYMBOL_COLOR_MAPPING
+
+POSITION_STRUCT = struct.Struct('<Q16sQBBBH')
+POSITION_SIZE = POSITION_STRUCT.size
+
+CASTLING_SQUARES = [chess.A1, chess.H1, chess.A8, chess.H8]
+OWNER_COLORS = [SYMBOL_COLOR_MAPPING[symbol] == 'white' for symbol in PLAYER_SYMBOLS]
+
+
+def encode_board(board: TeamChessBoard) -> bytes:
+    """
+    Encodes the position of the board, every piece must be owned by a player.
+    """
+    owner_at = [None] * 64
+    for index, player in enumerate(board.players):
+        for square in chess.scan_forward(player.squares):
+            owner_at[square] = index
+
+    pieces = 0
+    owners = 0
+    for index, square in enumerate(chess.scan_forward(board.occupied)):
+        owner = owner_at[square]
+        if owner is None:
+            raise ValueError(f'piece on {chess.square_name(square)} is not owned by any player')
+        piece_type = board.piece_type_at(square)
+        promoted = 8 if board.promoted & BB_SQUARES[square] else 0
+        pieces |= (piece_type | promoted) << (4 * index)
+        owners |= owner << (2 * index)
+
+    castling_rights = board.clean_castling_rights()
+    castling = 0
+    for bit, square in enumerate(CASTLING_SQUARES):
+        if castling_rights & BB_SQUARES[square]:
+            castling |= 1 << bit
+    if board.ep_square is not None:
+        castling |= (chess.square_file(board.ep_square) + 1) << 4
+
+    turn = board.players.index(board.current_turn_player) | (4 if board.turn == chess.WHITE else 0)
+
+    return POSITION_STRUCT.pack(
+        board.occupied, pieces.to_bytes(16, 'little'), owners, castling, turn, min(board.halfmove_clock, 255),
+        board.fullmove_number
+    )
+
+
+def decode_board(data: bytes) -> TeamChessBoard:
+    """
+    Decodes a position encoded by encode_board into a new board with an empty move stack.
+    """
+    if len(data) != POSITION_SIZE:
+        raise ValueError(f'expected {POSITION_SIZE} bytes of encoded position, got {len(data)}')
+    occupied, pieces, owners, castling, turn, halfmove_clock, fullmove_number = POSITION_STRUCT.unpack(data)
+    pieces = int.from_bytes(pieces, 'little')
+
+    board = TeamChessBoard(None)
+    piece_bitboards = [BB_EMPTY] * 7
+    occupied_co = [BB_EMPTY, BB_EMPTY]
+    owned = [BB_EMPTY] * 4
+    promoted = BB_EMPTY
+    for index, square in enumerate(chess.scan_forward(occupied)):
+        mask = BB_SQUARES[square]
+        nibble = (pieces >> (4 * index)) & 15
+        owner = (owners >> (2 * index)) & 3
+        piece_type = nibble & 7
+        if not chess.PAWN <= piece_type <= chess.KING:
+            raise ValueError(f'invalid piece type {piece_type} in encoded position')
+        piece_bitboards[piece_type] |= mask
+        occupied_co[OWNER_COLORS[owner]] |= mask
+        owned[owner] |= mask
+        if nibble & 8:
+            promoted |= mask
+
+    _, board.pawns, board.knights, board.bishops, board.rooks, board.queens, board.kings = piece_bitboards
+    board.occupied_co[chess.WHITE] = occupied_co[chess.WHITE]
+    board.occupied_co[chess.BLACK] = occupied_co[chess.BLACK]
+    board.occupied = occupied
+    board.promoted = promoted
+    for player, squares in zip(board.players, owned):
+        player.squares = squares
+
+    board.castling_rights = BB_EMPTY
+    for bit, square in enumerate(CASTLING_SQUARES):
+        if castling & (1 << bit):
+            board.castling_rights |= BB_SQUARES[square]
+    ep_file = castling >> 4
+    if ep_file:
+        board.ep_square = chess.square(ep_file - 1, 5 if turn & 4 else 2)
+
+    board.turn = bool(turn & 4)
+    board.halfmove_clock = halfmove_clock
+    board.fullmove_number = fullmove_number
+    board._set_current_turn_player(board.players[turn & 3].symbol)
+    return board
+
+
+def encode_move(move: Move) -> int:
+    return move.from_square | move.to_square << 6 | (move.promotion or 0) << 12
+
+
+def decode_move(packed: int) -> Move:
+    return Move(packed & 63, (packed >> 6) & 63, (packed >> 12) or None)
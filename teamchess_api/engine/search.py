@@ -0,0 +1,268 @@
+"""
+A pure python alpha-beta searcher for team chess, used to fill empty seats and to give hints.
+
+Teams still alternate every ply (spades and diamonds play white, hearts and clubs play black), so the search is a
+plain negamax over colors. TeamChessBoard takes care of the team rules: only the pieces of the current turn player
+are generated, and every push rotates the turn player spade -> heart -> diamond -> club.
+"""
+import dataclasses
+import time
+from typing import List, Optional, Tuple
+
+import chess
+from chess import Move
+
+from .board import TeamChessBoard
+from .constants import EXACT, LOWER_BOUND, UPPER_BOUND
+from .transposition import TranspositionTable
+
+# Nodes per second a single search is expected to reach on one core, checked by engine.benchmarks.
+NODES_PER_SECOND_TARGET = 20000
+
+PIECE_VALUES = [0, 100, 320, 330, 500, 900, 0]
+
+MATE_SCORE = 100000
+MATE_THRESHOLD = MATE_SCORE - 1000
+INFINITY = MATE_SCORE + 1
+
+CENTER = chess.BB_D4 | chess.BB_E4 | chess.BB_D5 | chess.BB_E5
+EXTENDED_CENTER = 0x00003C3C3C3C0000
+ADVANCED_PAWN_RANKS = [
+    chess.BB_RANK_8 | chess.BB_RANK_7 | chess.BB_RANK_6 | chess.BB_RANK_5,  # black pawns
+    chess.BB_RANK_4 | chess.BB_RANK_5 | chess.BB_RANK_6 | chess.BB_RANK_7,  # white pawns
+]
+
+
+def evaluate(board: chess.Board) -> int:
+    """
+    Returns a static evaluation of the position in centipawns, from the point of view of the team to move.
+    Counts material, pawns advanced past the middle of the board, and pawns and minor pieces on the center squares.
+    """
+    score = 0
+    for color in chess.COLORS:
+        occupied = board.occupied_co[color]
+        pawns = board.pawns & occupied
+        minors = (board.knights | board.bishops) & occupied
+        value = (
+            PIECE_VALUES[chess.PAWN] * chess.popcount(pawns)
+            + PIECE_VALUES[chess.KNIGHT] * chess.popcount(board.knights & occupied)
+            + PIECE_VALUES[chess.BISHOP] * chess.popcount(board.bishops & occupied)
+            + PIECE_VALUES[chess.ROOK] * chess.popcount(board.rooks & occupied)
+            + PIECE_VALUES[chess.QUEEN] * chess.popcount(board.queens & occupied)
+            + 10 * chess.popcount(pawns & ADVANCED_PAWN_RANKS[color])
+            + 15 * chess.popcount(pawns & CENTER)
+            + 10 * chess.popcount(minors & EXTENDED_CENTER)
+        )
+        score += value if color == board.turn else -value
+    return score
+
+
+class SearchTimeout(Exception):
+    """
+    Raised inside the search once the time budget of the call is spent.
+    """
+
+
+@dataclasses.dataclass
+class SearchResult:
+    """
+    The outcome of a search call, the move is None only when the turn player has no legal moves.
+    """
+    move: Optional[Move]
+    score: int
+    depth: int
+    nodes: int
+    elapsed: float
+
+    @property
+    def nodes_per_second(self) -> float:
+        return self.nodes / self.elapsed if self.elapsed else 0.0
+
+
+class Searcher:
+    """
+    Iterative deepening negamax with alpha-beta pruning, a transposition table, quiescence search on captures and
+    move ordering (transposition table move, MVV-LVA captures, promotions, killer moves).
+
+    The same searcher can be reused between calls so its transposition table stays warm, it is not thread safe.
+    """
+    check_interval = 1024
+
+    def __init__(self, table: Optional[TranspositionTable] = None):
+        self.table = table if table is not None else TranspositionTable()
+        self.nodes = 0
+        self._deadline = float('inf')
+        self._killers: List[List[Optional[Move]]] = []
+        self._root_best: Optional[Tuple[Move, int]] = None
+
+    def search(self, board: TeamChessBoard, time_limit: float = 1.0, max_depth: int = 32) -> SearchResult:
+        """
+        Searches the position for at most time_limit seconds (the first depth is always completed) and returns the
+        best move of the deepest completed iteration.
+        The passed board is never modified, the search runs on a copy of it.
+        """
+        start = time.perf_counter()
+        board = board.copy()
+        self.table.new_search()
+        self.nodes = 0
+        self._killers = [[None, None] for _ in range(max_depth + 1)]
+
+        moves = list(board.generate_legal_moves())
+        if not moves:
+            return SearchResult(None, self._terminal_score(board, 0), 0, 0, time.perf_counter() - start)
+
+        best_move, best_score, completed_depth = moves[0], 0, 0
+        for depth in range(1, max_depth + 1):
+            self._deadline = start + time_limit if depth > 1 else float('inf')
+            self._root_best = None
+            try:
+                best_score = self._negamax(board, depth, -INFINITY, INFINITY, 0)
+            except SearchTimeout:
+                # the moves searched so far at this depth are ordered after the previous best move, so a better one
+                # found before the timeout can still be used.
+                if self._root_best is not None and self._root_best[1] > best_score:
+                    best_move, best_score = self._root_best
+                break
+
+            best_move = self._root_best[0]
+            completed_depth = depth
+            if abs(best_score) >= MATE_THRESHOLD or time.perf_counter() >= start + time_limit:
+                break
+
+        return SearchResult(best_move, best_score, completed_depth, self.nodes, time.perf_counter() - start)
+
+    def _count_node(self) -> None:
+        self.nodes += 1
+        if not self.nodes % self.check_interval and time.perf_counter() >= self._deadline:
+            raise SearchTimeout()
+
+    def _negamax(self, board: TeamChessBoard, depth: int, alpha: int, beta: int, ply: int) -> int:
+        self._count_node()
+        if ply and (board.halfmove_clock >= 100 or board.is_repetition(2)):
+            return 0
+
+        original_alpha = alpha
+        key = board.zobrist_hash()
+        entry = self.table.get(key)
+        table_move = None
+        if entry is not None:
+            table_move = entry.move
+            if ply and entry.depth >= depth:
+                score = self._score_from_table(entry.score, ply)
+                if entry.bound == EXACT:
+                    return score
+                if entry.bound == LOWER_BOUND and score >= beta:
+                    return score
+                if entry.bound == UPPER_BOUND and score <= alpha:
+                    return score
+
+        if depth <= 0:
+            return self._quiescence(board, alpha, beta, ply)
+
+        moves = self._ordered_moves(board, table_move, ply)
+        if not moves:
+            return self._terminal_score(board, ply)
+
+        best_score, best_move = -INFINITY, None
+        for move in moves:
+            board.push(move)
+            score = -self._negamax(board, depth - 1, -beta, -alpha, ply + 1)
+            board.pop()
+
+            if score > best_score:
+                best_score, best_move = score, move
+                if not ply:
+                    self._root_best = (move, score)
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                if not board.is_capture(move):
+                    self._store_killer(move, ply)
+                break
+
+        if best_score <= original_alpha:
+            bound = UPPER_BOUND
+        elif best_score >= beta:
+            bound = LOWER_BOUND
+        else:
+            bound = EXACT
+        self.table.store(key, depth, self._score_to_table(best_score, ply), bound, best_move)
+        return best_score
+
+    def _quiescence(self, board: TeamChessBoard, alpha: int, beta: int, ply: int) -> int:
+        self._count_node()
+        stand_pat = evaluate(board)
+        if stand_pat >= beta:
+            return stand_pat
+        if stand_pat > alpha:
+            alpha = stand_pat
+
+        captures = board.generate_legal_captures()
+        for move in sorted(captures, key=lambda capture: self._capture_order(board, capture), reverse=True):
+            board.push(move)
+            score = -self._quiescence(board, -beta, -alpha, ply + 1)
+            board.pop()
+
+            if score >= beta:
+                return score
+            if score > alpha:
+                alpha = score
+        return alpha
+
+    def _ordered_moves(self, board: TeamChessBoard, table_move: Optional[Move], ply: int) -> List[Move]:
+        killers = self._killers[ply] if ply < len(self._killers) else []
+
+        def priority(move: Move) -> int:
+            if move == table_move:
+                return 3 * MATE_SCORE
+            if board.is_capture(move):
+                return 2 * MATE_SCORE + self._capture_order(board, move)
+            if move.promotion:
+                return MATE_SCORE + PIECE_VALUES[move.promotion]
+            if move in killers:
+                return MATE_SCORE - 1
+            return 0
+
+        return sorted(board.generate_legal_moves(), key=priority, reverse=True)
+
+    @staticmethod
+    def _capture_order(board: TeamChessBoard, move: Move) -> int:
+        """
+        Most valuable victim, least valuable attacker, en passant captures have no piece on the target square.
+        """
+        victim = board.piece_type_at(move.to_square) or chess.PAWN
+        attacker = board.piece_type_at(move.from_square)
+        return 10 * PIECE_VALUES[victim] - PIECE_VALUES[attacker]
+
+    def _store_killer(self, move: Move, ply: int) -> None:
+        if ply < len(self._killers):
+            killers = self._killers[ply]
+            if killers[0] != move:
+                killers[1] = killers[0]
+                killers[0] = move
+
+    @staticmethod
+    def _terminal_score(board: TeamChessBoard, ply: int) -> int:
+        """
+        The turn player has no legal moves: a loss for their team when in check, a draw otherwise.
+        """
+        return -MATE_SCORE + ply if board.is_check() else 0
+
+    @staticmethod
+    def _score_to_table(score: int, ply: int) -> int:
+        """
+        Mate scores are stored relative to the node, so they stay correct when reached through a different path.
+        """
+        if score >= MATE_THRESHOLD:
+            return score + ply
+        if score <= -MATE_THRESHOLD:
+            return score - ply
+        return score
+
+    @staticmethod
+    def _score_from_table(score: int, ply: int) -> int:
+        if score >= MATE_THRESHOLD:
+            return score - ply
+        if score <= -MATE_THRESHOLD:
+            return score + ply
+        return score
@@ -0,0 +1,51 @@
+"""
+CPU bound engine tasks, meant to run inside worker processes (see game.engine_pool).
+
+Every task receives the position as a custom FEN plus the turn player symbol, so only plain strings cross the
+process boundary, and takes an absolute wall clock deadline, tasks that waited in the queue past it are skipped.
+"""
+import time
+from typing import Dict, List, Optional
+
+from .board import TeamChessBoard
+from .search import Searcher, SearchResult
+
+_searcher: Optional[Searcher] = None
+
+
+def _get_searcher() -> Searcher:
+    """
+    One searcher per worker process, so its transposition table stays warm between tasks.
+    """
+    global _searcher
+    if _searcher is None:
+        _searcher = Searcher()
+    return _searcher
+
+
+def _remaining(deadline: float) -> float:
+    remaining = deadline - time.time()
+    if remaining <= 0:
+        raise TimeoutError('engine task deadline exceeded before it started')
+    return remaining
+
+
+def search(custom_fen: str, turn_symbol: str, time_limit: float, deadline: float) -> SearchResult:
+    remaining = _remaining(deadline)
+    board = TeamChessBoard(custom_fen, current_turn_player_symbol=turn_symbol)
+    return _get_searcher().search(board, time_limit=min(time_limit, remaining))
+
+
+def legal_moves(custom_fen: str, turn_symbol: str, deadline: float) -> List[str]:
+    _remaining(deadline)
+    board = TeamChessBoard(custom_fen, current_turn_player_symbol=turn_symbol)
+    return [move.uci() for move in board.generate_legal_moves()]
+
+
+def game_status(custom_fen: str, turn_symbol: str, deadline: float) -> Dict[str, Optional[str]]:
+    _remaining(deadline)
+    board = TeamChessBoard(custom_fen, current_turn_player_symbol=turn_symbol)
+    outcome = board.outcome()
+    if outcome is None:
+        return dict(termination=None, result=None)
+    return dict(termination=outcome.termination.name.lower(), result=outcome.result())
@@ -0,0 +1,268 @@
+import random
+
+import chess
+from django.test import SimpleTestCase
+
+from .board import TeamChessBoard
+from .constants import PLAYER_SYMBOLS, SPADE, HEART, DIAMOND
+from .encoding import encode_board, decode_board, encode_move, decode_move
+from .transposition import TranspositionTable
+
+CUSTOM_FEN = 'r♥n♣b♥q♥k♣b♣n♣r♥/p♥p♣p♣p♥p♥p♥p♣p♣/8/8/8/8/P♠P♦P♦P♦P♠P♦P♠P♠/R♦N♠B♠Q♦K♦B♠N♦R♠'
+
+
+def ownership(board: TeamChessBoard):
+    return [player.squares for player in board.players]
+
+
+def fresh_zobrist_hash(board: TeamChessBoard) -> int:
+    """
+    The zobrist key of the board computed from scratch, instead of incrementally by push/pop.
+    """
+    return board._zobrist_partial_key(board.occupied)
+
+
+class TeamChessBoardTestCase(SimpleTestCase):
+
+    def test_starting_allocation(self):
+        board = TeamChessBoard()
+        self.assertEqual(sum(bin(squares).count('1') for squares in ownership(board)), 32)
+        for player in board.players:
+            self.assertEqual(bin(player.squares).count('1'), 8)
+        white, black = board.white_team_players, board.black_team_players
+        self.assertEqual(white[0].squares | white[1].squares, chess.BB_RANK_1 | chess.BB_RANK_2)
+        self.assertEqual(black[0].squares | black[1].squares, chess.BB_RANK_7 | chess.BB_RANK_8)
+        self.assertEqual(board.current_turn_player.symbol, SPADE)
+
+    def test_custom_fen_ownership(self):
+        board = TeamChessBoard(f'{CUSTOM_FEN} w KQkq - 0 1')
+        spades_pawns = chess.BB_A2 | chess.BB_E2 | chess.BB_G2 | chess.BB_H2
+        self.assertEqual(board.player_of_spades.squares & chess.BB_RANK_2, spades_pawns)
+        self.assertTrue(board.player_of_diamonds.squares & chess.BB_E1)
+        self.assertTrue(board.player_of_hearts.squares & chess.BB_D8)
+        self.assertTrue(board.player_of_clubs.squares & chess.BB_E8)
+        self.assertEqual(board.board_fen(), CUSTOM_FEN)
+
+    def test_moves_of_other_players_are_illegal(self):
+        board = TeamChessBoard(f'{CUSTOM_FEN} w KQkq - 0 1')
+        for move in board.legal_moves:
+            self.assertTrue(board.player_of_spades.squares & chess.BB_SQUARES[move.from_square])
+
+    def test_moves_of_other_players_are_not_pseudo_legal(self):
+        board = TeamChessBoard(f'{CUSTOM_FEN} w KQkq - 0 1')
+        # b2 belongs to the player of diamonds
+        self.assertFalse(board.is_legal(chess.Move.from_uci('b2b3')))
+        self.assertTrue(board.is_legal(chess.Move.from_uci('a2a3')))
+        with self.assertRaises(ValueError):
+            board.push_uci('b2b3')
+
+    def test_push_transfers_ownership_and_rotates_turn(self):
+        board = TeamChessBoard(f'{CUSTOM_FEN} w KQkq - 0 1')
+        board.push_uci('a2a4')
+        self.assertTrue(board.player_of_spades.squares & chess.BB_A4)
+        self.assertFalse(board.player_of_spades.squares & chess.BB_A2)
+        self.assertEqual(board.current_turn_player.symbol, HEART)
+
+    def test_push_castling_keeps_owners(self):
+        board = TeamChessBoard('r♥3k♣2r♥/8/8/8/8/8/8/R♦3K♠2R♦ w KQkq - 0 1', current_turn_player_symbol=SPADE)
+        board.push_uci('e1g1')
+        self.assertEqual(board.piece_at(chess.G1), chess.Piece(chess.KING, chess.WHITE))
+        self.assertTrue(board.player_of_spades.squares & chess.BB_G1)
+        self.assertTrue(board.player_of_diamonds.squares & chess.BB_F1)
+        white_squares = board.player_of_spades.squares | board.player_of_diamonds.squares
+        self.assertFalse(white_squares & (chess.BB_E1 | chess.BB_H1))
+
+    def test_pop_restores_ownership_turn_and_zobrist(self):
+        board = TeamChessBoard(f'{CUSTOM_FEN} w KQkq - 0 1')
+        states = []
+        for uci in ['a2a4', 'a7a6', 'b2b3', 'b7b5', 'a4b5']:
+            states.append((ownership(board), board.current_turn_player.symbol, board.zobrist_hash(), board.board_fen()))
+            board.push_uci(uci)
+        for state in reversed(states):
+            board.pop()
+            self.assertEqual(
+                (ownership(board), board.current_turn_player.symbol, board.zobrist_hash(), board.board_fen()), state
+            )
+
+    def test_turn_player_without_pieces_is_stalemated(self):
+        board = TeamChessBoard('4k♣3/8/8/8/8/8/P♦7/4K♦3 w - - 0 1', current_turn_player_symbol=SPADE)
+        self.assertEqual(list(board.legal_moves), [])
+        self.assertFalse(board.is_legal(chess.Move.from_uci('a2a3')))
+        self.assertTrue(board.is_stalemate())
+        self.assertTrue(board.is_game_over())
+
+    def test_copy_has_its_own_players(self):
+        board = TeamChessBoard()
+        board.push(next(iter(board.legal_moves)))
+        copy = board.copy()
+        self.assertEqual(ownership(copy), ownership(board))
+        self.assertEqual(copy.zobrist_hash(), board.zobrist_hash())
+        self.assertIn(copy.current_turn_player, copy.players)
+        self.assertEqual(copy.current_turn_player.symbol, board.current_turn_player.symbol)
+
+        copy.push(next(iter(copy.legal_moves)))
+        self.assertEqual(len(board.move_stack), 1)
+        self.assertEqual(board.current_turn_player.symbol, HEART)
+        copy.pop()
+        copy.pop()
+        self.assertEqual(len(board.move_stack), 1)
+        self.assertEqual(copy.current_turn_player.symbol, SPADE)
+
+    def test_root_restores_starting_ownership(self):
+        board = TeamChessBoard()
+        start = (ownership(board), board.zobrist_hash(), board.board_fen())
+        for _ in range(6):
+            board.push(random.choice(list(board.legal_moves)))
+        root = board.root()
+        self.assertEqual((ownership(root), root.zobrist_hash(), root.board_fen()), start)
+        self.assertIn(root.current_turn_player, root.players)
+        self.assertEqual(root.current_turn_player.symbol, SPADE)
+
+    def test_zobrist_key_covers_owners_and_turn(self):
+        board = TeamChessBoard(f'{CUSTOM_FEN} w KQkq - 0 1')
+        swapped = TeamChessBoard(f"{CUSTOM_FEN.replace('P♠P♦', 'P♦P♠', 1)} w KQkq - 0 1")
+        self.assertNotEqual(board.zobrist_hash(), swapped.zobrist_hash())
+        other_turn = TeamChessBoard(f'{CUSTOM_FEN} w KQkq - 0 1', current_turn_player_symbol=DIAMOND)
+        self.assertNotEqual(board.zobrist_hash(), other_turn.zobrist_hash())
+
+    def test_repetition_after_a_full_round(self):
+        board = TeamChessBoard('n♥3k♣2n♣/8/8/8/8/8/8/N♠3K♦2N♦ w - - 0 1', current_turn_player_symbol=SPADE)
+        # every player moves their knight out and back, the position repeats once the turn is back to spades
+        for uci in ['a1b3', 'a8b6', 'h1g3', 'h8g6', 'b3a1', 'b6a8', 'g3h1']:
+            board.push_uci(uci)
+            self.assertFalse(board.is_repetition(2))
+        board.push_uci('g6h8')
+        self.assertTrue(board.is_repetition(2))
+        self.assertEqual(board.current_turn_player.symbol, SPADE)
+
+    def test_random_playouts(self):
+        rng = random.Random(0)
+        for _ in range(10):
+            board = TeamChessBoard()
+            for ply in range(120):
+                moves = list(board.legal_moves)
+                if not moves:
+                    break
+                board.push(rng.choice(moves))
+
+                # every piece has exactly one owner, of its color
+                owned = ownership(board)
+                self.assertEqual(owned[0] | owned[1] | owned[2] | owned[3], board.occupied)
+                self.assertEqual(sum(bin(squares).count('1') for squares in owned), bin(board.occupied).count('1'))
+                for player in board.players:
+                    color = player in board.white_team_players
+                    self.assertEqual(player.squares & board.occupied_co[color], player.squares)
+
+                self.assertEqual(board.current_turn_player.symbol, PLAYER_SYMBOLS[(ply + 1) % len(PLAYER_SYMBOLS)])
+                self.assertEqual(board.zobrist_hash(), fresh_zobrist_hash(board))
+
+
+class TranspositionTableTestCase(SimpleTestCase):
+
+    def test_store_and_get(self):
+        table = TranspositionTable(size=8)
+        key = TeamChessBoard().zobrist_hash()
+        table.store(key, depth=3, score=42, bound=0, move=chess.Move.from_uci('a2a3'))
+        self.assertIn(key, table)
+        self.assertEqual((table.get(key).depth, table.get(key).score), (3, 42))
+        # another position in the same slot
+        self.assertIsNone(table.get(key + 8))
+
+    def test_replacement_keeps_deeper_entries_of_the_current_search(self):
+        table = TranspositionTable(size=8)
+        table.store(8, depth=5, score=1, bound=0)
+        table.store(16, depth=2, score=2, bound=0)
+        self.assertIn(8, table)
+        self.assertNotIn(16, table)
+        table.new_search()
+        table.store(16, depth=2, score=2, bound=0)
+        self.assertIn(16, table)
+        self.assertNotIn(8, table)
+
+    def test_invalid_size(self):
+        with self.assertRaises(ValueError):
+            TranspositionTable(size=0)
+
+
+class CustomFenTestCase(SimpleTestCase):
+
+    def test_board_fen_round_trip(self):
+        board = TeamChessBoard(f'{CUSTOM_FEN} w KQkq - 0 1')
+        self.assertEqual(board.board_fen(), CUSTOM_FEN)
+        self.assertEqual(TeamChessBoard(board.fen()).board_fen(), CUSTOM_FEN)
+
+    def test_original_fen(self):
+        board = TeamChessBoard(f'{CUSTOM_FEN} w KQkq - 0 1')
+        self.assertEqual(board.get_original_fen(), chess.STARTING_FEN)
+        board.push_uci('e2e4')
+        self.assertEqual(board.get_original_fen(), chess.Board(board.get_original_fen()).fen())
+        self.assertEqual(board.get_original_fen().split(' ')[0], chess.BaseBoard.board_fen(board))
+
+    def test_promoted_marker(self):
+        fen = '4k♣3/8/8/8/8/8/8/Q~♠3K♦3'
+        board = TeamChessBoard(f'{fen} w - - 0 1')
+        self.assertTrue(board.promoted & chess.BB_A1)
+        self.assertEqual(board.board_fen(promoted=True), fen)
+        self.assertEqual(board.board_fen(), '4k♣3/8/8/8/8/8/8/Q♠3K♦3')
+
+    def test_invalid_fen(self):
+        invalid_fens = [
+            '♠4k♣3/8/8/8/8/8/8/4K♦3',  # player symbol before any piece
+            '4k♣♥3/8/8/8/8/8/8/4K♦3',  # two subsequent player symbols
+            '3♠k♣3/8/8/8/8/8/8/4K♦3',  # player symbol after a digit
+            '44k♣3/8/8/8/8/8/8/4K♦3',  # two subsequent digits
+            '5k♣3/8/8/8/8/8/8/4K♦3',  # 9 columns
+            '4k♣2/8/8/8/8/8/8/4K♦3',  # 7 columns
+            '4k♣3/8/8/8/8/8/4K♦3',  # 7 rows
+            '4k♣3/8/8/8/8/8/8/8/4K♦3',  # 9 rows
+            '4k♣3/8/8/8/8/8/8/~4K♦3',  # promotion marker before any piece
+            '4k♣3/8/8/8/8/8/8/4K♦x2',  # invalid character
+        ]
+        for fen in invalid_fens:
+            with self.subTest(fen=fen), self.assertRaises(ValueError):
+                TeamChessBoard().set_board_fen(fen)
+
+    def test_invalid_fen_leaves_board_unchanged(self):
+        board = TeamChessBoard(f'{CUSTOM_FEN} w KQkq - 0 1')
+        with self.assertRaises(ValueError):
+            board.set_board_fen('4k♣3/8/8/8/8/8/8/4K♦x2')
+        self.assertEqual(board.board_fen(), CUSTOM_FEN)
+
+    def test_invalid_player_symbol(self):
+        with self.assertRaises(ValueError):
+            TeamChessBoard().get_player_by_symbol('x')
+
+
+class EncodingTestCase(SimpleTestCase):
+
+    def assertSamePosition(self, decoded: TeamChessBoard, board: TeamChessBoard):
+        self.assertEqual(decoded.board_fen(promoted=True), board.board_fen(promoted=True))
+        self.assertEqual(decoded.fen(), board.fen())
+        self.assertEqual(decoded.current_turn_player.symbol, board.current_turn_player.symbol)
+        self.assertEqual(decoded.zobrist_hash(), board.zobrist_hash())
+
+    def test_round_trip_random_playouts(self):
+        rng = random.Random(1)
+        for _ in range(10):
+            board = TeamChessBoard()
+            for _ in range(80):
+                self.assertSamePosition(decode_board(encode_board(board)), board)
+                moves = list(board.legal_moves)
+                if not moves:
+                    break
+                board.push(rng.choice(moves))
+
+    def test_round_trip_en_passant_and_promotion(self):
+        board = TeamChessBoard('4k♣3/1P~♦6/8/3p♥P♠3/8/8/8/4K♦3 w - d6 0 40', current_turn_player_symbol=SPADE)
+        decoded = decode_board(encode_board(board))
+        self.assertSamePosition(decoded, board)
+        self.assertEqual(decoded.ep_square, chess.D6)
+
+    def test_decode_rejects_invalid_data(self):
+        with self.assertRaises(ValueError):
+            decode_board(encode_board(TeamChessBoard())[:-1])
+
+    def test_move_round_trip(self):
+        for uci in ['a2a4', 'e1g1', 'b7b8q', 'h2h1n']:
+            move = chess.Move.from_uci(uci)
+            self.assertEqual(decode_move(encode_move(move)), move)
@@ -0,0 +1,53 @@
+from typing import List, Optional
+
+from chess import Move
+
+from .definitions import TranspositionEntry
+
+
+class TranspositionTable:
+    """
+    A bounded transposition table keyed on the zobrist keys of TeamChessBoard.
+
+    Entries are kept in a fixed number of slots indexed by the key, so the memory used never grows past the size
+    the table was created with. A slot that holds a different position is only replaced by an entry searched at
+    least as deep, unless the entry in that slot is left over from an older search generation.
+    """
+
+    def __init__(self, size: int = 1 << 16):
+        if size <= 0:
+            raise ValueError(f'transposition table size must be positive, got {size}')
+        self.size = size
+        self.generation = 0
+        self._entries: List[Optional[TranspositionEntry]] = [None] * size
+
+    def get(self, key: int) -> Optional[TranspositionEntry]:
+        """
+        Returns the entry stored for the passed key, or None if the position is not in the table.
+        """
+        entry = self._entries[key % self.size]
+        if entry is not None and entry.key == key:
+            return entry
+        return None
+
+    def store(self, key: int, depth: int, score: int, bound: int, move: Optional[Move] = None) -> None:
+        """
+        Stores the result of searching the position with the passed key, following the replacement scheme.
+        """
+        index = key % self.size
+        entry = self._entries[index]
+        if entry is None or entry.key == key or entry.generation != self.generation or depth >= entry.depth:
+            self._entries[index] = TranspositionEntry(key, depth, score, bound, move, self.generation)
+
+    def new_search(self) -> None:
+        """
+        Marks the entries stored so far as stale, so they are replaced first by the next search.
+        """
+        self.generation += 1
+
+    def clear(self) -> None:
+        self.generation = 0
+        self._entries = [None] * self.size
+
+    def __contains__(self, key: int) -> bool:
+        return self.get(key) is not None
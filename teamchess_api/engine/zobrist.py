@@ -0,0 +1,36 @@
+"""
+Zobrist keys for team chess positions.
+
+Unlike the polyglot keys of python-chess, pieces are keyed per owning player instead of per color (the color is implied
+by the player), and the side to move is keyed per turn player of the 4-cycle.
+"""
+import random
+from typing import Dict, List
+
+import chess
+
+from .constants import PLAYER_SYMBOLS
+
+_ZOBRIST_SEED = 0x7EA3C4E55
+
+_random = random.Random(_ZOBRIST_SEED)
+
+
+def _random_key() -> int:
+    return _random.getrandbits(64)
+
+
+# PIECE_KEYS[player symbol][piece type][square], index 0 of the piece types is unused.
+PIECE_KEYS: Dict[str, List[List[int]]] = {
+    symbol: [[_random_key() for _ in chess.SQUARES] for _ in range(len(chess.PIECE_TYPES) + 1)]
+    for symbol in PLAYER_SYMBOLS
+}
+
+# CASTLING_KEYS[square], only the keys of the rook squares in castling rights are ever used.
+CASTLING_KEYS: List[int] = [_random_key() for _ in chess.SQUARES]
+
+# EP_KEYS[file] of the en passant square.
+EP_KEYS: List[int] = [_random_key() for _ in chess.FILE_NAMES]
+
+# TURN_KEYS[player symbol] of the current turn player.
+TURN_KEYS: Dict[str, int] = {symbol: _random_key() for symbol in PLAYER_SYMBOLS}
@@ -1,4 +1,236 @@
+import redis
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from teamchess_api.lru_cache import LRUCache
 from engine.board import TeamChessBoard
-from typing import Dict
+from engine.encoding import encode_board, decode_board
+from room.snapshot_cache import ROOM_SNAPSHOTS
+from .models import Game
+
+
+class StaleBoardError(Exception):
+    """
+    Raised when saving a board that was changed by another worker since it was loaded.
+    """
+
+
+class BaseActiveBoardStore:
+    """
+    Holds the boards of the games in progress, keyed by room id.
+
+    Supports the dict operations the rest of the code base relies on (``store[room_id]``, ``store[room_id] = board``,
+    ``room_id in store`` and ``del store[room_id]``). Boards are changed in place, and must be saved after every
+    change so the change is visible to other workers.
+    """
+
+    def get(self, room_id) -> TeamChessBoard:
+        """
+        Returns the board of the room, raises KeyError when the room has no game in progress.
+        """
+        raise NotImplementedError
+
+    def set(self, room_id, board: TeamChessBoard) -> None:
+        """
+        Unconditionally stores the board as the board of the room.
+        """
+        raise NotImplementedError
+
+    def save(self, room_id, board: TeamChessBoard) -> None:
+        """
+        Stores the changes made to a board returned by get.
+        """
+        raise NotImplementedError
+
+    def delete(self, room_id) -> None:
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns the size and the hit, miss and eviction counters of the boards kept in memory.
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def _load_from_game(room_id: str) -> TeamChessBoard:
+        """
+        Restores the board of the unfinished game of the room from Game.custom_fen, raises KeyError when there is none.
+        """
+        games = Game.objects.filter(room_id=room_id, is_finished=False)
+        custom_fen = games.values_list('custom_fen', flat=True).first()
+        if custom_fen is None:
+            raise KeyError(room_id)
+        return TeamChessBoard.from_game_fen(custom_fen)
+
+    def __getitem__(self, room_id) -> TeamChessBoard:
+        return self.get(room_id)
+
+    def __setitem__(self, room_id, board: TeamChessBoard) -> None:
+        self.set(room_id, board)
+
+    def __delitem__(self, room_id) -> None:
+        self.delete(room_id)
+
+    def __contains__(self, room_id) -> bool:
+        try:
+            self.get(room_id)
+        except KeyError:
+            return False
+        return True
+
+
+class LocalActiveBoardStore(BaseActiveBoardStore):
+    """
+    Keeps the boards in memory of the current process, games are only visible to consumers of this process.
+
+    At most ACTIVE_BOARDS_MAX_SIZE boards are kept, boards that are least recently used or idle for
+    ACTIVE_BOARDS_IDLE_TTL seconds are hibernated: written back to Game.custom_fen and restored from it on next access.
+    """
+
+    def __init__(self, max_size: int = None, idle_ttl: float = None):
+        self.boards = LRUCache(
+            settings.ACTIVE_BOARDS_MAX_SIZE if max_size is None else max_size,
+            settings.ACTIVE_BOARDS_IDLE_TTL if idle_ttl is None else idle_ttl,
+            on_evict=self._hibernate
+        )
+
+    @staticmethod
+    def _hibernate(room_id: str, board: TeamChessBoard) -> None:
+        Game.objects.filter(room_id=room_id, is_finished=False, ply__lt=board.ply()).update(
+            fen=board.get_original_fen(), custom_fen=board.fen(), ply=board.ply()
+        )
+        ROOM_SNAPSHOTS.bump(room_id)
+
+    def get(self, room_id) -> TeamChessBoard:
+        room_id = str(room_id)
+        board = self.boards.get(room_id)
+        if board is None:
+            board = self._load_from_game(room_id)
+            self.boards.set(room_id, board)
+        return board
+
+    def set(self, room_id, board: TeamChessBoard) -> None:
+        self.boards.set(str(room_id), board)
+
+    def save(self, room_id, board: TeamChessBoard) -> None:
+        # boards are changed in place, saving only marks the board as recently used, putting it back if it was
+        # hibernated in the meantime
+        self.boards.set(str(room_id), board)
+
+    def delete(self, room_id) -> None:
+        self.boards.pop(str(room_id))
+
+    def stats(self) -> Dict[str, int]:
+        return self.boards.stats()
+
+
+class RedisActiveBoardStore(BaseActiveBoardStore):
+    """
+    Keeps the boards in Redis, encoded with engine.encoding, so games are shared by every worker and survive restarts.
+
+    Each room is a hash holding the encoded position and a version that is incremented on every write. Decoded boards
+    are kept in a local hot cache along with their version, a get only transfers the version unless the board was
+    changed by another worker. Saves are compare-and-set on the version, so concurrent writes are never lost silently.
+    Rooms missing from Redis are lazily rehydrated from Game.custom_fen.
+
+    The hot cache is bounded like LocalActiveBoardStore, evicted boards are simply dropped since Redis holds them.
+    """
+    key_prefix = 'active_board:'
+
+    # Sets the position when the version matches ARGV[1], returns the new version, or -1 when the version is stale.
+    compare_and_set_script = """
+        local version = tonumber(redis.call('HGET', KEYS[1], 'version') or '0')
+        if version ~= tonumber(ARGV[1]) then
+            return -1
+        end
+        redis.call('HSET', KEYS[1], 'version', version + 1, 'position', ARGV[2])
+        redis.call('EXPIRE', KEYS[1], ARGV[3])
+        return version + 1
+    """
+
+    def __init__(self, client=None, ttl: int = None, max_size: int = None, idle_ttl: float = None):
+        self.client = client if client is not None else redis.Redis.from_url(settings.REDIS_HOST)
+        self.ttl = settings.ACTIVE_BOARDS_REDIS_TTL if ttl is None else ttl
+        self.cache = LRUCache(
+            settings.ACTIVE_BOARDS_MAX_SIZE if max_size is None else max_size,
+            settings.ACTIVE_BOARDS_IDLE_TTL if idle_ttl is None else idle_ttl
+        )
+        self._compare_and_set = self.client.register_script(self.compare_and_set_script)
+
+    def _key(self, room_id: str) -> str:
+        return f'{self.key_prefix}{room_id}'
+
+    def get(self, room_id) -> TeamChessBoard:
+        room_id = str(room_id)
+        key = self._key(room_id)
+        cached = self.cache.get(room_id)
+        if cached is not None:
+            version = self.client.hget(key, 'version')
+            if version is not None and int(version) == cached[0]:
+                return cached[1]
+
+        version, position = self.client.hmget(key, 'version', 'position')
+        if position is None:
+            return self._rehydrate(room_id)
+
+        board = decode_board(position)
+        self.cache.set(room_id, (int(version), board))
+        return board
+
+    def _rehydrate(self, room_id: str) -> TeamChessBoard:
+        """
+        Restores the board of an unfinished game from the database and writes it back to Redis, another worker
+        rehydrating the same room at the same time is fine, only one of the writes succeeds and both boards are equal.
+        """
+        self.cache.pop(room_id)
+        board = self._load_from_game(room_id)
+        version = self._compare_and_set(keys=[self._key(room_id)], args=[0, encode_board(board), self.ttl])
+        if version != -1:
+            self.cache.set(room_id, (version, board))
+        return board
+
+    def set(self, room_id, board: TeamChessBoard) -> None:
+        room_id = str(room_id)
+        key = self._key(room_id)
+        with self.client.pipeline() as pipeline:
+            pipeline.hincrby(key, 'version', 1)
+            pipeline.hset(key, 'position', encode_board(board))
+            pipeline.expire(key, self.ttl)
+            version, *_ = pipeline.execute()
+        self.cache.set(room_id, (version, board))
+
+    def save(self, room_id, board: TeamChessBoard) -> None:
+        """
+        Raises StaleBoardError when the board was not loaded through this store, or another worker saved the room
+        since it was loaded, the stale board is then dropped from the hot cache and has to be loaded again.
+        """
+        room_id = str(room_id)
+        cached = self.cache.get(room_id)
+        if cached is None or cached[1] is not board:
+            raise StaleBoardError(f'board of room {room_id} was not loaded through this store')
+
+        version = self._compare_and_set(keys=[self._key(room_id)], args=[cached[0], encode_board(board), self.ttl])
+        if version == -1:
+            self.cache.pop(room_id)
+            raise StaleBoardError(f'board of room {room_id} was changed by another worker')
+        self.cache.set(room_id, (version, board))
+
+    def delete(self, room_id) -> None:
+        room_id = str(room_id)
+        self.cache.pop(room_id)
+        self.client.delete(self._key(room_id))
+
+    def stats(self) -> Dict[str, int]:
+        return self.cache.stats()
+
+
+def get_active_board_store(backend: Optional[str] = None) -> BaseActiveBoardStore:
+    """
+    Creates the active board store configured by the ACTIVE_BOARDS_BACKEND setting.
+    """
+    return import_string(backend or settings.ACTIVE_BOARDS_BACKEND)()
+
 
-ACTIVE_BOARDS: Dict[str, TeamChessBoard] = {}
+ACTIVE_BOARDS: BaseActiveBoardStore = get_active_board_store()
@@ -0,0 +1,67 @@
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+from django.conf import settings
+
+from engine import tasks
+from engine.search import SearchResult
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def get_executor() -> ProcessPoolExecutor:
+    """
+    Lazily creates the process pool shared by every consumer of this worker, sized by the ENGINE_POOL_SIZE setting.
+    Worker processes are spawned rather than forked, so they don't inherit the event loop and threads of daphne.
+    """
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.ENGINE_POOL_SIZE, mp_context=multiprocessing.get_context('spawn')
+        )
+    return _executor
+
+
+def shutdown_executor(wait: bool = True) -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=wait, cancel_futures=True)
+        _executor = None
+
+
+async def run_engine_task(task, *args, timeout: Optional[float] = None):
+    """
+    Runs an engine task inside the process pool and awaits its result without blocking the event loop.
+
+    The task receives an absolute deadline as its last argument, so it is skipped if it waited in the queue past it.
+    Raises asyncio.TimeoutError when the deadline is exceeded, the pending task is then cancelled. Cancelling the
+    awaiting coroutine cancels the pending task as well, a task that already started runs to the end of its own budget.
+    """
+    timeout = settings.ENGINE_TASK_TIMEOUT if timeout is None else timeout
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(get_executor(), task, *args, time.time() + timeout)
+    try:
+        return await asyncio.wait_for(future, timeout=timeout)
+    except TimeoutError as e:
+        # deadline exceeded inside the worker process
+        raise asyncio.TimeoutError(str(e)) from e
+
+
+async def search(custom_fen: str, turn_symbol: str, time_limit: float, timeout: Optional[float] = None) -> SearchResult:
+    """
+    Searches the position for the best move of the turn player, the deadline defaults to the search time limit plus
+    the ENGINE_TASK_TIMEOUT setting, leaving room for the task to wait in the queue.
+    """
+    timeout = time_limit + settings.ENGINE_TASK_TIMEOUT if timeout is None else timeout
+    return await run_engine_task(tasks.search, custom_fen, turn_symbol, time_limit, timeout=timeout)
+
+
+async def legal_moves(custom_fen: str, turn_symbol: str, timeout: Optional[float] = None) -> List[str]:
+    return await run_engine_task(tasks.legal_moves, custom_fen, turn_symbol, timeout=timeout)
+
+
+async def game_status(custom_fen: str, turn_symbol: str, timeout: Optional[float] = None) -> Dict[str, Optional[str]]:
+    return await run_engine_task(tasks.game_status, custom_fen, turn_symbol, timeout=timeout)
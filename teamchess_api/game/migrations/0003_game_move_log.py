@@ -0,0 +1,39 @@
+# Generated by Django 4.2 on 2026-10-18 11:29
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0002_rename_custom_board_fen_game_custom_fen_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='starting_position',
+            field=models.BinaryField(default=None, null=True),
+        ),
+        migrations.CreateModel(
+            name='GameMove',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ply', models.PositiveIntegerField()),
+                ('player_symbol', models.CharField(max_length=1)),
+                ('move', models.PositiveSmallIntegerField()),
+                ('position', models.BinaryField(default=None, null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('game', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='moves', to='game.game')),
+            ],
+            options={
+                'ordering': ['ply'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='gamemove',
+            constraint=models.UniqueConstraint(fields=('game', 'ply'), name='unique_game_move_ply'),
+        ),
+    ]
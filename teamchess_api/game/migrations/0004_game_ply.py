@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-18 12:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0003_game_move_log'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='ply',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -1,8 +1,59 @@
+from typing import Optional
+
 from django.db import models
+from django.dispatch import receiver
+from django.utils import timezone
+
+from engine.board import TeamChessBoard
+from engine.encoding import decode_move
+from room.snapshot_cache import ROOM_SNAPSHOTS
 
 
 class Game(models.Model):
     fen = models.CharField(max_length=100)
     custom_fen = models.CharField(max_length=200)
     is_finished = models.BooleanField(default=False)
+    # ply of the written position, so an older position is never written over a newer one
+    ply = models.PositiveIntegerField(default=0)
     room = models.OneToOneField(to='room.Room', on_delete=models.CASCADE, related_name='game')
+    starting_position = models.BinaryField(null=True, default=None)
+
+    def replay(self, ply: Optional[int] = None) -> TeamChessBoard:
+        """
+        Rebuilds the board of the game after the given ply (the last logged one by default) from its move log, with
+        TeamChessBoard.from_move_log.
+        """
+        moves = self.moves.all() if ply is None else self.moves.filter(ply__lte=ply)
+        keyframes = {} if self.starting_position is None else {0: bytes(self.starting_position)}
+        decoded_moves = []
+        for move_ply, packed, position in moves.values_list('ply', 'move', 'position'):
+            decoded_moves.append(decode_move(packed))
+            if position is not None:
+                keyframes[move_ply] = bytes(position)
+        return TeamChessBoard.from_move_log(decoded_moves, keyframes, ply)
+
+    @staticmethod
+    @receiver(models.signals.post_save, sender='game.Game')
+    @receiver(models.signals.post_delete, sender='game.Game')
+    def game_changed(sender, instance, **kwargs):
+        ROOM_SNAPSHOTS.bump(instance.room_id)
+
+
+class GameMove(models.Model):
+    """
+    Append-only log of the moves of a game, one row per ply, holding the moving player and the move packed by
+    engine.encoding. Every GAME_MOVE_KEYFRAME_INTERVAL plies the encoded position after the move is kept as a
+    keyframe, so a position is replayed from the nearest keyframe rather than from the first move.
+    """
+    game = models.ForeignKey(to='game.Game', on_delete=models.CASCADE, related_name='moves')
+    ply = models.PositiveIntegerField()
+    player_symbol = models.CharField(max_length=1)
+    move = models.PositiveSmallIntegerField()
+    position = models.BinaryField(null=True, default=None)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['ply']
+        constraints = [
+            models.UniqueConstraint(fields=('game', 'ply'), name='unique_game_move_ply')
+        ]
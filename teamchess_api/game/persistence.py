@@ -0,0 +1,127 @@
+import operator
+import threading
+from functools import reduce
+from typing import Dict, List, Tuple
+
+from django.conf import settings
+from django.db import models, transaction
+
+from teamchess_api.background import PeriodicWorker
+from engine.board import TeamChessBoard
+from engine.encoding import encode_board, encode_move
+from room.snapshot_cache import ROOM_SNAPSHOTS
+from .models import Game, GameMove
+
+class GamePersister(PeriodicWorker):
+    """
+    Write-behind persistence of the position and the move log of games in progress.
+
+    Moves only mark their game as dirty, keeping a snapshot of its fen, custom fen and ply, and are appended to the
+    pending move log. A background thread flushes the dirty games every interval seconds with a single UPDATE statement
+    and a bulk insert of the pending moves, a finished game is flushed right away, and the pending games are flushed
+    once more when the process exits gracefully.
+
+    The moves of a game may be made on several workers, each flushing its own snapshots, so a snapshot is only written
+    over an older ply of the game, and a finished game is never marked unfinished again. Moves already logged by
+    another worker are skipped.
+    """
+
+    thread_name = 'game-persister'
+
+    def __init__(self, interval: float, keyframe_interval: int):
+        super().__init__(interval)
+        self.keyframe_interval = keyframe_interval
+        self.pending: Dict[str, Tuple[str, str, bool, int]] = {}
+        self.pending_moves: Dict[str, List[GameMove]] = {}
+        self._lock = threading.Lock()
+        # held for a whole flush, so an older snapshot of a game is never written after a newer one
+        self._flush_lock = threading.Lock()
+
+    def mark_dirty(self, room_id, board: TeamChessBoard, is_finished: bool = False) -> None:
+        with self._lock:
+            self.pending[str(room_id)] = (board.get_original_fen(), board.fen(), is_finished, board.ply())
+        if is_finished:
+            self.flush()
+        else:
+            self.start()
+
+    def log_move(self, room_id, board: TeamChessBoard, player_symbol: str) -> None:
+        """
+        Appends the last move pushed on the board to the move log of the game, must be called before mark_dirty.
+        """
+        ply = board.ply()
+        game_move = GameMove(
+            ply=ply,
+            player_symbol=player_symbol,
+            move=encode_move(board.peek()),
+            position=encode_board(board) if ply % self.keyframe_interval == 0 else None
+        )
+        with self._lock:
+            self.pending_moves.setdefault(str(room_id), []).append(game_move)
+
+    def flush(self) -> int:
+        """
+        Writes every dirty game in one UPDATE statement and their pending moves in bulk, returns the number of updated
+        games, games holding a newer ply are left as is. Games that failed to be written are marked dirty again, unless
+        they were changed in the meantime. Flushes run one at a time.
+        """
+        with self._flush_lock:
+            return self._flush()
+
+    def _flush(self) -> int:
+        with self._lock:
+            pending, self.pending = self.pending, {}
+            pending_moves, self.pending_moves = self.pending_moves, {}
+        if not pending:
+            return 0
+
+        def case(index, default, output_field=None):
+            whens = (models.When(room_id=key, then=models.Value(value[index])) for key, value in pending.items())
+            return models.Case(*whens, default=default, output_field=output_field)
+
+        older = reduce(operator.or_, (models.Q(room_id=key, ply__lt=value[3]) for key, value in pending.items()))
+        finished = [models.When(room_id=key, then=models.Value(True)) for key, value in pending.items() if value[2]]
+
+        try:
+            with transaction.atomic():
+                games = Game.objects.filter(room_id__in=pending.keys())
+                game_ids = {str(room_id): game_id for room_id, game_id in games.values_list('room_id', 'id')}
+                updated = games.filter(older).update(
+                    fen=case(0, models.F('fen')),
+                    custom_fen=case(1, models.F('custom_fen')),
+                    ply=case(3, models.F('ply'), models.PositiveIntegerField()),
+                    is_finished=models.Case(*finished, default=models.F('is_finished')),
+                )
+                game_moves = []
+                for room_id, room_moves in pending_moves.items():
+                    # moves of games deleted in the meantime are dropped
+                    if room_id in game_ids:
+                        for game_move in room_moves:
+                            game_move.game_id = game_ids[room_id]
+                        game_moves.extend(room_moves)
+                # a move may have been logged by the worker holding the game before
+                GameMove.objects.bulk_create(game_moves, ignore_conflicts=True)
+                for room_id in game_ids:
+                    ROOM_SNAPSHOTS.bump(room_id)
+            return updated
+        except Exception:
+            with self._lock:
+                self.pending = {**pending, **self.pending}
+                for room_id, room_moves in self.pending_moves.items():
+                    pending_moves[room_id] = pending_moves.get(room_id, []) + room_moves
+                self.pending_moves = pending_moves
+            raise
+
+    def tick(self) -> None:
+        # games that failed to be written are kept dirty and retried on the next interval
+        self.flush()
+
+    def stop(self) -> None:
+        """
+        Stops the background thread and flushes the pending games, so none are lost on a graceful shutdown.
+        """
+        super().stop()
+        self.flush()
+
+
+GAME_PERSISTER = GamePersister(settings.GAME_PERSIST_INTERVAL, settings.GAME_MOVE_KEYFRAME_INTERVAL)
@@ -1,12 +1,17 @@
+import chess
 from rest_framework import serializers
 from rest_framework.settings import api_settings
-from asgiref.sync import async_to_sync
-from channels.layers import get_channel_layer
 
 from game.models import Game
 from room.models import Room
 from engine.board import TeamChessBoard
-from .active_boards import ACTIVE_BOARDS
+from engine.encoding import encode_board
+from room.event_types import GAME_STARTED
+from room.outbox import EVENT_OUTBOX
+from room.snapshot_cache import ROOM_SNAPSHOTS
+from player.presence import PRESENCE
+from .active_boards import ACTIVE_BOARDS, StaleBoardError
+from .persistence import GAME_PERSISTER
 
 
 class StartGameSerializer(serializers.ModelSerializer):
@@ -25,30 +30,30 @@ class StartGameSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError({
                 api_settings.NON_FIELD_ERRORS_KEY: ['Game has already started.']
             })
-        if room.players.filter(is_online=True).count() != 4:
+        if len(PRESENCE.online_players(room.id)) != 4:
             raise serializers.ValidationError({
                 api_settings.NON_FIELD_ERRORS_KEY: ['Cannot start game with less than 4 players.']
             })
         return attrs
 
-    @async_to_sync
-    async def send_game_started_event(self, channel_name):
-        channel_layer = get_channel_layer()
-        await channel_layer.group_send(channel_name, {'type': 'game.started'})
-
     def create(self, validated_data):
         chessboard = TeamChessBoard()
         custom_fen = chessboard.fen()
         fen = chessboard.get_original_fen()
 
-        game = Game.objects.create(room=validated_data.pop('room'), fen=fen, custom_fen=custom_fen)
+        game = Game.objects.create(
+            room=validated_data.pop('room'), fen=fen, custom_fen=custom_fen, starting_position=encode_board(chessboard)
+        )
         room = game.room
         room.status = Room.RoomStatusChoices.IN_GAME
         room.save()
+        PRESENCE.sync_room(room.id)
 
         ACTIVE_BOARDS[room.id] = chessboard
 
-        self.send_game_started_event(str(room.id))
+        # the room is serialized once committed, with the game, the pieces now, before any move
+        pieces = chessboard.get_pieces()
+        EVENT_OUTBOX.emit(room.id, GAME_STARTED, lambda: {'room': ROOM_SNAPSHOTS.get(room.id), 'pieces': pieces})
 
         return game
 
@@ -58,3 +63,70 @@ class RetrieveGameSerializer(serializers.ModelSerializer):
     class Meta:
         model = Game
         fields = ('id', 'fen', 'custom_fen', 'is_finished')
+
+
+class MakeMoveSerializer(serializers.Serializer):
+    """
+    Validates a move sent over the room websocket against the board of the room in memory and applies it.
+    Expects the room id and the moving player, with their current symbol, in the context, and returns the delta that
+    is broadcast to the room:
+    from and to squares, promotion piece, owner of the moved piece, next turn player symbol and sequence number (the
+    ply of the game after the move).
+    """
+
+    uci = serializers.CharField(max_length=5, write_only=True)
+
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        try:
+            board = ACTIVE_BOARDS[self.context['room_id']]
+        except KeyError:
+            raise serializers.ValidationError({
+                api_settings.NON_FIELD_ERRORS_KEY: ['Game has not started.']
+            })
+        # finished boards stay active until they are evicted, a turn player without pieces has no legal moves, which
+        # ends the game as a stalemate
+        if board.is_game_over():
+            raise serializers.ValidationError({
+                api_settings.NON_FIELD_ERRORS_KEY: ['Game is over.']
+            })
+        if board.current_turn_player.symbol != self.context['player'].player_symbol:
+            raise serializers.ValidationError({
+                api_settings.NON_FIELD_ERRORS_KEY: ['It is not your turn.']
+            })
+
+        try:
+            move = chess.Move.from_uci(attrs['uci'])
+        except ValueError:
+            raise serializers.ValidationError({'uci': ['Invalid move.']})
+        if not board.is_legal(move):
+            raise serializers.ValidationError({'uci': ['Illegal move.']})
+
+        attrs.update(board=board, move=move)
+        return attrs
+
+    def create(self, validated_data):
+        board = validated_data['board']
+        move = validated_data['move']
+        owner = board.current_turn_player.symbol
+        board.push(move)
+        try:
+            ACTIVE_BOARDS.save(self.context['room_id'], board)
+        except StaleBoardError:
+            raise serializers.ValidationError({
+                api_settings.NON_FIELD_ERRORS_KEY: ['Board was changed by another move, try again.']
+            })
+        GAME_PERSISTER.log_move(self.context['room_id'], board, owner)
+        is_finished = board.is_game_over()
+        GAME_PERSISTER.mark_dirty(self.context['room_id'], board, is_finished=is_finished)
+        if is_finished:
+            PRESENCE.sync_room(self.context['room_id'])
+
+        return {
+            'from': chess.square_name(move.from_square),
+            'to': chess.square_name(move.to_square),
+            'promotion': chess.piece_symbol(move.promotion) if move.promotion else None,
+            'owner': owner,
+            'next': board.current_turn_player.symbol,
+            'seq': board.ply(),
+        }
@@ -1,3 +1,173 @@
 from django.test import TestCase
 
-# Create your tests here.
+from engine.board import TeamChessBoard
+from engine.constants import SPADE
+from engine.encoding import encode_board
+from room.models import Room
+from .active_boards import LocalActiveBoardStore
+from .models import Game, GameMove
+from .persistence import GamePersister
+
+
+def start_game(room: Room) -> TeamChessBoard:
+    board = TeamChessBoard()
+    Game.objects.create(
+        room=room, fen=board.get_original_fen(), custom_fen=board.fen(), starting_position=encode_board(board)
+    )
+    return board
+
+
+def push_moves(board: TeamChessBoard, count: int) -> None:
+    for _ in range(count):
+        board.push(next(iter(board.legal_moves)))
+
+
+class GamePersisterTestCase(TestCase):
+
+    def setUp(self):
+        self.room = Room.objects.create(name='room', type=Room.RoomTypeChoices.PUBLIC)
+        self.board = start_game(self.room)
+
+    def persister(self) -> GamePersister:
+        persister = GamePersister(interval=60, keyframe_interval=4)
+        self.addCleanup(persister.stop)
+        return persister
+
+    def move(self, persister: GamePersister, board: TeamChessBoard, is_finished: bool = False) -> None:
+        owner = board.current_turn_player.symbol
+        push_moves(board, 1)
+        persister.log_move(self.room.pk, board, owner)
+        persister.mark_dirty(self.room.pk, board, is_finished=is_finished)
+
+    def test_flush_writes_the_position_and_the_moves(self):
+        persister = self.persister()
+        for _ in range(5):
+            self.move(persister, self.board)
+        self.assertEqual(Game.objects.get().ply, 0)
+
+        self.assertEqual(persister.flush(), 1)
+        game = Game.objects.get()
+        self.assertEqual((game.fen, game.custom_fen, game.ply), (self.board.get_original_fen(), self.board.fen(), 5))
+        self.assertEqual(list(game.moves.values_list('ply', flat=True)), [1, 2, 3, 4, 5])
+        self.assertEqual(list(game.moves.exclude(position=None).values_list('ply', flat=True)), [4])
+        self.assertEqual(persister.flush(), 0)
+
+    def test_older_positions_are_not_written(self):
+        # the game moves on from one worker to another, the first one flushing its snapshot last
+        first, second = self.persister(), self.persister()
+        self.move(first, self.board)
+        board = self.board.copy()
+        self.move(second, board)
+        self.move(second, board)
+        second.flush()
+
+        self.assertEqual(first.flush(), 0)
+        game = Game.objects.get()
+        self.assertEqual((game.custom_fen, game.ply), (board.fen(), 3))
+        # the move log is still completed by the older snapshot
+        self.assertEqual(list(game.moves.values_list('ply', flat=True)), [1, 2, 3])
+
+    def test_finished_games_stay_finished(self):
+        first, second = self.persister(), self.persister()
+        self.move(first, self.board)
+        board = self.board.copy()
+        # flushed right away
+        self.move(second, board, is_finished=True)
+        self.assertTrue(Game.objects.get().is_finished)
+
+        first.mark_dirty(self.room.pk, board)
+        first.flush()
+        self.assertTrue(Game.objects.get().is_finished)
+
+    def test_moves_logged_twice_do_not_block_the_flush(self):
+        first, second = self.persister(), self.persister()
+        self.move(first, self.board)
+        second.log_move(self.room.pk, self.board, SPADE)
+        second.mark_dirty(self.room.pk, self.board)
+        first.flush()
+
+        self.move(second, self.board)
+        self.assertEqual(second.flush(), 1)
+        self.assertEqual(list(GameMove.objects.values_list('ply', flat=True)), [1, 2])
+        self.assertEqual(second.pending, {})
+        self.assertEqual(second.pending_moves, {})
+
+    def test_moves_of_deleted_games_are_dropped(self):
+        persister = self.persister()
+        self.move(persister, self.board)
+        Game.objects.all().delete()
+        self.assertEqual(persister.flush(), 0)
+        self.assertFalse(GameMove.objects.exists())
+
+
+class LocalActiveBoardStoreTestCase(TestCase):
+
+    def test_hibernated_boards_are_restored(self):
+        room = Room.objects.create(name='room', type=Room.RoomTypeChoices.PUBLIC)
+        other_room = Room.objects.create(name='other', type=Room.RoomTypeChoices.PUBLIC)
+        board = start_game(room)
+        start_game(other_room)
+        store = LocalActiveBoardStore(max_size=1, idle_ttl=60)
+        store[room.pk] = board
+        push_moves(board, 3)
+        store.save(room.pk, board)
+
+        # loading the other room hibernates the first one
+        store.get(other_room.pk)
+        game = Game.objects.get(room=room)
+        self.assertEqual((game.custom_fen, game.ply), (board.fen(), 3))
+        restored = store[room.pk]
+        self.assertIsNot(restored, board)
+        self.assertEqual(restored.fen(), board.fen())
+        self.assertEqual(restored.current_turn_player.symbol, board.current_turn_player.symbol)
+
+    def test_finished_games_are_not_restored(self):
+        room = Room.objects.create(name='room', type=Room.RoomTypeChoices.PUBLIC)
+        start_game(room)
+        Game.objects.update(is_finished=True)
+        self.assertNotIn(room.pk, LocalActiveBoardStore(max_size=1, idle_ttl=60))
+
+
+class GameReplayTestCase(TestCase):
+
+    def setUp(self):
+        self.room = Room.objects.create(name='room', type=Room.RoomTypeChoices.PUBLIC)
+        self.board = start_game(self.room)
+        self.persister = GamePersister(interval=60, keyframe_interval=4)
+        self.addCleanup(self.persister.stop)
+
+    def play(self, count: int) -> list:
+        """
+        Plays and logs count moves, returns the positions after every ply, starting with the initial one.
+        """
+        positions = [self.board.fen()]
+        for _ in range(count):
+            owner = self.board.current_turn_player.symbol
+            push_moves(self.board, 1)
+            self.persister.log_move(self.room.pk, self.board, owner)
+            positions.append(self.board.fen())
+        self.persister.mark_dirty(self.room.pk, self.board)
+        self.persister.flush()
+        return positions
+
+    def test_replay_of_every_ply(self):
+        positions = self.play(10)
+        game = Game.objects.get()
+        for ply, fen in enumerate(positions):
+            board = game.replay(ply)
+            self.assertEqual(board.fen(), fen)
+            self.assertEqual(board.ply(), ply)
+        replayed = game.replay()
+        self.assertEqual(replayed.fen(), self.board.fen())
+        self.assertEqual(replayed.current_turn_player.symbol, self.board.current_turn_player.symbol)
+
+    def test_replay_from_the_keyframes(self):
+        positions = self.play(9)
+        game = Game.objects.get()
+        # the moves before the last keyframe are not needed
+        game.moves.filter(ply__lt=8).update(move=0)
+        self.assertEqual(game.replay().fen(), positions[9])
+
+    def test_replay_without_moves(self):
+        self.assertEqual(Game.objects.get().replay().fen(), self.board.fen())
+
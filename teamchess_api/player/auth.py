@@ -1,8 +1,10 @@
+from copy import copy
 from urllib.parse import parse_qs
 from rest_framework.authtoken.models import Token
 from django.contrib.auth.models import AnonymousUser
 from channels.db import database_sync_to_async
 from rest_framework.authentication import TokenAuthentication as DjangoTokenAuthentication, exceptions
+from .token_cache import PLAYER_TOKENS
 
 
 class TokenAuthentication(DjangoTokenAuthentication):
@@ -40,14 +42,25 @@ class RoomWebSocketAuthentication:
             user = AnonymousUser()
         else:
             token = query_dict["token"][0]
-            user = await self.return_user(token)
+            # cached players are trusted until they expire, moves check the seat of the player again
+            user = PLAYER_TOKENS.get(token)
+            if user is None:
+                user = await self.return_user(token)
+            if not isinstance(user, AnonymousUser):
+                # the cached player is shared by every socket of the token
+                user = copy(user)
         
         scope["user"] = user
         return await self.app(scope, receive, send)
 
     @database_sync_to_async
     def return_user(self, token):
+        """
+        Loads the player of the token along with its room in a single query, and caches it.
+        """
         try:
-            return self.token_class.objects.get(key=token).user
+            player = self.token_class.objects.select_related('user__room').get(key=token).user
         except self.token_class.DoesNotExist:
             return AnonymousUser()
+        PLAYER_TOKENS.set(token, player)
+        return player
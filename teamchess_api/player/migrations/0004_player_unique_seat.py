@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-18 11:39
+
+from django.db import migrations, models
+import django.db.models.constraints
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('player', '0003_player_is_online'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='player',
+            constraint=models.UniqueConstraint(deferrable=django.db.models.constraints.Deferrable['IMMEDIATE'], fields=('room', 'player_symbol'), name='unique_room_player_symbol'),
+        ),
+    ]
@@ -1,6 +1,8 @@
 from django.db import models
 from django.dispatch import receiver
 from engine.constants import SYMBOL_COLOR_MAPPING
+from room.snapshot_cache import ROOM_SNAPSHOTS
+from .token_cache import PLAYER_TOKENS
 
 
 class Player(models.Model):
@@ -20,6 +22,16 @@ class Player(models.Model):
     player_symbol = models.CharField(max_length=1)
     is_online = models.BooleanField(default=False)
 
+    class Meta:
+        constraints = [
+            # checked at the end of each statement, so two players can swap seats in a single UPDATE
+            models.UniqueConstraint(
+                fields=('room', 'player_symbol'),
+                name='unique_room_player_symbol',
+                deferrable=models.Deferrable.IMMEDIATE
+            )
+        ]
+
     @property
     def is_authenticated(self):
         return True
@@ -28,3 +40,14 @@ class Player(models.Model):
     @receiver(models.signals.pre_save, sender='player.Player')
     def player_pre_save(sender, instance, **kwargs):
         instance.team = SYMBOL_COLOR_MAPPING[instance.player_symbol]
+
+    @staticmethod
+    @receiver(models.signals.post_save, sender='player.Player')
+    @receiver(models.signals.post_delete, sender='player.Player')
+    def player_changed(sender, instance, **kwargs):
+        ROOM_SNAPSHOTS.bump(instance.room_id)
+
+    @staticmethod
+    @receiver(models.signals.post_delete, sender='player.Player')
+    def player_deleted(sender, instance, **kwargs):
+        PLAYER_TOKENS.invalidate(instance.pk)
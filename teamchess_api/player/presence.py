@@ -0,0 +1,208 @@
+import threading
+import time
+from typing import Dict, Optional
+
+import redis
+from django.conf import settings
+from django.db import models
+from django.utils.module_loading import import_string
+
+from room.snapshot_cache import ROOM_SNAPSHOTS
+from .models import Player
+
+
+class BasePresenceStore:
+    """
+    Tracks the players connected to their room websocket, along with the channel name of their socket, instead of
+    writing Player.is_online and Player.channel_name on every connect and disconnect.
+
+    Each room holds the players with a live socket, every entry expires ttl seconds after the last heartbeat of its
+    socket, so players of a worker that died go offline on their own. A socket replacing another one of the same
+    player takes its entry over, and the replaced socket can no longer refresh or remove it. Players going online or
+    offline bump the room snapshot, expired entries are only noticed when the room is serialized again.
+
+    The Player columns are only written by sync_room, at the game boundaries.
+    """
+
+    def __init__(self, ttl: float = None):
+        self.ttl = settings.PRESENCE_TTL if ttl is None else ttl
+
+    def connect(self, room_id, player_id: int, channel_name: str) -> None:
+        if not self._touch(room_id, player_id, channel_name, replace=True):
+            ROOM_SNAPSHOTS.bump(room_id)
+
+    def heartbeat(self, room_id, player_id: int, channel_name: str) -> None:
+        """
+        Keeps the player online, unless its socket was replaced.
+        """
+        if self._touch(room_id, player_id, channel_name, replace=False) is False:
+            ROOM_SNAPSHOTS.bump(room_id)
+
+    def disconnect(self, room_id, player_id: int, channel_name: str) -> None:
+        """
+        Sets the player offline, unless its socket was replaced.
+        """
+        if self._remove(room_id, player_id, channel_name):
+            ROOM_SNAPSHOTS.bump(room_id)
+
+    def online_players(self, room_id) -> Dict[int, str]:
+        """
+        Returns the channel names of the online players of the room, by player id.
+        """
+        raise NotImplementedError
+
+    def channel_name(self, room_id, player_id: int) -> Optional[str]:
+        return self.online_players(room_id).get(player_id)
+
+    def sync_room(self, room_id) -> None:
+        """
+        Writes the presence of the players of the room to their is_online and channel_name columns, in one UPDATE.
+        """
+        online = self.online_players(room_id)
+        players = Player.objects.filter(room_id=room_id)
+        if not online:
+            players.update(is_online=False, channel_name=None)
+            return
+        players.update(
+            is_online=models.Case(
+                models.When(pk__in=list(online), then=models.Value(True)), default=models.Value(False)
+            ),
+            channel_name=models.Case(
+                *(models.When(pk=player_id, then=models.Value(channel)) for player_id, channel in online.items()),
+                default=None, output_field=models.CharField()
+            )
+        )
+
+    def _touch(self, room_id, player_id: int, channel_name: str, replace: bool) -> Optional[bool]:
+        """
+        Sets the entry of the player to the channel and renews it, returns whether the player was online, or None when
+        the entry belongs to another socket and replace is False, the entry is then left as is.
+        """
+        raise NotImplementedError
+
+    def _remove(self, room_id, player_id: int, channel_name: str) -> bool:
+        """
+        Removes the entry of the player if it belongs to the channel, returns whether it was removed while online.
+        """
+        raise NotImplementedError
+
+
+class LocalPresenceStore(BasePresenceStore):
+    """
+    Keeps the presence in memory of the current process, only the sockets of this process are tracked, so REST
+    requests served by another process don't see them. Meant for development and tests.
+    """
+
+    def __init__(self, ttl: float = None):
+        super().__init__(ttl)
+        self.rooms: Dict[str, Dict[int, tuple]] = {}
+        self._lock = threading.Lock()
+
+    def online_players(self, room_id) -> Dict[int, str]:
+        now = time.time()
+        with self._lock:
+            players = self.rooms.get(str(room_id), {})
+            return {player_id: channel for player_id, (expires_at, channel) in players.items() if expires_at > now}
+
+    def _touch(self, room_id, player_id: int, channel_name: str, replace: bool) -> Optional[bool]:
+        now = time.time()
+        with self._lock:
+            players = self.rooms.setdefault(str(room_id), {})
+            expires_at, channel = players.get(player_id, (0, None))
+            was_online = expires_at > now
+            if was_online and not replace and channel != channel_name:
+                return None
+            players[player_id] = (now + self.ttl, channel_name)
+            return was_online
+
+    def _remove(self, room_id, player_id: int, channel_name: str) -> bool:
+        with self._lock:
+            players = self.rooms.get(str(room_id), {})
+            expires_at, channel = players.get(player_id, (0, None))
+            if channel != channel_name:
+                return False
+            del players[player_id]
+            if not players:
+                del self.rooms[str(room_id)]
+            return expires_at > time.time()
+
+
+class RedisPresenceStore(BasePresenceStore):
+    """
+    Keeps the presence in Redis, in a hash per room of the player ids to the expiry time and channel name of their
+    socket, so the presence is shared by every worker. The hash itself expires ttl seconds after the last heartbeat.
+    """
+    key_prefix = 'presence:'
+
+    # Sets the entry ARGV[1] of the hash to '<ARGV[2] + ARGV[3]>:<ARGV[4]>' (expiry time and channel), unless it
+    # holds another live channel and ARGV[5] is 0, returns 1 when the entry was live, 0 when not and -1 when left.
+    touch_script = """
+        local now = tonumber(ARGV[2])
+        local was_online = 0
+        local entry = redis.call('HGET', KEYS[1], ARGV[1])
+        if entry then
+            local separator = string.find(entry, ':', 1, true)
+            if tonumber(string.sub(entry, 1, separator - 1)) > now then
+                was_online = 1
+                if ARGV[5] == '0' and string.sub(entry, separator + 1) ~= ARGV[4] then
+                    return -1
+                end
+            end
+        end
+        redis.call('HSET', KEYS[1], ARGV[1], string.format('%.3f', now + tonumber(ARGV[3])) .. ':' .. ARGV[4])
+        redis.call('EXPIRE', KEYS[1], math.ceil(tonumber(ARGV[3])))
+        return was_online
+    """
+
+    # Removes the entry ARGV[1] of the hash if it holds the channel ARGV[3], returns 1 when it was live, 0 otherwise.
+    remove_script = """
+        local entry = redis.call('HGET', KEYS[1], ARGV[1])
+        if not entry then
+            return 0
+        end
+        local separator = string.find(entry, ':', 1, true)
+        if string.sub(entry, separator + 1) ~= ARGV[3] then
+            return 0
+        end
+        redis.call('HDEL', KEYS[1], ARGV[1])
+        if tonumber(string.sub(entry, 1, separator - 1)) > tonumber(ARGV[2]) then
+            return 1
+        end
+        return 0
+    """
+
+    def __init__(self, client=None, ttl: float = None):
+        super().__init__(ttl)
+        self.client = client if client is not None else redis.Redis.from_url(settings.REDIS_HOST)
+        self._touch_script = self.client.register_script(self.touch_script)
+        self._remove_script = self.client.register_script(self.remove_script)
+
+    def _key(self, room_id) -> str:
+        return f'{self.key_prefix}{room_id}'
+
+    def online_players(self, room_id) -> Dict[int, str]:
+        now = time.time()
+        online = {}
+        for player_id, entry in self.client.hgetall(self._key(room_id)).items():
+            expires_at, channel = entry.decode().split(':', 1)
+            if float(expires_at) > now:
+                online[int(player_id)] = channel
+        return online
+
+    def _touch(self, room_id, player_id: int, channel_name: str, replace: bool) -> Optional[bool]:
+        args = [player_id, time.time(), self.ttl, channel_name, int(replace)]
+        was_online = self._touch_script(keys=[self._key(room_id)], args=args)
+        return None if was_online == -1 else bool(was_online)
+
+    def _remove(self, room_id, player_id: int, channel_name: str) -> bool:
+        return bool(self._remove_script(keys=[self._key(room_id)], args=[player_id, time.time(), channel_name]))
+
+
+def get_presence_store(backend: Optional[str] = None) -> BasePresenceStore:
+    """
+    Creates the presence store configured by the PRESENCE_BACKEND setting.
+    """
+    return import_string(backend or settings.PRESENCE_BACKEND)()
+
+
+PRESENCE: BasePresenceStore = get_presence_store()
@@ -0,0 +1,121 @@
+"""
+Seat allocation of the players of a room, one seat per player symbol.
+
+Seats are guaranteed unique by the unique (room, player symbol) constraint of Player, so every operation is a single
+conditional statement instead of checking the free seats first, and concurrent joins never share a seat.
+"""
+from typing import Optional, Tuple
+
+from django.db import IntegrityError, connection, models, transaction
+
+from engine.constants import PLAYER_SYMBOLS, SYMBOL_COLOR_MAPPING
+from room.snapshot_cache import ROOM_SNAPSHOTS
+from .models import Player
+from .token_cache import PLAYER_TOKENS
+
+
+class RoomFullError(Exception):
+    pass
+
+
+class SeatChangedError(Exception):
+    """
+    Raised when a seat was taken or left by a concurrent operation.
+    """
+
+
+def take_seat(room, **fields) -> Player:
+    """
+    Creates a player of the room on a free seat, the last free one in PLAYER_SYMBOLS order, with a single INSERT ...
+    SELECT of the free seat. Raises RoomFullError when every seat is taken, a seat taken concurrently is retried on
+    the next free one.
+    """
+    player = Player(room=room, **fields)
+    for _ in PLAYER_SYMBOLS:
+        try:
+            with transaction.atomic():
+                row = _insert_on_free_seat(player)
+        except IntegrityError:
+            continue
+        if row is None:
+            raise RoomFullError(room.pk)
+        player.pk, player.player_symbol, player.team = row
+        player._state.adding = False
+        player._state.db = connection.alias
+        # the insert skips the model signals
+        ROOM_SNAPSHOTS.bump(room.pk)
+        return player
+    raise RoomFullError(room.pk)
+
+
+def _insert_on_free_seat(player: Player) -> Optional[Tuple[int, str, str]]:
+    """
+    Inserts the unsaved player on the last free seat of its room, returns its id, symbol and team, or None when the
+    room is full.
+    """
+    meta = Player._meta
+    fields = [
+        field for field in meta.concrete_fields
+        if not field.primary_key and field.name not in ('player_symbol', 'team')
+    ]
+    room_column, symbol_column, team_column = (meta.get_field(name).column for name in ('room', 'player_symbol', 'team'))
+    columns = [field.column for field in fields] + [symbol_column, team_column]
+    # the seats in order of preference, the last free one in PLAYER_SYMBOLS order first
+    seats = ' UNION ALL '.join(['SELECT %s AS symbol, %s AS team, %s AS position'] * len(PLAYER_SYMBOLS))
+    seat_params = []
+    for position, symbol in enumerate(reversed(PLAYER_SYMBOLS)):
+        seat_params += [symbol, SYMBOL_COLOR_MAPPING[symbol], position]
+
+    quote = connection.ops.quote_name
+    table = meta.db_table
+    sql = (
+        f'INSERT INTO {quote(table)} ({", ".join(quote(column) for column in columns)}) '
+        f'SELECT {", ".join(["%s"] * len(fields))}, seats.symbol, seats.team FROM ({seats}) seats '
+        f'WHERE NOT EXISTS (SELECT 1 FROM {quote(table)} WHERE {quote(room_column)} = %s '
+        f'AND {quote(symbol_column)} = seats.symbol) '
+        f'ORDER BY seats.position LIMIT 1 '
+        f'RETURNING {quote(meta.pk.column)}, {quote(symbol_column)}, {quote(team_column)}'
+    )
+    params = [field.get_db_prep_save(field.pre_save(player, True), connection) for field in fields]
+    params += seat_params + [meta.get_field('room').get_db_prep_value(player.room_id, connection)]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchone()
+
+
+def swap_seat(player: Player, player_symbol: str) -> None:
+    """
+    Moves the player to the seat of the symbol, and the player seated there, if any, to the seat of the player, in
+    a single UPDATE. Raises SeatChangedError when the player was moved by a concurrent swap.
+    """
+    symbol, other_symbol = player_symbol, player.player_symbol
+    # nothing is updated unless the player is still on their seat, so the occupant never moves alone
+    players = Player.objects.filter(room_id=player.room_id).filter(
+        models.Q(pk=player.pk) | models.Q(player_symbol=symbol),
+        models.Exists(Player.objects.filter(pk=player.pk, player_symbol=other_symbol)),
+    )
+    is_player = models.Q(pk=player.pk)
+    try:
+        with transaction.atomic():
+            updated = players.update(
+                player_symbol=models.Case(
+                    models.When(is_player, then=models.Value(symbol)), default=models.Value(other_symbol)
+                ),
+                team=models.Case(
+                    models.When(is_player, then=models.Value(SYMBOL_COLOR_MAPPING[symbol])),
+                    default=models.Value(SYMBOL_COLOR_MAPPING[other_symbol])
+                ),
+            )
+    except IntegrityError:
+        raise SeatChangedError(player.pk)
+    if not updated:
+        raise SeatChangedError(player.pk)
+
+    # the update skips the model signals
+    player.player_symbol, player.team = symbol, SYMBOL_COLOR_MAPPING[symbol]
+    ROOM_SNAPSHOTS.bump(player.room_id)
+    PLAYER_TOKENS.invalidate_room(player.room_id)
+
+
+def free_seat(player: Player) -> None:
+    player.delete()
@@ -1,28 +1,35 @@
-from rest_framework.serializers import ModelSerializer, Serializer
+from rest_framework.serializers import ModelSerializer, Serializer, SerializerMethodField
 from rest_framework.exceptions import ValidationError
 from rest_framework.settings import api_settings
 from .models import Player
+from .presence import PRESENCE
+from .seats import SeatChangedError, free_seat, swap_seat
 from room.models import Room
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
+from room.event_types import PLAYER_SYMBOL_CHANGED
+from room.outbox import EVENT_OUTBOX
+from room.snapshot_cache import ROOM_SNAPSHOTS
 
 
 class PlayerSerializer(ModelSerializer):
 
+    is_online = SerializerMethodField()
+
     class Meta:
         model = Player
         fields = ['id', 'name', 'team', 'player_symbol', 'is_game_manager', 'is_online']
 
+    def get_is_online(self, player):
+        # the presence of a room is read once for all of its players
+        online_players = self.context.setdefault('online_players', {})
+        if player.room_id not in online_players:
+            online_players[player.room_id] = PRESENCE.online_players(player.room_id)
+        return player.pk in online_players[player.room_id]
+
 
 class KickPlayerSerializer(Serializer):
     
     class Meta:
         fields = []
-        
-    @async_to_sync
-    async def disconnect_client_from_websocket(self, channel_name):
-        channel_layer = get_channel_layer()
-        await channel_layer.send(channel_name, {'type': 'player.kicked'})
 
     def validate(self, attrs):
         attrs = super().validate(attrs)
@@ -37,9 +44,10 @@ class KickPlayerSerializer(Serializer):
         return attrs
     
     def update(self, instance, validated_data):
-        if instance.channel_name:
-            self.disconnect_client_from_websocket(instance.channel_name)
-        instance.delete()
+        channel_name = PRESENCE.channel_name(instance.room_id, instance.pk)
+        if channel_name:
+            EVENT_OUTBOX.send(channel_name, {'type': 'player.kicked'})
+        free_seat(instance)
         return {}
 
 
@@ -49,12 +57,7 @@ class ChangePlayerSymbolSerializer(ModelSerializer):
         fields = ['player_symbol']
         model = Player
         extra_kwargs = {'player_symbol': {'write_only': True}}
-    
-    @async_to_sync    
-    async def player_team_change_websocket(self, instance):
-        channel_layer = get_channel_layer()
-        await channel_layer.group_send(str(instance.room_id), {'type': 'player.symbol.changed'})
-        
+
     def update(self, instance, validated_data):
         player_symbol = validated_data.get('player_symbol')
         room_id = instance.room_id
@@ -63,16 +66,12 @@ class ChangePlayerSymbolSerializer(ModelSerializer):
             raise ValidationError({'player_symbol': [f'Player is already assigned to this symbol.']})
 
         try:
-            symbol_current_player = Player.objects.get(room_id=room_id, player_symbol=player_symbol)
-        except Player.DoesNotExist:
-            symbol_current_player = None
-
-        if symbol_current_player is not None:
-            symbol_current_player.player_symbol = instance.player_symbol
-            symbol_current_player.save()
-
-        instance.player_symbol = player_symbol
-        instance.save()
+            swap_seat(instance, player_symbol)
+        except SeatChangedError:
+            raise ValidationError({
+                api_settings.NON_FIELD_ERRORS_KEY: ['Seats were changed by another player, try again.']
+            })
 
-        self.player_team_change_websocket(instance)
+        # serialized once committed, with both symbols changed
+        EVENT_OUTBOX.emit(room_id, PLAYER_SYMBOL_CHANGED, lambda: {'room': ROOM_SNAPSHOTS.get(room_id)})
         return {}
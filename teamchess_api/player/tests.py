@@ -0,0 +1,273 @@
+import time
+from unittest import mock
+
+import fakeredis
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import AnonymousUser
+from django.test import TestCase
+
+from engine.constants import PLAYER_SYMBOLS, SYMBOL_COLOR_MAPPING, SPADE, HEART, DIAMOND, CLUB
+from room.models import Room
+from room.snapshot_cache import ROOM_SNAPSHOTS
+from .auth import RoomWebSocketAuthentication, TokenAuthentication
+from .models import Player
+from .presence import LocalPresenceStore, RedisPresenceStore
+from .seats import RoomFullError, SeatChangedError, take_seat, swap_seat, free_seat
+from .token_cache import PLAYER_TOKENS, PlayerTokenCache
+
+
+class SeatsTestCase(TestCase):
+
+    def setUp(self):
+        self.room = Room.objects.create(name='room', type=Room.RoomTypeChoices.PUBLIC)
+
+    def seats(self):
+        return dict(Player.objects.filter(room=self.room).values_list('name', 'player_symbol'))
+
+    def test_take_seat_fills_the_last_free_seat_first(self):
+        players = [take_seat(self.room, name=f'player {index}') for index in range(len(PLAYER_SYMBOLS))]
+        self.assertEqual([player.player_symbol for player in players], list(reversed(PLAYER_SYMBOLS)))
+        for player in players:
+            self.assertIsNotNone(player.pk)
+            self.assertEqual(player.team, SYMBOL_COLOR_MAPPING[player.player_symbol])
+            stored = Player.objects.get(pk=player.pk)
+            self.assertEqual(stored.room_id, self.room.pk)
+            self.assertEqual((stored.player_symbol, stored.team), (player.player_symbol, player.team))
+
+    def test_take_seat_keeps_the_fields(self):
+        player = take_seat(self.room, name='manager', is_game_manager=True)
+        stored = Player.objects.get(pk=player.pk)
+        self.assertEqual((stored.name, stored.is_game_manager, stored.is_online), ('manager', True, False))
+
+    def test_take_seat_skips_taken_seats(self):
+        Player.objects.create(name='clubs', room=self.room, player_symbol=CLUB)
+        Player.objects.create(name='hearts', room=self.room, player_symbol=HEART)
+        self.assertEqual(take_seat(self.room, name='first').player_symbol, DIAMOND)
+        self.assertEqual(take_seat(self.room, name='second').player_symbol, SPADE)
+
+    def test_take_seat_of_full_room(self):
+        for index in range(len(PLAYER_SYMBOLS)):
+            take_seat(self.room, name=f'player {index}')
+        with self.assertRaises(RoomFullError):
+            take_seat(self.room, name='late')
+        self.assertEqual(Player.objects.filter(room=self.room).count(), len(PLAYER_SYMBOLS))
+
+    def test_take_seat_after_free_seat(self):
+        players = [take_seat(self.room, name=f'player {index}') for index in range(len(PLAYER_SYMBOLS))]
+        free_seat(players[1])
+        self.assertEqual(take_seat(self.room, name='late').player_symbol, players[1].player_symbol)
+
+    def test_take_seat_rooms_are_independent(self):
+        other_room = Room.objects.create(name='other', type=Room.RoomTypeChoices.PUBLIC)
+        take_seat(other_room, name='other')
+        self.assertEqual(take_seat(self.room, name='first').player_symbol, CLUB)
+
+    def test_swap_seat_with_another_player(self):
+        spades = Player.objects.create(name='spades', room=self.room, player_symbol=SPADE)
+        Player.objects.create(name='hearts', room=self.room, player_symbol=HEART)
+        swap_seat(spades, HEART)
+        self.assertEqual((spades.player_symbol, spades.team), (HEART, SYMBOL_COLOR_MAPPING[HEART]))
+        self.assertEqual(self.seats(), {'spades': HEART, 'hearts': SPADE})
+        teams = dict(Player.objects.filter(room=self.room).values_list('name', 'team'))
+        self.assertEqual(teams, {'spades': SYMBOL_COLOR_MAPPING[HEART], 'hearts': SYMBOL_COLOR_MAPPING[SPADE]})
+
+    def test_swap_seat_to_a_free_seat(self):
+        spades = Player.objects.create(name='spades', room=self.room, player_symbol=SPADE)
+        swap_seat(spades, CLUB)
+        self.assertEqual(self.seats(), {'spades': CLUB})
+        self.assertEqual(Player.objects.get(pk=spades.pk).team, SYMBOL_COLOR_MAPPING[CLUB])
+
+    def test_swap_seat_of_a_moved_player(self):
+        spades = Player.objects.create(name='spades', room=self.room, player_symbol=SPADE)
+        Player.objects.create(name='hearts', room=self.room, player_symbol=HEART)
+        Player.objects.create(name='diamonds', room=self.room, player_symbol=DIAMOND)
+        stale = Player.objects.get(pk=spades.pk)
+        swap_seat(spades, HEART)
+        # the stale copy still sits on the seat of spades, which now belongs to hearts
+        with self.assertRaises(SeatChangedError):
+            swap_seat(stale, DIAMOND)
+        self.assertEqual(self.seats(), {'spades': HEART, 'hearts': SPADE, 'diamonds': DIAMOND})
+
+    def test_swap_seat_of_a_player_who_left(self):
+        spades = Player.objects.create(name='spades', room=self.room, player_symbol=SPADE)
+        Player.objects.create(name='hearts', room=self.room, player_symbol=HEART)
+        Player.objects.filter(pk=spades.pk).delete()
+        with self.assertRaises(SeatChangedError):
+            swap_seat(spades, HEART)
+        self.assertEqual(self.seats(), {'hearts': HEART})
+
+
+class PlayerTokenCacheTestCase(TestCase):
+
+    def setUp(self):
+        self.room = Room.objects.create(name='room', type=Room.RoomTypeChoices.PUBLIC)
+        self.players = [take_seat(self.room, name=f'player {index}') for index in range(2)]
+
+    def test_entries_expire(self):
+        cache = PlayerTokenCache(ttl=30, max_size=10)
+        with mock.patch('player.token_cache.time.monotonic', return_value=100):
+            cache.set('token', self.players[0])
+        with mock.patch('player.token_cache.time.monotonic', return_value=130):
+            self.assertIs(cache.get('token'), self.players[0])
+        with mock.patch('player.token_cache.time.monotonic', return_value=131):
+            self.assertIsNone(cache.get('token'))
+        self.assertEqual((cache.entries, cache.keys_by_player), ({}, {}))
+
+    def test_least_recently_set_entries_are_evicted(self):
+        cache = PlayerTokenCache(ttl=30, max_size=1)
+        cache.set('first', self.players[0])
+        cache.set('second', self.players[1])
+        self.assertIsNone(cache.get('first'))
+        self.assertIs(cache.get('second'), self.players[1])
+        self.assertEqual(cache.keys_by_player, {self.players[1].pk: 'second'})
+
+    def test_invalidation(self):
+        cache = PlayerTokenCache(ttl=30, max_size=10)
+        other_room = Room.objects.create(name='other', type=Room.RoomTypeChoices.PUBLIC)
+        other_player = take_seat(other_room, name='other')
+        for index, player in enumerate(self.players + [other_player]):
+            cache.set(f'token {index}', player)
+        cache.invalidate(self.players[0].pk)
+        self.assertIsNone(cache.get('token 0'))
+        cache.invalidate_room(self.room.pk)
+        self.assertIsNone(cache.get('token 1'))
+        self.assertIs(cache.get('token 2'), other_player)
+
+    def test_players_are_invalidated_when_they_change(self):
+        tokens = [TokenAuthentication().generate_token(player).key for player in self.players]
+        for token, player in zip(tokens, self.players):
+            PLAYER_TOKENS.set(token, player)
+        self.addCleanup(PLAYER_TOKENS.invalidate_room, self.room.pk)
+
+        swap_seat(self.players[0], SPADE)
+        self.assertEqual([PLAYER_TOKENS.get(token) for token in tokens], [None, None])
+        PLAYER_TOKENS.set(tokens[0], self.players[0])
+        self.players[0].delete()
+        self.assertIsNone(PLAYER_TOKENS.get(tokens[0]))
+
+
+class RoomWebSocketAuthenticationTestCase(TestCase):
+
+    def setUp(self):
+        self.room = Room.objects.create(name='room', type=Room.RoomTypeChoices.PUBLIC)
+        self.player = take_seat(self.room, name='player')
+        self.token = TokenAuthentication().generate_token(self.player).key
+        self.addCleanup(PLAYER_TOKENS.invalidate_room, self.room.pk)
+
+    def authenticate(self, query_string: str):
+        scopes = []
+
+        async def app(scope, receive, send):
+            scopes.append(scope)
+
+        async_to_sync(RoomWebSocketAuthentication(app))({'query_string': query_string.encode()}, None, None)
+        return scopes[0]['user']
+
+    def test_player_is_loaded_with_its_room(self):
+        with self.assertNumQueries(1):
+            user = self.authenticate(f'token={self.token}')
+            self.assertEqual(user.room.name, 'room')
+        self.assertEqual(user, self.player)
+
+    def test_cached_players_are_trusted(self):
+        first = self.authenticate(f'token={self.token}')
+        with self.assertNumQueries(0):
+            second = self.authenticate(f'token={self.token}')
+            self.assertEqual(second.room.name, 'room')
+        self.assertEqual(second, self.player)
+        # every socket gets its own copy of the cached player
+        self.assertIsNot(second, first)
+        self.assertIsNot(second, PLAYER_TOKENS.get(self.token))
+
+    def test_invalid_tokens(self):
+        self.assertIsInstance(self.authenticate(''), AnonymousUser)
+        self.assertIsInstance(self.authenticate('token=invalid'), AnonymousUser)
+        self.assertIsNone(PLAYER_TOKENS.get('invalid'))
+
+
+class LocalPresenceStoreTestCase(TestCase):
+
+    def setUp(self):
+        self.room = Room.objects.create(name='room', type=Room.RoomTypeChoices.PUBLIC)
+        self.players = [take_seat(self.room, name=f'player {index}') for index in range(2)]
+        bump = mock.patch.object(ROOM_SNAPSHOTS, 'bump')
+        self.bump = bump.start()
+        self.addCleanup(bump.stop)
+
+    def store(self):
+        return LocalPresenceStore(ttl=60)
+
+    def later(self, seconds: float):
+        return mock.patch('player.presence.time.time', return_value=time.time() + seconds)
+
+    def test_connect_and_disconnect(self):
+        store, player = self.store(), self.players[0]
+        store.connect(self.room.pk, player.pk, 'channel')
+        self.assertEqual(store.online_players(self.room.pk), {player.pk: 'channel'})
+        self.assertEqual(store.channel_name(self.room.pk, player.pk), 'channel')
+        store.heartbeat(self.room.pk, player.pk, 'channel')
+        self.assertEqual(self.bump.call_count, 1)
+
+        store.disconnect(self.room.pk, player.pk, 'channel')
+        self.assertEqual(store.online_players(self.room.pk), {})
+        self.assertIsNone(store.channel_name(self.room.pk, player.pk))
+        self.assertEqual(self.bump.call_count, 2)
+
+    def test_replaced_sockets_are_ignored(self):
+        store, player = self.store(), self.players[0]
+        store.connect(self.room.pk, player.pk, 'old')
+        store.connect(self.room.pk, player.pk, 'new')
+        self.assertEqual(self.bump.call_count, 1)
+        store.heartbeat(self.room.pk, player.pk, 'old')
+        store.disconnect(self.room.pk, player.pk, 'old')
+        self.assertEqual(store.online_players(self.room.pk), {player.pk: 'new'})
+        self.assertEqual(self.bump.call_count, 1)
+
+    def test_entries_expire_without_heartbeats(self):
+        store, player = self.store(), self.players[0]
+        store.connect(self.room.pk, player.pk, 'channel')
+        with self.later(30):
+            store.heartbeat(self.room.pk, player.pk, 'channel')
+        with self.later(89):
+            self.assertEqual(store.online_players(self.room.pk), {player.pk: 'channel'})
+        with self.later(91):
+            self.assertEqual(store.online_players(self.room.pk), {})
+            # a socket of an expired entry takes it back, the player is online again
+            store.heartbeat(self.room.pk, player.pk, 'other')
+            self.assertEqual(store.online_players(self.room.pk), {player.pk: 'other'})
+        self.assertEqual(self.bump.call_count, 2)
+
+    def test_rooms_are_independent(self):
+        store, player = self.store(), self.players[0]
+        other_room = Room.objects.create(name='other', type=Room.RoomTypeChoices.PUBLIC)
+        store.connect(self.room.pk, player.pk, 'channel')
+        self.assertEqual(store.online_players(other_room.pk), {})
+
+    def test_sync_room(self):
+        store, online, offline = self.store(), self.players[0], self.players[1]
+        Player.objects.filter(pk=offline.pk).update(is_online=True, channel_name='stale')
+        store.connect(self.room.pk, online.pk, 'channel')
+        store.sync_room(self.room.pk)
+        columns = Player.objects.order_by('pk').values_list('is_online', 'channel_name')
+        self.assertEqual(list(columns), [(True, 'channel'), (False, None)])
+
+        store.disconnect(self.room.pk, online.pk, 'channel')
+        store.sync_room(self.room.pk)
+        self.assertFalse(Player.objects.filter(is_online=True).exists())
+
+
+class RedisPresenceStoreTestCase(LocalPresenceStoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client = fakeredis.FakeRedis()
+
+    def store(self):
+        return RedisPresenceStore(client=self.client, ttl=60)
+
+    def test_rooms_expire(self):
+        store = self.store()
+        store.connect(self.room.pk, self.players[0].pk, 'channel')
+        self.assertTrue(0 < self.client.ttl(store._key(self.room.pk)) <= 60)
+
@@ -0,0 +1,61 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from django.conf import settings
+
+
+class PlayerTokenCache:
+    """
+    A short-lived in-process cache of token keys to their player, loaded along with its room, so websocket reconnects
+    don't query the token, the player and the room again.
+
+    Entries expire ttl seconds after they were cached, and players are invalidated when they are deleted (kicked) or
+    their symbol changes, in the process that changed them. Other processes don't see the invalidation and keep the
+    cached player until it expires. Cached players are shared, callers must copy them before changing them.
+    """
+
+    def __init__(self, ttl: float = None, max_size: int = None):
+        self.ttl = settings.WEBSOCKET_AUTH_CACHE_TTL if ttl is None else ttl
+        self.max_size = settings.WEBSOCKET_AUTH_CACHE_MAX_SIZE if max_size is None else max_size
+        self.entries: 'OrderedDict[str, Tuple[float, object]]' = OrderedDict()
+        self.keys_by_player: Dict[int, str] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[object]:
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                self._pop(key)
+                return None
+            return entry[1]
+
+    def set(self, key: str, player) -> None:
+        with self._lock:
+            self.entries[key] = (time.monotonic() + self.ttl, player)
+            self.entries.move_to_end(key)
+            self.keys_by_player[player.pk] = key
+            while len(self.entries) > self.max_size:
+                self._pop(next(iter(self.entries)))
+
+    def invalidate(self, player_id: int) -> None:
+        with self._lock:
+            key = self.keys_by_player.get(player_id)
+            if key is not None:
+                self._pop(key)
+
+    def invalidate_room(self, room_id) -> None:
+        with self._lock:
+            for key in [key for key, (_, player) in self.entries.items() if player.room_id == room_id]:
+                self._pop(key)
+
+    def _pop(self, key: str) -> None:
+        _, player = self.entries.pop(key)
+        if self.keys_by_player.get(player.pk) == key:
+            del self.keys_by_player[player.pk]
+
+
+PLAYER_TOKENS = PlayerTokenCache()
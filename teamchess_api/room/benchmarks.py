@@ -0,0 +1,124 @@
+"""
+Micro-benchmarks of the JSON codecs and the msgpack subprotocol over representative room websocket payloads.
+
+Run from the project root with:
+    python -m room.benchmarks [--rounds N]
+"""
+import argparse
+import json
+import random
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict
+
+import django
+from django.conf import settings
+
+# the codecs only need DRF's encoder, not the project settings
+if not settings.configured:
+    settings.configure()
+    django.setup()
+
+from engine.board import TeamChessBoard
+from engine.constants import PLAYER_SYMBOLS, SYMBOL_COLOR_MAPPING
+from teamchess_api.json_codecs import OrjsonCodec, StdlibJsonCodec, orjson
+from .msgpack_protocol import encode_frame, decode_frame
+
+
+def build_payloads(seed: int = 0) -> Dict[str, Dict[str, Any]]:
+    """
+    Builds the room events as sent to clients: a player joining a room, the game start with the room and its 32
+    pieces, and a move delta.
+    """
+    random.seed(seed)
+    board = TeamChessBoard()
+    room_id = str(uuid.UUID(int=random.getrandbits(128)))
+    room = {
+        'id': room_id,
+        'name': 'Friday night team chess',
+        'type': 'public',
+        'status': 'in_game',
+        'created_at': datetime(2024, 8, 3, 22, 46, tzinfo=timezone.utc).isoformat().replace('+00:00', 'Z'),
+        'players': [
+            {
+                'id': index + 1, 'name': f'player {index + 1}', 'team': SYMBOL_COLOR_MAPPING[symbol],
+                'player_symbol': symbol, 'is_game_manager': index == 0, 'is_online': True
+            }
+            for index, symbol in enumerate(PLAYER_SYMBOLS)
+        ],
+        'game': {'id': 1, 'fen': board.get_original_fen(), 'custom_fen': board.fen(), 'is_finished': False},
+    }
+    seq = int(time.time() * 1000)
+    return {
+        'player_joined_room': {'message': 'player_joined_room', 'data': {'room': room}, 'seq': seq},
+        'game_started': {'message': 'game_started', 'data': {'room': room, 'pieces': board.get_pieces()}, 'seq': seq},
+        'move_made': {
+            'message': 'move_made',
+            'data': {'from': 'e2', 'to': 'e4', 'promotion': None, 'owner': PLAYER_SYMBOLS[0], 'next': PLAYER_SYMBOLS[1],
+                     'seq': 1},
+            'seq': seq
+        },
+    }
+
+
+def _microseconds(function: Callable, argument: Any, rounds: int) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        function(argument)
+    return (time.perf_counter() - start) / rounds * 1e6
+
+
+def bench_codecs(payloads: Dict[str, Dict[str, Any]], rounds: int) -> None:
+    """
+    Compares the json.dumps and json.loads defaults channels uses for send_json with each available codec.
+    """
+    codecs = {'channels default': None, 'stdlib': StdlibJsonCodec()}
+    if orjson is not None:
+        codecs['orjson'] = OrjsonCodec()
+    else:
+        print('orjson is not installed, skipping OrjsonCodec')
+
+    for name, payload in payloads.items():
+        print(f'{name}:')
+        baseline = None
+        for codec_name, codec in codecs.items():
+            encode = json.dumps if codec is None else codec.encode_text
+            decode = json.loads if codec is None else codec.decode
+            text = encode(payload)
+            assert decode(text) == payload
+            encode_time = _microseconds(encode, payload, rounds)
+            decode_time = _microseconds(decode, text, rounds)
+            size = len(text.encode())
+            baseline = baseline or (encode_time, decode_time)
+            print(
+                f'    {codec_name:<17} encode {encode_time:>8.2f}us ({baseline[0] / encode_time:>5.2f}x)  '
+                f'decode {decode_time:>8.2f}us ({baseline[1] / decode_time:>5.2f}x)  {size:>6,} bytes'
+            )
+
+
+def bench_msgpack_protocol(payloads: Dict[str, Dict[str, Any]], rounds: int) -> None:
+    """
+    Compares the compact msgpack frames of the binary subprotocol with the JSON frames of the default codec.
+    """
+    codec = OrjsonCodec() if orjson is not None else StdlibJsonCodec()
+    print(f'msgpack subprotocol against {type(codec).__name__}:')
+    for name, payload in payloads.items():
+        text = codec.encode_text(payload)
+        frame = encode_frame(payload)
+        json_size = len(text.encode())
+        print(
+            f'    {name:<19} encode {_microseconds(encode_frame, payload, rounds):>8.2f}us  '
+            f'decode {_microseconds(decode_frame, frame, rounds):>8.2f}us  '
+            f'{len(frame):>6,} bytes ({len(frame) / json_size:.0%} of {json_size:,})'
+        )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=20000)
+    args = parser.parse_args()
+
+    payloads = build_payloads()
+    bench_codecs(payloads, args.rounds)
+    bench_msgpack_protocol(payloads, args.rounds)
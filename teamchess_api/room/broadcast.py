@@ -0,0 +1,37 @@
+from typing import Any, Dict
+
+from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
+
+from teamchess_api.json_codecs import get_json_codec
+from game.active_boards import ACTIVE_BOARDS
+from .event_buffer import ROOM_EVENTS
+from .event_types import SNAPSHOT
+from .msgpack_protocol import encode_frame
+from .snapshot_cache import ROOM_SNAPSHOTS
+
+
+async def emit_to_room(room_id, message: str, data: Any) -> int:
+    """
+    Buffers the event in the room event buffer, encodes it once in each websocket protocol along with its sequence
+    number, and sends the encoded frames to every consumer of the room, which forward the one of their protocol as
+    is. Returns the sequence number of the event.
+    """
+    seq = await sync_to_async(ROOM_EVENTS.append)(room_id, {'message': message, 'data': data})
+    content = {'message': message, 'data': data, 'seq': seq}
+    frames = {'text': get_json_codec().encode_text(content), 'bytes': encode_frame(content)}
+    # the room lets the spectator hubs, which watch several rooms from a single channel, dispatch the frames
+    await get_channel_layer().group_send(str(room_id), {'type': 'emit.message', 'room': str(room_id), **frames})
+    return seq
+
+
+def build_snapshot(room_id, seq: int) -> Dict[str, Any]:
+    """
+    Builds a snapshot event of the room as of the given sequence number: the serialized room and the pieces on its
+    board, or None when the game has not started.
+    """
+    try:
+        pieces = ACTIVE_BOARDS[room_id].get_pieces()
+    except KeyError:
+        pieces = None
+    return {'message': SNAPSHOT, 'data': {'room': ROOM_SNAPSHOTS.get(room_id), 'pieces': pieces}, 'seq': seq}
@@ -1,17 +1,78 @@
-from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from urllib.parse import parse_qs
+from typing import Optional
+from asgiref.sync import sync_to_async
+import asyncio
+import logging
+from django.conf import settings
+from channels.generic.websocket import AsyncJsonWebsocketConsumer, AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from django.contrib.auth.models import AnonymousUser
-from game.active_boards import ACTIVE_BOARDS
+from rest_framework.exceptions import ValidationError
+from rest_framework.settings import api_settings
+from teamchess_api.json_codecs import get_json_codec
+from game.serializers import MakeMoveSerializer
+from player.models import Player
+from player.presence import PRESENCE
+from .broadcast import build_snapshot, emit_to_room
+from .event_types import PLAYER_SYMBOL_CHANGED, GAME_STARTED, MOVE_MADE, SNAPSHOT
+from .event_buffer import ROOM_EVENTS
+from .matchmaking import MATCHMAKING_QUEUE, ticket_group
 from .models import Room
-from .serializers import RetrieveRoomSerializer
+from .msgpack_protocol import SUBPROTOCOL, encode_frame, decode_frame
+from .snapshot_cache import ROOM_SNAPSHOTS
+from .spectators import SPECTATOR_HUB
+
+logger = logging.getLogger(__name__)
 
 
 class RoomConsumer(AsyncJsonWebsocketConsumer):
     PLAYER_JOINED_ROOM = 'player_joined_room'
+    PLAYER_RECONNECTED = 'player_reconnected'
     PLAYER_DISCONNECTED = 'player_disconnected'
     PLAYER_KICKED = 'player_kicked'
-    PLAYER_SYMBOL_CHANGED = 'player_symbol_changed'
-    GAME_STARTED = 'game_started'
+    PLAYER_SYMBOL_CHANGED = PLAYER_SYMBOL_CHANGED
+    GAME_STARTED = GAME_STARTED
+    MOVE_MADE = MOVE_MADE
+    MOVE_REJECTED = 'move_rejected'
+    SNAPSHOT = SNAPSHOT
+
+    # Types of messages received from clients
+    MOVE = 'move'
+
+    # Whether the client negotiated the binary msgpack subprotocol rather than JSON text frames
+    binary = False
+
+    heartbeat_task = None
+
+    @classmethod
+    async def decode_json(cls, text_data):
+        return get_json_codec().decode(text_data)
+
+    @classmethod
+    async def encode_json(cls, content):
+        return get_json_codec().encode_text(content)
+
+    async def receive(self, text_data=None, bytes_data=None, **kwargs):
+        try:
+            if self.binary and bytes_data is not None:
+                content = decode_frame(bytes_data)
+            elif text_data is not None:
+                content = await self.decode_json(text_data)
+            else:
+                raise ValueError('unexpected binary frame')
+        except (ValueError, TypeError):
+            # malformed frames are rejected to the sender rather than closing the socket
+            await self.send_json({
+                'message': self.MOVE_REJECTED, 'data': {api_settings.NON_FIELD_ERRORS_KEY: ['Malformed message.']}
+            })
+            return
+        await self.receive_json(content, **kwargs)
+
+    async def send_json(self, content, close=False):
+        if self.binary:
+            await self.send(bytes_data=encode_frame(content), close=close)
+        else:
+            await super().send_json(content, close=close)
 
     async def add_client_to_room(self):
         await self.channel_layer.group_add(str(self.room_id), self.channel_name)
@@ -20,41 +81,76 @@ class RoomConsumer(AsyncJsonWebsocketConsumer):
         await self.channel_layer.group_discard(str(self.room_id), self.channel_name)
         
     async def emit_to_group(self, content):
-        await self.channel_layer.group_send(str(self.room_id), {**content, 'type': 'emit.message'})
+        await emit_to_room(self.room_id, content['message'], content['data'])
 
     async def emit_message(self, event):
-        await self.send_json({'message': event['message'], 'data': event['data']})
+        # already encoded once by the sender for every consumer of the room
+        if self.binary:
+            await self.send(bytes_data=event['bytes'])
+        else:
+            await self.send(text_data=event['text'])
 
-    @database_sync_to_async
-    def set_player_channel_name(self):
-        user = self.scope['user']
-        user.channel_name = self.channel_name
-        user.is_online = True
-        return user.save()
+    def get_last_seq(self) -> Optional[int]:
+        """
+        The sequence number of the last event a reconnecting client saw, passed as the seq query parameter.
+        """
+        query_dict = parse_qs(self.scope['query_string'].decode())
+        try:
+            return int(query_dict['seq'][0])
+        except (KeyError, ValueError):
+            return None
+
+    async def catch_up(self, last_seq: int) -> bool:
+        """
+        Sends the events the client missed since last_seq, or a snapshot of the room when they are no longer buffered.
+        Returns whether the client was caught up from the buffer. Events may be received twice around the reconnect,
+        clients drop the ones with a sequence number they already saw.
+        """
+        seq, events = await sync_to_async(ROOM_EVENTS.since)(self.room_id, last_seq)
+        if events is None:
+            await self.send_json(await database_sync_to_async(build_snapshot)(self.room_id, seq))
+            return False
+
+        for event in events:
+            await self.send_json(event)
+        return True
 
     @database_sync_to_async
-    def delete_player(self):
+    def set_player_channel_name(self):
         user = self.scope['user']
-        return user.delete()
+        PRESENCE.connect(user.room_id, user.pk, self.channel_name)
 
     @database_sync_to_async
     def serialize_room(self):
-        room = Room.objects.prefetch_related('players').get(id=self.room_id)
-        return RetrieveRoomSerializer(room).data
+        return ROOM_SNAPSHOTS.get(self.room_id)
 
     @database_sync_to_async
     def set_user_offline(self):
         user = self.scope['user']
-        user.is_online = False
-        return user.save()
+        if not isinstance(user, AnonymousUser):
+            PRESENCE.disconnect(user.room_id, user.pk, self.channel_name)
 
-    @database_sync_to_async
-    def get_user_room(self):
-        return self.scope['user'].room
+    async def send_heartbeats(self):
+        """
+        Keeps the player online while the socket is open, the presence expires PRESENCE_TTL seconds after the last
+        heartbeat.
+        """
+        user = self.scope['user']
+        heartbeat = database_sync_to_async(PRESENCE.heartbeat)
+        while True:
+            await asyncio.sleep(settings.PRESENCE_HEARTBEAT_INTERVAL)
+            await heartbeat(user.room_id, user.pk, self.channel_name)
 
-    def get_pieces(self):
-        board = ACTIVE_BOARDS[self.room_id]
-        return board.get_pieces()
+    @database_sync_to_async
+    def apply_move(self, content):
+        player = self.scope['user']
+        # the symbol of the player changes when seats are swapped while the socket is open
+        player.player_symbol = Player.objects.filter(pk=player.pk).values_list('player_symbol', flat=True).first()
+        if player.player_symbol is None:
+            raise ValidationError({api_settings.NON_FIELD_ERRORS_KEY: ['Player has left the room.']})
+        serializer = MakeMoveSerializer(data=content, context={'room_id': self.room_id, 'player': player})
+        serializer.is_valid(raise_exception=True)
+        return serializer.save()
 
     async def close(self, code=None, reason=None):
         await self.set_user_offline()
@@ -64,19 +160,33 @@ class RoomConsumer(AsyncJsonWebsocketConsumer):
         user = self.scope['user']
         if isinstance(user, AnonymousUser):
             await self.close(code=3000, reason='Token invalid or session expired')
+            return
 
         self.room_id = self.scope['url_route']['kwargs']['pk']
-        room = await self.get_user_room()
-        if room.id != self.room_id:
+        # the room is loaded along with the player by RoomWebSocketAuthentication
+        if user.room_id != self.room_id:
             await self.close(code=3003, reason='Player room does not match this room')
+            return
 
         # TODO: uncomment this line when going live, its annoying right now
         # if user.is_online:
         #     await self.close(code=3003, reason='Player already online on different client')
 
-        await self.accept()
+        if SUBPROTOCOL in self.scope['subprotocols']:
+            self.binary = True
+            await self.accept(SUBPROTOCOL)
+        else:
+            await self.accept()
         await self.add_client_to_room()
         await self.set_player_channel_name()
+        self.heartbeat_task = asyncio.create_task(self.send_heartbeats())
+
+        # A reconnecting client caught up from the buffer already has the room, the others only need to know it is back
+        last_seq = self.get_last_seq()
+        if last_seq is not None and await self.catch_up(last_seq):
+            await self.emit_to_group({'message': self.PLAYER_RECONNECTED, 'data': {'player': user.id}})
+            return
+
         await self.emit_to_group(
             {
                 'message': self.PLAYER_JOINED_ROOM,
@@ -84,7 +194,26 @@ class RoomConsumer(AsyncJsonWebsocketConsumer):
             }
         )
     
+    async def receive_json(self, content, **kwargs):
+        if isinstance(content, dict) and content.get('type') == self.MOVE:
+            await self.make_move(content)
+
+    async def make_move(self, content):
+        """
+        Applies a move of the client's player (``{"type": "move", "uci": "e2e4"}``) and broadcasts only the move delta
+        to the room, the move is rejected to the sender alone.
+        """
+        try:
+            delta = await self.apply_move(content)
+        except ValidationError as e:
+            await self.send_json({'message': self.MOVE_REJECTED, 'data': e.detail})
+            return
+
+        await self.emit_to_group({'message': self.MOVE_MADE, 'data': delta})
+
     async def disconnect(self, code):
+        if self.heartbeat_task is not None:
+            self.heartbeat_task.cancel()
         await self.remove_client_from_room()
         await self.close(code=code)
         await self.emit_to_group(
@@ -103,23 +232,136 @@ class RoomConsumer(AsyncJsonWebsocketConsumer):
         )
         await self.remove_client_from_room()
         await self.close(code=1000, reason=self.PLAYER_KICKED)
-        await self.delete_player()
 
-    async def player_symbol_changed(self, event):
-        await self.send_json(
-            {
-                'message': self.PLAYER_SYMBOL_CHANGED,
-                'data': {'room': await self.serialize_room()}
-            }
-        )
 
-    async def game_started(self, event):
-        await self.send_json(
-            {
-                'message': self.GAME_STARTED,
-                'data': {
-                    'room': await self.serialize_room(),
-                    'pieces': self.get_pieces()
-                }
-            }
-        )
+class SpectatorConsumer(AsyncWebsocketConsumer):
+    """
+    Read-only socket streaming the events of a public room to a spectator, which receives a snapshot of the room
+    first. Spectators negotiate the same protocols as room members.
+
+    Sockets subscribe to the spectator hub of their worker rather than to the room group, and send the frames pushed
+    by the hub at most once every SPECTATOR_SEND_INTERVAL seconds. A spectator too slow to keep up with the room, with
+    more than SPECTATOR_MAX_BACKLOG frames pending, has its backlog coalesced into a fresh snapshot.
+    """
+    binary = False
+
+    @database_sync_to_async
+    def is_public_room(self):
+        return Room.objects.filter(id=self.room_id, type=Room.RoomTypeChoices.PUBLIC).exists()
+
+    async def connect(self):
+        self.room_id = self.scope['url_route']['kwargs']['pk']
+        if not await self.is_public_room():
+            await self.close(code=3003)
+            return
+
+        if SUBPROTOCOL in self.scope['subprotocols']:
+            self.binary = True
+            await self.accept(SUBPROTOCOL)
+        else:
+            await self.accept()
+
+        self.pending = []
+        self.resync = True
+        self.wakeup = asyncio.Event()
+        self.wakeup.set()
+        self.sender = asyncio.create_task(self.send_frames())
+        await SPECTATOR_HUB.subscribe(self.room_id, self)
+
+    def push(self, event):
+        if self.resync:
+            # the snapshot about to be sent covers the event
+            return
+        if len(self.pending) >= settings.SPECTATOR_MAX_BACKLOG:
+            self.pending.clear()
+            self.resync = True
+        else:
+            self.pending.append(event['bytes'] if self.binary else event['text'])
+        self.wakeup.set()
+
+    async def send_snapshot(self):
+        # only the current sequence number of the room is needed
+        seq, _ = await sync_to_async(ROOM_EVENTS.since)(self.room_id, 0)
+        snapshot = await database_sync_to_async(build_snapshot)(self.room_id, seq)
+        if self.binary:
+            await self.send(bytes_data=encode_frame(snapshot))
+        else:
+            await self.send(text_data=get_json_codec().encode_text(snapshot))
+
+    async def send_frames(self):
+        """
+        Sends the pending frames, or a snapshot when resyncing, then waits for the send interval and the next frames.
+        Frames received while the snapshot is built may be older than the snapshot, spectators drop them by sequence.
+        A failed send is logged and the spectator resyncs with a snapshot on the next round.
+        """
+        while True:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+            try:
+                if self.resync:
+                    self.resync = False
+                    self.pending.clear()
+                    await self.send_snapshot()
+
+                frames, self.pending = self.pending, []
+                for frame in frames:
+                    if self.binary:
+                        await self.send(bytes_data=frame)
+                    else:
+                        await self.send(text_data=frame)
+            except Exception:
+                logger.exception('failed to send the room events to a spectator')
+                self.resync = True
+                self.wakeup.set()
+            await asyncio.sleep(settings.SPECTATOR_SEND_INTERVAL)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        # spectators are read-only
+        pass
+
+    async def disconnect(self, code):
+        if hasattr(self, 'sender'):
+            self.sender.cancel()
+            await SPECTATOR_HUB.unsubscribe(self.room_id, self)
+
+
+class MatchmakingConsumer(AsyncJsonWebsocketConsumer):
+    """
+    Waits for the match of a matchmaking ticket, sends it (``{"message": "matched", "data": {"room_id": ...,
+    "player_id": ..., "token": ...}}``) and closes. Closing the socket before the match is sent cancels the ticket.
+    """
+    MATCHED = 'matched'
+
+    matched = False
+
+    @classmethod
+    async def encode_json(cls, content):
+        return get_json_codec().encode_text(content)
+
+    async def connect(self):
+        self.ticket = self.scope['url_route']['kwargs']['ticket']
+        await self.accept()
+        await self.channel_layer.group_add(ticket_group(self.ticket), self.channel_name)
+
+        # the ticket may have been matched before the socket connected
+        result = await sync_to_async(MATCHMAKING_QUEUE.get_result)(self.ticket)
+        if result is not None:
+            await self.send_match(result)
+
+    async def matchmaking_matched(self, event):
+        await self.send_match(event['result'])
+
+    async def send_match(self, result):
+        if self.matched:
+            return
+        self.matched = True
+        # the seat of a match not claimed in time is freed
+        if not await sync_to_async(MATCHMAKING_QUEUE.claim)(self.ticket):
+            await self.close(code=3008, reason='Match expired')
+            return
+        await self.send_json({'message': self.MATCHED, 'data': result}, close=True)
+
+    async def disconnect(self, code):
+        await self.channel_layer.group_discard(ticket_group(self.ticket), self.channel_name)
+        if not self.matched:
+            await sync_to_async(MATCHMAKING_QUEUE.cancel)(self.ticket)
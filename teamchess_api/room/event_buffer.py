@@ -0,0 +1,139 @@
+import redis
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from teamchess_api.json_codecs import get_json_codec
+from teamchess_api.lru_cache import LRUCache
+
+# The events missed since a sequence number, None when they are no longer buffered and a snapshot is needed.
+MissedEvents = Tuple[int, Optional[List[Dict[str, Any]]]]
+
+
+def _first_seq() -> int:
+    """
+    Sequences of new buffers start from the current time in milliseconds rather than from 1, so a buffer that was
+    evicted or expired and created again never reuses the sequence numbers clients saw from the previous one.
+    """
+    return int(time.time() * 1000)
+
+
+class BaseRoomEventBuffer:
+    """
+    Keeps the last events emitted to each room, numbered by a per room sequence, so reconnecting clients only receive
+    the events they missed since the last sequence number they saw.
+
+    Events are dicts holding the message and data sent to clients, appending one returns its sequence number.
+    """
+
+    def __init__(self, size: int = None, ttl: int = None):
+        self.size = settings.ROOM_EVENTS_BUFFER_SIZE if size is None else size
+        self.ttl = settings.ROOM_EVENTS_TTL if ttl is None else ttl
+
+    def append(self, room_id, event: Dict[str, Any]) -> int:
+        raise NotImplementedError
+
+    def since(self, room_id, seq: int) -> MissedEvents:
+        """
+        Returns the current sequence number of the room and the events after the given sequence number, or None
+        instead of the events when some of them are no longer buffered.
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def _missed(current_seq: int, events: List[Dict[str, Any]], seq: int) -> MissedEvents:
+        first_seq = events[0]['seq'] if events else current_seq + 1
+        if seq > current_seq or seq < first_seq - 1:
+            return current_seq, None
+        return current_seq, [event for event in events if event['seq'] > seq]
+
+
+class LocalRoomEventBuffer(BaseRoomEventBuffer):
+    """
+    Keeps the events in memory of the current process, only events emitted by consumers of this process are buffered.
+    Rooms without events for ROOM_EVENTS_TTL seconds are dropped.
+    """
+
+    def __init__(self, size: int = None, ttl: int = None, max_rooms: int = None):
+        super().__init__(size, ttl)
+        self.rooms = LRUCache(settings.ROOM_EVENTS_MAX_ROOMS if max_rooms is None else max_rooms, self.ttl)
+
+    def _room(self, room_id) -> Tuple[List[int], deque]:
+        room_id = str(room_id)
+        room = self.rooms.get(room_id)
+        if room is None:
+            room = ([_first_seq() - 1], deque(maxlen=self.size))
+            self.rooms.set(room_id, room)
+        return room
+
+    def append(self, room_id, event: Dict[str, Any]) -> int:
+        current_seq, events = self._room(room_id)
+        current_seq[0] += 1
+        events.append({**event, 'seq': current_seq[0]})
+        return current_seq[0]
+
+    def since(self, room_id, seq: int) -> MissedEvents:
+        current_seq, events = self._room(room_id)
+        return self._missed(current_seq[0], list(events), seq)
+
+
+class RedisRoomEventBuffer(BaseRoomEventBuffer):
+    """
+    Keeps the events in Redis, so the buffer of a room is shared by every worker. Each room has a sequence counter
+    and a capped list of JSON encoded events, both expiring ROOM_EVENTS_TTL seconds after the last event.
+    """
+    key_prefix = 'room_events:'
+
+    # Increments the sequence, starting it from ARGV[1] when missing, and appends the event ARGV[2] with the sequence
+    # number in front of it to the list, capped to ARGV[3] events.
+    append_script = """
+        if redis.call('EXISTS', KEYS[1]) == 0 then
+            redis.call('SET', KEYS[1], ARGV[1])
+        end
+        local seq = redis.call('INCR', KEYS[1])
+        redis.call('EXPIRE', KEYS[1], ARGV[4])
+        redis.call('RPUSH', KEYS[2], seq .. ':' .. ARGV[2])
+        redis.call('LTRIM', KEYS[2], -tonumber(ARGV[3]), -1)
+        redis.call('EXPIRE', KEYS[2], ARGV[4])
+        return seq
+    """
+
+    def __init__(self, client=None, size: int = None, ttl: int = None):
+        super().__init__(size, ttl)
+        self.client = client if client is not None else redis.Redis.from_url(settings.REDIS_HOST)
+        self._append = self.client.register_script(self.append_script)
+
+    def _keys(self, room_id) -> List[str]:
+        return [f'{self.key_prefix}{room_id}:seq', f'{self.key_prefix}{room_id}:events']
+
+    def append(self, room_id, event: Dict[str, Any]) -> int:
+        args = [_first_seq() - 1, get_json_codec().encode(event), self.size, self.ttl]
+        return self._append(keys=self._keys(room_id), args=args)
+
+    def since(self, room_id, seq: int) -> MissedEvents:
+        seq_key, events_key = self._keys(room_id)
+        with self.client.pipeline(transaction=True) as pipeline:
+            pipeline.get(seq_key)
+            pipeline.lrange(events_key, 0, -1)
+            current_seq, entries = pipeline.execute()
+        if current_seq is None:
+            return _first_seq() - 1, None
+
+        events = []
+        for entry in entries:
+            event_seq, event = entry.split(b':', 1)
+            events.append({**get_json_codec().decode(event), 'seq': int(event_seq)})
+        return self._missed(int(current_seq), events, seq)
+
+
+def get_room_event_buffer(backend: Optional[str] = None) -> BaseRoomEventBuffer:
+    """
+    Creates the room event buffer configured by the ROOM_EVENTS_BACKEND setting.
+    """
+    return import_string(backend or settings.ROOM_EVENTS_BACKEND)()
+
+
+ROOM_EVENTS: BaseRoomEventBuffer = get_room_event_buffer()
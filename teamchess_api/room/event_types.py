@@ -0,0 +1,5 @@
+# Types of the room events used outside of the room consumer
+PLAYER_SYMBOL_CHANGED = 'player_symbol_changed'
+GAME_STARTED = 'game_started'
+MOVE_MADE = 'move_made'
+SNAPSHOT = 'snapshot'
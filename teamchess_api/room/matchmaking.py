@@ -0,0 +1,420 @@
+"""
+Matchmaking of players into public rooms.
+
+Players enqueue a ticket holding their name and wait for a match on the matchmaking websocket of the ticket. A
+background matcher pops the queued tickets in batches every MATCHMAKING_INTERVAL seconds, seats them on the free seats
+of the joinable public rooms, the oldest first, then creates a room for every 4 remaining tickets, all of it with a
+few bulk statements. Tickets left over wait for the next batch, unless the oldest of them waited for longer than
+MATCHMAKING_MAX_WAIT seconds, they are then seated together in a partially filled room. Each matched ticket is sent
+its room and token over its websocket.
+
+Closing the websocket of a ticket cancels it at any stage: cancelled tickets are never seated nor requeued, and the
+seats of cancelled matches, or of matches not picked up within MATCHMAKING_RESULT_TTL seconds, are freed.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+from uuid import uuid4
+
+import redis
+from django.conf import settings
+from django.db import models, transaction
+from django.utils.module_loading import import_string
+from rest_framework.authtoken.models import Token
+
+from engine.constants import PLAYER_SYMBOLS, SYMBOL_COLOR_MAPPING
+from player.models import Player
+from teamchess_api.background import PeriodicWorker
+from teamchess_api.json_codecs import get_json_codec
+from teamchess_api.lru_cache import LRUCache
+from .models import Room
+from .outbox import EVENT_OUTBOX
+from .snapshot_cache import ROOM_SNAPSHOTS
+
+# A ticket is a dict holding its id, the player name and the time it was first enqueued at
+Ticket = Dict[str, Any]
+
+
+def new_ticket(player_name: str) -> Ticket:
+    return {'id': uuid4().hex, 'player_name': player_name, 'enqueued_at': time.time()}
+
+
+def ticket_group(ticket_id: str) -> str:
+    """
+    Name of the channel layer group of the matchmaking websockets of the ticket.
+    """
+    return f'matchmaking.{ticket_id}'
+
+
+class BaseMatchmakingQueue:
+    """
+    A FIFO queue of matchmaking tickets, along with the matches of the matched tickets, kept for result_ttl seconds so
+    a websocket connecting after its ticket was matched still receives the match. Matches not claimed by their
+    websocket within result_ttl seconds are unclaimed, and so are the matches of cancelled tickets.
+    """
+
+    def __init__(self, result_ttl: float = None):
+        self.result_ttl = settings.MATCHMAKING_RESULT_TTL if result_ttl is None else result_ttl
+
+    def push(self, ticket: Ticket) -> None:
+        raise NotImplementedError
+
+    def pop(self, count: int) -> List[Ticket]:
+        """
+        Removes and returns up to count tickets from the front of the queue, cancelled tickets are skipped.
+        """
+        raise NotImplementedError
+
+    def requeue(self, tickets: List[Ticket]) -> None:
+        """
+        Puts popped tickets back in front of the queue, in the same order, except the cancelled ones.
+        """
+        raise NotImplementedError
+
+    def cancel(self, ticket_id: str) -> None:
+        """
+        Cancels the ticket, whether it is queued, popped by a matcher or matched. Cancellations are kept for result_ttl
+        seconds.
+        """
+        raise NotImplementedError
+
+    def cancelled(self, ticket_ids: List[str]) -> Set[str]:
+        """
+        Returns the ids of the cancelled tickets among the given ones.
+        """
+        raise NotImplementedError
+
+    def set_result(self, ticket_id: str, result: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def get_result(self, ticket_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def claim(self, ticket_id: str) -> bool:
+        """
+        Claims the match of the ticket for its websocket, returns False when the match was already unclaimed.
+        """
+        raise NotImplementedError
+
+    def pop_unclaimed(self, count: int) -> List[int]:
+        """
+        Removes up to count unclaimed matches, returns the ids of their players.
+        """
+        raise NotImplementedError
+
+
+class LocalMatchmakingQueue(BaseMatchmakingQueue):
+    """
+    Keeps the queue in memory of the current process, so tickets must be enqueued and matched by the same process.
+    """
+
+    def __init__(self, result_ttl: float = None, max_results: int = None):
+        super().__init__(result_ttl)
+        self.tickets: 'OrderedDict[str, Ticket]' = OrderedDict()
+        max_results = settings.MATCHMAKING_MAX_RESULTS if max_results is None else max_results
+        self.results = LRUCache(max_results, self.result_ttl)
+        self.cancellations = LRUCache(max_results, self.result_ttl)
+        # the deadline and player id of the matches to claim, by deadline
+        self.unclaimed: 'OrderedDict[str, Tuple[float, int]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def push(self, ticket: Ticket) -> None:
+        with self._lock:
+            self.tickets[ticket['id']] = ticket
+
+    def pop(self, count: int) -> List[Ticket]:
+        with self._lock:
+            return [self.tickets.popitem(last=False)[1] for _ in range(min(count, len(self.tickets)))]
+
+    def requeue(self, tickets: List[Ticket]) -> None:
+        with self._lock:
+            for ticket in reversed(tickets):
+                if self.cancellations.get(ticket['id']) is None:
+                    self.tickets[ticket['id']] = ticket
+                    self.tickets.move_to_end(ticket['id'], last=False)
+
+    def cancel(self, ticket_id: str) -> None:
+        with self._lock:
+            self.tickets.pop(ticket_id, None)
+            self.cancellations.set(ticket_id, True)
+            if ticket_id in self.unclaimed:
+                # unclaimed right away
+                self.unclaimed[ticket_id] = (0, self.unclaimed[ticket_id][1])
+                self.unclaimed.move_to_end(ticket_id, last=False)
+
+    def cancelled(self, ticket_ids: List[str]) -> Set[str]:
+        with self._lock:
+            return {ticket_id for ticket_id in ticket_ids if self.cancellations.get(ticket_id) is not None}
+
+    def set_result(self, ticket_id: str, result: Dict[str, Any]) -> None:
+        with self._lock:
+            self.results.set(ticket_id, result)
+            self.unclaimed[ticket_id] = (time.monotonic() + self.result_ttl, result['player_id'])
+
+    def get_result(self, ticket_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self.results.get(ticket_id)
+
+    def claim(self, ticket_id: str) -> bool:
+        with self._lock:
+            return self.unclaimed.pop(ticket_id, None) is not None
+
+    def pop_unclaimed(self, count: int) -> List[int]:
+        now = time.monotonic()
+        player_ids = []
+        with self._lock:
+            while self.unclaimed and len(player_ids) < count:
+                ticket_id, (deadline, player_id) = next(iter(self.unclaimed.items()))
+                if deadline > now:
+                    break
+                del self.unclaimed[ticket_id]
+                player_ids.append(player_id)
+        return player_ids
+
+
+class RedisMatchmakingQueue(BaseMatchmakingQueue):
+    """
+    Keeps the queue in Redis, so tickets enqueued by any worker are matched by the matcher of any worker. The queue is
+    a list of ticket ids and a hash of the JSON encoded tickets, cancelling a ticket removes it from the hash only.
+    Cancellations are a sorted set of ticket ids scored by their expiry time, and the matches to claim a sorted set of
+    ticket ids scored by their deadline along with a hash of their player ids.
+    """
+    queue_key = 'matchmaking:queue'
+    tickets_key = 'matchmaking:tickets'
+    result_key_prefix = 'matchmaking:result:'
+    cancelled_key = 'matchmaking:cancelled'
+    unclaimed_key = 'matchmaking:unclaimed'
+    unclaimed_players_key = 'matchmaking:unclaimed_players'
+
+    # Pushes the tickets ARGV[3], ARGV[5]... of ids ARGV[2], ARGV[4]... in front of the queue, last one first, unless
+    # they were cancelled after ARGV[1].
+    requeue_script = """
+        for index = 2, #ARGV, 2 do
+            local expiry = redis.call('ZSCORE', KEYS[3], ARGV[index])
+            if not expiry or tonumber(expiry) <= tonumber(ARGV[1]) then
+                redis.call('HSET', KEYS[2], ARGV[index], ARGV[index + 1])
+                redis.call('LPUSH', KEYS[1], ARGV[index])
+            end
+        end
+    """
+
+    # Removes up to ARGV[2] matches with a deadline up to ARGV[1], returns their player ids.
+    pop_unclaimed_script = """
+        local ticket_ids = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+        if #ticket_ids == 0 then
+            return {}
+        end
+        redis.call('ZREM', KEYS[1], unpack(ticket_ids))
+        local player_ids = redis.call('HMGET', KEYS[2], unpack(ticket_ids))
+        redis.call('HDEL', KEYS[2], unpack(ticket_ids))
+        return player_ids
+    """
+
+    def __init__(self, client=None, result_ttl: float = None):
+        super().__init__(result_ttl)
+        self.client = client if client is not None else redis.Redis.from_url(settings.REDIS_HOST)
+        self._requeue = self.client.register_script(self.requeue_script)
+        self._pop_unclaimed = self.client.register_script(self.pop_unclaimed_script)
+
+    def push(self, ticket: Ticket) -> None:
+        with self.client.pipeline(transaction=True) as pipeline:
+            pipeline.hset(self.tickets_key, ticket['id'], get_json_codec().encode(ticket))
+            pipeline.rpush(self.queue_key, ticket['id'])
+            pipeline.execute()
+
+    def pop(self, count: int) -> List[Ticket]:
+        with self.client.pipeline(transaction=True) as pipeline:
+            pipeline.lrange(self.queue_key, 0, count - 1)
+            pipeline.ltrim(self.queue_key, count, -1)
+            ticket_ids, _ = pipeline.execute()
+        if not ticket_ids:
+            return []
+        with self.client.pipeline(transaction=True) as pipeline:
+            pipeline.hmget(self.tickets_key, ticket_ids)
+            pipeline.hdel(self.tickets_key, *ticket_ids)
+            tickets, _ = pipeline.execute()
+        return [get_json_codec().decode(ticket) for ticket in tickets if ticket is not None]
+
+    def requeue(self, tickets: List[Ticket]) -> None:
+        if not tickets:
+            return
+        args = [time.time()]
+        for ticket in reversed(tickets):
+            args += [ticket['id'], get_json_codec().encode(ticket)]
+        self._requeue(keys=[self.queue_key, self.tickets_key, self.cancelled_key], args=args)
+
+    def cancel(self, ticket_id: str) -> None:
+        now = time.time()
+        with self.client.pipeline(transaction=True) as pipeline:
+            pipeline.hdel(self.tickets_key, ticket_id)
+            pipeline.zremrangebyscore(self.cancelled_key, '-inf', now)
+            pipeline.zadd(self.cancelled_key, {ticket_id: now + self.result_ttl})
+            # unclaimed right away
+            pipeline.zadd(self.unclaimed_key, {ticket_id: 0}, xx=True)
+            pipeline.execute()
+
+    def cancelled(self, ticket_ids: List[str]) -> Set[str]:
+        now = time.time()
+        with self.client.pipeline(transaction=False) as pipeline:
+            for ticket_id in ticket_ids:
+                pipeline.zscore(self.cancelled_key, ticket_id)
+            expiries = pipeline.execute()
+        return {ticket_id for ticket_id, expiry in zip(ticket_ids, expiries) if expiry is not None and expiry > now}
+
+    def set_result(self, ticket_id: str, result: Dict[str, Any]) -> None:
+        key = f'{self.result_key_prefix}{ticket_id}'
+        with self.client.pipeline(transaction=True) as pipeline:
+            pipeline.set(key, get_json_codec().encode(result), ex=int(self.result_ttl))
+            pipeline.zadd(self.unclaimed_key, {ticket_id: time.time() + self.result_ttl})
+            pipeline.hset(self.unclaimed_players_key, ticket_id, result['player_id'])
+            pipeline.execute()
+
+    def get_result(self, ticket_id: str) -> Optional[Dict[str, Any]]:
+        result = self.client.get(f'{self.result_key_prefix}{ticket_id}')
+        return None if result is None else get_json_codec().decode(result)
+
+    def claim(self, ticket_id: str) -> bool:
+        with self.client.pipeline(transaction=True) as pipeline:
+            pipeline.zrem(self.unclaimed_key, ticket_id)
+            pipeline.hdel(self.unclaimed_players_key, ticket_id)
+            claimed, _ = pipeline.execute()
+        return bool(claimed)
+
+    def pop_unclaimed(self, count: int) -> List[int]:
+        keys = [self.unclaimed_key, self.unclaimed_players_key]
+        player_ids = self._pop_unclaimed(keys=keys, args=[time.time(), count])
+        return [int(player_id) for player_id in player_ids if player_id is not None]
+
+
+def get_matchmaking_queue(backend: Optional[str] = None) -> BaseMatchmakingQueue:
+    """
+    Creates the matchmaking queue configured by the MATCHMAKING_QUEUE_BACKEND setting.
+    """
+    return import_string(backend or settings.MATCHMAKING_QUEUE_BACKEND)()
+
+
+MATCHMAKING_QUEUE: BaseMatchmakingQueue = get_matchmaking_queue()
+
+
+class Matcher(PeriodicWorker):
+    """
+    Background thread matching the queued tickets in batches of up to batch_size tickets every interval seconds.
+    Tickets of a batch that failed to be seated, because a concurrent join took one of their seats, are requeued.
+    The seats of the unclaimed matches are freed first.
+    """
+
+    thread_name = 'matcher'
+
+    def __init__(self, queue: BaseMatchmakingQueue, interval: float, batch_size: int, max_wait: float):
+        super().__init__(interval)
+        self.queue = queue
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+
+    def match(self) -> int:
+        """
+        Matches a batch of queued tickets, returns the number of matched tickets.
+        """
+        tickets = self.queue.pop(self.batch_size)
+        if not tickets:
+            return 0
+        try:
+            with transaction.atomic():
+                matches, waiting = self.seat(tickets)
+        except Exception:
+            self.queue.requeue(tickets)
+            raise
+        self.queue.requeue(waiting)
+        return len(matches)
+
+    def seat(self, tickets: List[Ticket]):
+        """
+        Seats the tickets in the joinable rooms and in new rooms, returns the matches and the tickets left waiting. The
+        matches are sent once the transaction commits.
+        """
+        cancelled = self.queue.cancelled([ticket['id'] for ticket in tickets])
+        tickets = [ticket for ticket in tickets if ticket['id'] not in cancelled]
+        rooms = Room.objects.filter(
+            type=Room.RoomTypeChoices.PUBLIC, status=Room.RoomStatusChoices.WAITING
+        ).annotate(
+            player_count=models.Count('players')
+        ).filter(
+            player_count__gt=0, player_count__lt=len(PLAYER_SYMBOLS)
+        ).order_by('created_at').values_list('id', flat=True)[:len(tickets)]
+        taken: Dict[Any, set] = {room_id: set() for room_id in rooms}
+        for room_id, player_symbol in Player.objects.filter(room_id__in=taken).values_list('room_id', 'player_symbol'):
+            taken[room_id].add(player_symbol)
+
+        pending = list(tickets)
+        players = []
+        for room_id, symbols in taken.items():
+            for player_symbol in PLAYER_SYMBOLS:
+                if pending and player_symbol not in symbols:
+                    players.append(self._player(pending.pop(0), room_id, player_symbol))
+
+        size = len(PLAYER_SYMBOLS)
+        groups = [pending[index:index + size] for index in range(0, len(pending), size)]
+        waiting = []
+        if groups and len(groups[-1]) < size and time.time() - groups[-1][0]['enqueued_at'] < self.max_wait:
+            waiting = groups.pop()
+        new_rooms = [
+            Room(name=f"{group[0]['player_name']}'s match"[:50], type=Room.RoomTypeChoices.PUBLIC) for group in groups
+        ]
+        Room.objects.bulk_create(new_rooms)
+        for room, group in zip(new_rooms, groups):
+            for index, (ticket, player_symbol) in enumerate(zip(group, PLAYER_SYMBOLS)):
+                players.append(self._player(ticket, room.pk, player_symbol, is_game_manager=index == 0))
+
+        # raises IntegrityError when a concurrent join took one of the seats
+        Player.objects.bulk_create(players)
+        tokens = Token.objects.bulk_create([Token(key=Token.generate_key(), user=player) for player in players])
+
+        # bulk inserts skip the model signals
+        for room_id in taken:
+            ROOM_SNAPSHOTS.bump(room_id)
+        matches = [
+            (ticket, {'room_id': str(player.room_id), 'player_id': player.pk, 'token': token.key})
+            for ticket, player, token in zip(tickets[:len(players)], players, tokens)
+        ]
+        transaction.on_commit(lambda: self.notify(matches))
+        return matches, waiting
+
+    @staticmethod
+    def _player(ticket: Ticket, room_id, player_symbol: str, is_game_manager: bool = False) -> Player:
+        return Player(
+            name=ticket['player_name'], room_id=room_id, player_symbol=player_symbol,
+            team=SYMBOL_COLOR_MAPPING[player_symbol], is_game_manager=is_game_manager
+        )
+
+    def notify(self, matches) -> None:
+        for ticket, result in matches:
+            self.queue.set_result(ticket['id'], result)
+            EVENT_OUTBOX.group_send(ticket_group(ticket['id']), {'type': 'matchmaking.matched', 'result': result})
+
+    def free_unclaimed(self) -> int:
+        """
+        Deletes the players of a batch of unclaimed matches, and the waiting rooms they leave empty, returns the number
+        of unclaimed matches.
+        """
+        player_ids = self.queue.pop_unclaimed(self.batch_size)
+        if not player_ids:
+            return 0
+        with transaction.atomic():
+            players = Player.objects.filter(pk__in=player_ids)
+            room_ids = set(players.values_list('room_id', flat=True))
+            players.delete()
+            Room.objects.filter(pk__in=room_ids, status=Room.RoomStatusChoices.WAITING, players=None).delete()
+        return len(player_ids)
+
+    def tick(self) -> None:
+        while self.free_unclaimed() == self.batch_size:
+            pass
+        # full batches are matched right away
+        while self.match() == self.batch_size:
+            pass
+
+
+MATCHER = Matcher(
+    MATCHMAKING_QUEUE, settings.MATCHMAKING_INTERVAL, settings.MATCHMAKING_BATCH_SIZE, settings.MATCHMAKING_MAX_WAIT
+)
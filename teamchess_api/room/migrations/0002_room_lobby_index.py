@@ -0,0 +1,17 @@
+# Generated by Django 4.2 on 2026-10-18 11:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('room', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='room',
+            index=models.Index(fields=['type', 'status', '-created_at'], include=('id', 'name'), name='room_lobby_idx'),
+        ),
+    ]
@@ -1,6 +1,8 @@
 from django.db import models
+from django.dispatch import receiver
 from uuid import uuid4
 from django_cryptography.fields import encrypt
+from .snapshot_cache import ROOM_SNAPSHOTS
 
 
 class Room(models.Model):
@@ -23,4 +25,14 @@ class Room(models.Model):
     password = encrypt(models.CharField(max_length=100, null=True, default=None))
 
     class Meta:
-        ordering = ['-created_at']
\ No newline at end of file
+        ordering = ['-created_at']
+        indexes = [
+            # the lobby lists the joinable rooms (public and waiting) from the newest
+            models.Index(fields=['type', 'status', '-created_at'], include=['id', 'name'], name='room_lobby_idx'),
+        ]
+
+    @staticmethod
+    @receiver(models.signals.post_save, sender='room.Room')
+    @receiver(models.signals.post_delete, sender='room.Room')
+    def room_changed(sender, instance, **kwargs):
+        ROOM_SNAPSHOTS.bump(instance.pk)
\ No newline at end of file
@@ -0,0 +1,60 @@
+"""
+Binary MessagePack websocket subprotocol of the room, negotiated by clients listing SUBPROTOCOL when connecting.
+
+Frames are binary MessagePack maps with the same message, data and seq keys as the JSON frames, and the game data
+in a compact form:
+    pieces    a list of [square, player, piece type] tuples, the color is implied by the player
+    moves     from and to squares, promotion piece type (or nil), owner and next turn player of move_made
+where squares are indices from 0 (a1) to 63 (h8), players are indices in PLAYER_SYMBOLS order and piece types are
+1 (pawn) to 6 (king). Clients send MessagePack maps with the same keys as the JSON messages.
+"""
+from typing import Any, Dict
+
+import chess
+import msgpack
+
+from engine.constants import PLAYER_SYMBOLS
+from .event_types import MOVE_MADE
+
+SUBPROTOCOL = 'teamchess.msgpack'
+
+SQUARES = {name: square for square, name in enumerate(chess.SQUARE_NAMES)}
+PLAYER_INDICES = {symbol: index for index, symbol in enumerate(PLAYER_SYMBOLS)}
+PIECE_TYPES = {name: piece_type for piece_type, name in enumerate(chess.PIECE_NAMES) if name}
+PROMOTION_TYPES = {symbol: piece_type for piece_type, symbol in enumerate(chess.PIECE_SYMBOLS) if symbol}
+
+
+def compact_pieces(pieces):
+    if pieces is None:
+        return None
+    return [
+        (SQUARES[piece['square']], PLAYER_INDICES[piece['player']], PIECE_TYPES[piece['piece']])
+        for piece in pieces
+    ]
+
+
+def compact_move(move: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'from': SQUARES[move['from']],
+        'to': SQUARES[move['to']],
+        'promotion': PROMOTION_TYPES[move['promotion']] if move['promotion'] else None,
+        'owner': PLAYER_INDICES[move['owner']],
+        'next': PLAYER_INDICES[move['next']],
+        'seq': move['seq'],
+    }
+
+
+def encode_frame(content: Dict[str, Any]) -> bytes:
+    """
+    Encodes a frame sent to clients ({'message': ..., 'data': ..., 'seq': ...}), compacting its game data.
+    """
+    data = content['data']
+    if content['message'] == MOVE_MADE:
+        data = compact_move(data)
+    elif isinstance(data, dict) and 'pieces' in data:
+        data = {**data, 'pieces': compact_pieces(data['pieces'])}
+    return msgpack.packb({**content, 'data': data})
+
+
+def decode_frame(data: bytes) -> Any:
+    return msgpack.unpackb(data)
@@ -0,0 +1,121 @@
+import asyncio
+import logging
+import queue
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Tuple, Union
+
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from teamchess_api.background import BackgroundWorker
+from .broadcast import emit_to_room
+
+logger = logging.getLogger(__name__)
+
+# The kind of an outbox entry (emit, send or group_send), its target (room id, channel or group name) and its payload
+Entry = Tuple[str, Any, Any]
+
+
+class EventOutbox(BackgroundWorker):
+    """
+    Transactional outbox of the channel layer events sent while handling requests.
+
+    Events are queued once the current transaction commits, and dropped when it rolls back, so consumers never read
+    uncommitted state. A background thread, running its own event loop, dispatches the queued events in batches of up
+    to batch_size, concurrently across targets and in order for each target, so requests never wait on the channel
+    layer.
+    """
+
+    thread_name = 'event-outbox'
+
+    def __init__(self, batch_size: int):
+        super().__init__()
+        self.batch_size = batch_size
+        self.queue: 'queue.SimpleQueue[Entry]' = queue.SimpleQueue()
+
+    def emit(self, room_id, message: str, data: Union[Any, Callable[[], Any]]) -> None:
+        """
+        Emits an event to the room with emit_to_room. The data may be a callable, called by the dispatcher after the
+        commit, so the room is serialized in its committed state.
+        """
+        self._enqueue(('emit', room_id, (message, data)))
+
+    def send(self, channel_name: str, event: Dict[str, Any]) -> None:
+        self._enqueue(('send', channel_name, event))
+
+    def group_send(self, group: str, event: Dict[str, Any]) -> None:
+        self._enqueue(('group_send', group, event))
+
+    def _enqueue(self, entry: Entry) -> None:
+        transaction.on_commit(lambda: self.queue.put(entry))
+        self.start()
+
+    def wake(self) -> None:
+        # the thread blocks on the queue, it stops once it dispatched the events queued before the sentinel
+        self.queue.put(None)
+
+    def run(self) -> None:
+        loop = asyncio.new_event_loop()
+        stopped = False
+        while not stopped:
+            batch = []
+            entry = self.queue.get()
+            while entry is not None:
+                batch.append(entry)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    entry = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            stopped = entry is None
+            try:
+                loop.run_until_complete(self.dispatch(self._resolve(batch)))
+            except Exception:
+                logger.exception('failed to dispatch the outbox events')
+            finally:
+                close_old_connections()
+        loop.close()
+
+    @staticmethod
+    def _resolve(batch: List[Entry]) -> List[Entry]:
+        """
+        Calls the data callables of the emitted events, outside of the event loop as they may query the database.
+        """
+        entries = []
+        for kind, target, payload in batch:
+            try:
+                if kind == 'emit' and callable(payload[1]):
+                    payload = (payload[0], payload[1]())
+            except Exception:
+                logger.exception('failed to build the data of an outbox event')
+                continue
+            entries.append((kind, target, payload))
+        return entries
+
+    async def dispatch(self, entries: List[Entry]) -> None:
+        by_target = defaultdict(list)
+        for kind, target, payload in entries:
+            by_target[kind, target].append(payload)
+        results = await asyncio.gather(
+            *(self._dispatch_target(kind, target, payloads) for (kind, target), payloads in by_target.items()),
+            return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error('failed to dispatch an outbox event', exc_info=result)
+
+    @staticmethod
+    async def _dispatch_target(kind: str, target, payloads: List[Any]) -> None:
+        channel_layer = get_channel_layer()
+        for payload in payloads:
+            if kind == 'emit':
+                await emit_to_room(target, *payload)
+            elif kind == 'send':
+                await channel_layer.send(target, payload)
+            else:
+                await channel_layer.group_send(target, payload)
+
+
+EVENT_OUTBOX = EventOutbox(settings.EVENT_OUTBOX_BATCH_SIZE)
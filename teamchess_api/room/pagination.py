@@ -0,0 +1,12 @@
+from rest_framework.pagination import CursorPagination
+
+
+class LobbyPagination(CursorPagination):
+    """
+    Keyset pagination of the lobby on the creation date, served by the lobby index of Room, so deep pages cost the
+    same as the first one.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = '-created_at'
@@ -1,10 +1,12 @@
 from channels.routing import URLRouter
 from django.urls import path
-from .consumers import RoomConsumer
+from .consumers import RoomConsumer, SpectatorConsumer, MatchmakingConsumer
 from player.auth import RoomWebSocketAuthentication
 
 
 websocket_urlpatterns = RoomWebSocketAuthentication(URLRouter([
-    path('room/<uuid:pk>/', RoomConsumer.as_asgi())
+    path('room/<uuid:pk>/', RoomConsumer.as_asgi()),
+    path('room/<uuid:pk>/spectate/', SpectatorConsumer.as_asgi()),
+    path('matchmaking/<str:ticket>/', MatchmakingConsumer.as_asgi()),
 ]))
 
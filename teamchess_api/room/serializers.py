@@ -1,11 +1,13 @@
-from rest_framework.serializers import ModelSerializer, CharField, ChoiceField
+from rest_framework.serializers import Serializer, ModelSerializer, CharField, ChoiceField, IntegerField
 from rest_framework.exceptions import ValidationError
 from rest_framework.settings import api_settings
 from engine.constants import *
 from player.auth import TokenAuthentication
 from player.models import Player
+from player.seats import RoomFullError, take_seat
 from player.serializers import PlayerSerializer
 from game.serializers import RetrieveGameSerializer
+from .matchmaking import MATCHER, MATCHMAKING_QUEUE, new_ticket
 from .models import Room
 
 
@@ -51,6 +53,14 @@ class ListRoomSerializer(ModelSerializer):
         fields = ['id', 'name', 'type', 'status', 'created_at']
 
 
+class LobbyRoomSerializer(ListRoomSerializer):
+
+    player_count = IntegerField(read_only=True)
+
+    class Meta(ListRoomSerializer.Meta):
+        fields = ListRoomSerializer.Meta.fields + ['player_count']
+
+
 class RetrieveRoomSerializer(ListRoomSerializer):
 
     game = RetrieveGameSerializer(read_only=True)
@@ -75,29 +85,29 @@ class JoinRoomSerializer(ModelSerializer):
     def validate(self, attrs):
         attrs = super(JoinRoomSerializer, self).validate(attrs)
 
-        current_players = self.instance.players.all()
-        if current_players.count() == 4:
-            raise ValidationError({api_settings.NON_FIELD_ERRORS_KEY: ['Room is full.']})
-
         if self.instance.type == Room.RoomTypeChoices.PRIVATE:
             if not attrs.get('password'):
                 raise ValidationError({'password': ['Password is required for private room.']})
             if attrs.get('password') != self.instance.password:
                 raise ValidationError({'password': ['Password is incorrect.']})
-
-        # Assigning player symbol to the player.
-        player_symbol = None
-        for symbol in PLAYER_SYMBOLS:
-            if not current_players.filter(player_symbol=symbol).exists():
-                player_symbol = symbol
-
-        attrs.update(player_symbol=player_symbol)
         return attrs
 
     def update(self, instance, validated_data):
-        player = Player.objects.create(
-            name=validated_data.get('player_name'), room=instance,
-            player_symbol=validated_data.get('player_symbol')
-        )
+        try:
+            player = take_seat(instance, name=validated_data.get('player_name'))
+        except RoomFullError:
+            raise ValidationError({api_settings.NON_FIELD_ERRORS_KEY: ['Room is full.']})
         token = TokenAuthentication().generate_token(player)
         return {'token': token}
+
+
+class EnqueueMatchmakingSerializer(Serializer):
+
+    player_name = CharField(max_length=50, write_only=True)
+    ticket = CharField(read_only=True)
+
+    def create(self, validated_data):
+        ticket = new_ticket(validated_data.get('player_name'))
+        MATCHMAKING_QUEUE.push(ticket)
+        MATCHER.start()
+        return {'ticket': ticket['id']}
@@ -0,0 +1,62 @@
+from typing import Any, Dict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+
+class RoomSnapshotCache:
+    """
+    Caches the serialized room (RetrieveRoomSerializer) per room, so a single serialization feeds every socket of the
+    room and back to back events.
+
+    Snapshots are keyed by a per room version counter, which is bumped whenever the room, its players or its game
+    change, a bump makes every worker serialize the room again on next access while the stale snapshot expires.
+    """
+    key_prefix = 'room_snapshot:'
+
+    def __init__(self, cache_alias: str = None, ttl: int = None):
+        self.cache = caches[cache_alias or settings.ROOM_SNAPSHOT_CACHE]
+        self.ttl = settings.ROOM_SNAPSHOT_TTL if ttl is None else ttl
+
+    def _version_key(self, room_id) -> str:
+        return f'{self.key_prefix}{room_id}:version'
+
+    def version(self, room_id) -> int:
+        return self.cache.get_or_set(self._version_key(room_id), 0, timeout=None)
+
+    def bump(self, room_id) -> None:
+        """
+        Bumps the version of the room once the current transaction commits, so the room is never serialized again
+        before the change is visible.
+        """
+        transaction.on_commit(lambda: self._bump(room_id))
+
+    def _bump(self, room_id) -> None:
+        key = self._version_key(room_id)
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            # not cached yet, the first bump of a version that was never read
+            self.cache.add(key, 1, timeout=None)
+
+    def get(self, room_id) -> Dict[str, Any]:
+        key = f'{self.key_prefix}{room_id}:{self.version(room_id)}'
+        snapshot = self.cache.get(key)
+        if snapshot is None:
+            snapshot = self._serialize(room_id)
+            self.cache.set(key, snapshot, timeout=self.ttl)
+        return snapshot
+
+    @staticmethod
+    def _serialize(room_id) -> Dict[str, Any]:
+        # imported here since the models of the room, player and game apps bump versions through this module
+        from .models import Room
+        from .serializers import RetrieveRoomSerializer
+
+        room = Room.objects.select_related('game').prefetch_related('players').get(id=room_id)
+        # a plain dict, so the cache doesn't pickle the serializer along with it
+        return dict(RetrieveRoomSerializer(room).data)
+
+
+ROOM_SNAPSHOTS = RoomSnapshotCache()
@@ -0,0 +1,66 @@
+import asyncio
+import logging
+from typing import Dict, Set
+
+from channels.layers import get_channel_layer
+
+logger = logging.getLogger(__name__)
+
+
+class SpectatorHub:
+    """
+    Relays the events of the rooms watched by the spectators connected to this worker.
+
+    The hub holds a single channel of the channel layer, added to the group of every room watched by at least one
+    local spectator, so the channel layer delivers each room event once per worker instead of once per spectator.
+    The received frames are pushed to the local spectators of the room, each one sending them at its own pace.
+    """
+
+    def __init__(self):
+        self.rooms: Dict[str, Set] = {}
+        self.channel_name = None
+        self._relay_task = None
+        self._lock = asyncio.Lock()
+
+    async def subscribe(self, room_id, spectator) -> None:
+        """
+        Starts pushing the events of the room to the spectator, which must have a push(event) method.
+        """
+        room_id = str(room_id)
+        async with self._lock:
+            channel_layer = get_channel_layer()
+            if self.channel_name is None:
+                self.channel_name = await channel_layer.new_channel()
+                self._relay_task = asyncio.create_task(self._relay(channel_layer))
+            if room_id not in self.rooms:
+                self.rooms[room_id] = set()
+                await channel_layer.group_add(room_id, self.channel_name)
+            self.rooms[room_id].add(spectator)
+
+    async def unsubscribe(self, room_id, spectator) -> None:
+        room_id = str(room_id)
+        async with self._lock:
+            spectators = self.rooms.get(room_id)
+            if spectators is None:
+                return
+            spectators.discard(spectator)
+            if not spectators:
+                del self.rooms[room_id]
+                await get_channel_layer().group_discard(room_id, self.channel_name)
+
+    async def _relay(self, channel_layer) -> None:
+        while True:
+            try:
+                event = await channel_layer.receive(self.channel_name)
+            except Exception:
+                logger.exception('failed to receive room events for spectators')
+                await asyncio.sleep(1)
+                continue
+            for spectator in tuple(self.rooms.get(event.get('room'), ())):
+                try:
+                    spectator.push(event)
+                except Exception:
+                    logger.exception('failed to push a room event to a spectator')
+
+
+SPECTATOR_HUB = SpectatorHub()
@@ -0,0 +1,741 @@
+import contextlib
+import datetime
+import time
+import uuid
+from unittest import mock
+
+import chess
+import fakeredis
+import msgpack
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.db import transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from engine.board import TeamChessBoard
+from engine.constants import PLAYER_SYMBOLS, SPADE, HEART
+from engine.encoding import encode_board
+from game.active_boards import ACTIVE_BOARDS
+from game.models import Game
+from game.persistence import GAME_PERSISTER
+from player.auth import TokenAuthentication
+from player.models import Player
+from player.seats import swap_seat, take_seat
+from .consumers import RoomConsumer
+from .event_buffer import LocalRoomEventBuffer, RedisRoomEventBuffer
+from .outbox import EventOutbox
+from .matchmaking import LocalMatchmakingQueue, Matcher, RedisMatchmakingQueue, new_ticket
+from . import consumers, matchmaking, outbox
+from .broadcast import build_snapshot, emit_to_room
+from .models import Room
+from .msgpack_protocol import SUBPROTOCOL
+from .routing import websocket_urlpatterns
+from .snapshot_cache import ROOM_SNAPSHOTS
+from .spectators import SpectatorHub
+
+CUSTOM_FEN = 'r♥n♣b♥q♥k♣b♣n♣r♥/p♥p♣p♣p♥p♥p♥p♣p♣/8/8/8/8/P♠P♦P♦P♦P♠P♦P♠P♠/R♦N♠B♠Q♦K♦B♠N♦R♠'
+IN_MEMORY_CHANNEL_LAYERS = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class RoomConsumerTestCase(TransactionTestCase):
+    """
+    Connects a socket for each of the 4 players of a room, in PLAYER_SYMBOLS order.
+    """
+
+    def setUp(self):
+        self.room = Room.objects.create(name='room', type=Room.RoomTypeChoices.PUBLIC)
+        self.players = [
+            Player.objects.create(name=f'player {index}', room=self.room, player_symbol=symbol)
+            for index, symbol in enumerate(PLAYER_SYMBOLS)
+        ]
+        self.tokens = [TokenAuthentication().generate_token(player).key for player in self.players]
+        self.addCleanup(ACTIVE_BOARDS.delete, self.room.pk)
+
+    def start_game(self, fen: str = f'{CUSTOM_FEN} w KQkq - 0 1') -> TeamChessBoard:
+        board = TeamChessBoard(fen, current_turn_player_symbol=SPADE)
+        Game.objects.create(
+            room=self.room, fen=board.get_original_fen(), custom_fen=board.fen(), starting_position=encode_board(board)
+        )
+        ACTIVE_BOARDS[self.room.pk] = board
+        # moves mark the game dirty, which starts the persister
+        self.addCleanup(GAME_PERSISTER.stop)
+        return board
+
+    async def connect(self, index: int, subprotocols=None) -> WebsocketCommunicator:
+        communicator = WebsocketCommunicator(
+            websocket_urlpatterns, f'/room/{self.room.pk}/?token={self.tokens[index]}', subprotocols=subprotocols
+        )
+        connected, _ = await communicator.connect()
+        # consumers still connected at the end of a test are cancelled along with its event loop
+        self.assertTrue(connected)
+        return communicator
+
+    async def connect_all(self):
+        communicators = [await self.connect(index) for index in range(len(PLAYER_SYMBOLS))]
+        for communicator in communicators:
+            await self.drain(communicator)
+        return communicators
+
+    @staticmethod
+    async def drain(communicator: WebsocketCommunicator) -> None:
+        while not await communicator.receive_nothing(0.05):
+            await communicator.receive_output()
+
+    async def move(self, communicator: WebsocketCommunicator, uci: str) -> None:
+        await communicator.send_json_to({'type': RoomConsumer.MOVE, 'uci': uci})
+
+    async def assertRejected(self, communicator: WebsocketCommunicator, data) -> None:
+        message = await communicator.receive_json_from()
+        self.assertEqual(message, {'message': RoomConsumer.MOVE_REJECTED, 'data': data})
+
+
+class MoveProtocolTestCase(RoomConsumerTestCase):
+
+    async def test_move_is_broadcast_as_a_delta(self):
+        board = await database_sync_to_async(self.start_game)()
+        sockets = await self.connect_all()
+        await self.move(sockets[0], 'a2a4')
+        for communicator in sockets:
+            message = await communicator.receive_json_from()
+            self.assertEqual(message['message'], RoomConsumer.MOVE_MADE)
+            self.assertEqual(
+                message['data'],
+                {'from': 'a2', 'to': 'a4', 'promotion': None, 'owner': SPADE, 'next': HEART, 'seq': 1}
+            )
+        self.assertTrue(board.player_of_spades.squares & chess.BB_A4)
+
+    async def test_move_out_of_turn(self):
+        await database_sync_to_async(self.start_game)()
+        sockets = await self.connect_all()
+        await self.move(sockets[1], 'a7a6')
+        await self.assertRejected(sockets[1], {'non_field_errors': ['It is not your turn.']})
+        for communicator in sockets:
+            self.assertTrue(await communicator.receive_nothing(0.05))
+
+    async def test_move_of_another_players_piece(self):
+        await database_sync_to_async(self.start_game)()
+        sockets = await self.connect_all()
+        # b2 belongs to the player of diamonds
+        await self.move(sockets[0], 'b2b3')
+        await self.assertRejected(sockets[0], {'uci': ['Illegal move.']})
+        await self.move(sockets[0], 'a2')
+        await self.assertRejected(sockets[0], {'uci': ['Invalid move.']})
+
+    async def test_move_before_the_game_started(self):
+        sockets = await self.connect_all()
+        await self.move(sockets[0], 'a2a4')
+        await self.assertRejected(sockets[0], {'non_field_errors': ['Game has not started.']})
+
+    async def test_move_after_the_game_is_over(self):
+        # spades has no pieces left, so the game ended in a stalemate
+        await database_sync_to_async(self.start_game)('4k♣3/8/8/8/8/8/P♦7/4K♦3 w - - 0 1')
+        sockets = await self.connect_all()
+        await self.move(sockets[0], 'a2a3')
+        await self.assertRejected(sockets[0], {'non_field_errors': ['Game is over.']})
+
+    async def test_move_after_a_seat_swap(self):
+        await database_sync_to_async(self.start_game)()
+        sockets = await self.connect_all()
+        await database_sync_to_async(swap_seat)(self.players[0], HEART)
+
+        # the sockets were opened with the old seats
+        await self.move(sockets[0], 'a2a4')
+        await self.assertRejected(sockets[0], {'non_field_errors': ['It is not your turn.']})
+        await self.move(sockets[1], 'a2a4')
+        message = await sockets[1].receive_json_from()
+        self.assertEqual((message['message'], message['data']['owner']), (RoomConsumer.MOVE_MADE, SPADE))
+
+    async def test_move_of_a_player_who_left(self):
+        await database_sync_to_async(self.start_game)()
+        sockets = await self.connect_all()
+        await database_sync_to_async(Player.objects.filter(pk=self.players[0].pk).delete)()
+        await self.move(sockets[0], 'a2a4')
+        await self.assertRejected(sockets[0], {'non_field_errors': ['Player has left the room.']})
+
+
+
+class MalformedFrameTestCase(RoomConsumerTestCase):
+    malformed = {'non_field_errors': ['Malformed message.']}
+
+    async def test_malformed_json_is_rejected(self):
+        await database_sync_to_async(self.start_game)()
+        sockets = await self.connect_all()
+        for frame in ('{"type": "move", "uci": ', 'move a2a4', '{}}'):
+            await sockets[0].send_to(text_data=frame)
+            await self.assertRejected(sockets[0], self.malformed)
+        await sockets[0].send_to(bytes_data=b'{"type": "move", "uci": "a2a4"}')
+        await self.assertRejected(sockets[0], self.malformed)
+
+        # the socket stays open
+        await self.move(sockets[0], 'a2a4')
+        self.assertEqual((await sockets[0].receive_json_from())['message'], RoomConsumer.MOVE_MADE)
+
+    async def test_messages_other_than_moves_are_ignored(self):
+        await database_sync_to_async(self.start_game)()
+        sockets = await self.connect_all()
+        for content in (['move', 'a2a4'], 'a2a4', 4, None, {'uci': 'a2a4'}, {'type': 'chat'}):
+            await sockets[0].send_json_to(content)
+        self.assertTrue(await sockets[0].receive_nothing(0.1))
+        self.assertEqual(ACTIVE_BOARDS[self.room.pk].ply(), 0)
+
+    async def test_msgpack_frames(self):
+        await database_sync_to_async(self.start_game)()
+        communicator = await self.connect(0, subprotocols=[SUBPROTOCOL])
+        await self.drain(communicator)
+
+        for frame in (b'\xc1', b'\x81\xa4type', msgpack.packb({'type': 'move'}) + b'\x01'):
+            await communicator.send_to(bytes_data=frame)
+            self.assertEqual(
+                msgpack.unpackb(await communicator.receive_from()),
+                {'message': RoomConsumer.MOVE_REJECTED, 'data': self.malformed}
+            )
+
+        await communicator.send_to(bytes_data=msgpack.packb({'type': RoomConsumer.MOVE, 'uci': 'a2a4'}))
+        message = msgpack.unpackb(await communicator.receive_from())
+        self.assertEqual(message['message'], RoomConsumer.MOVE_MADE)
+        # squares and players are sent as indices
+        self.assertEqual(
+            message['data'],
+            {'from': chess.A2, 'to': chess.A4, 'promotion': None, 'owner': 0, 'next': 1, 'seq': 1}
+        )
+
+
+
+class KickTestCase(RoomConsumerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        Player.objects.filter(pk=self.players[0].pk).update(is_game_manager=True)
+        # the outbox is dispatched on the event loop of the test rather than by its thread
+        start = mock.patch.object(outbox.EVENT_OUTBOX, 'start')
+        start.start()
+        self.addCleanup(start.stop)
+
+    async def dispatch_outbox(self):
+        batch = []
+        while not outbox.EVENT_OUTBOX.queue.empty():
+            batch.append(outbox.EVENT_OUTBOX.queue.get())
+        await outbox.EVENT_OUTBOX.dispatch(await database_sync_to_async(outbox.EVENT_OUTBOX._resolve)(batch))
+
+    async def test_kicked_player_is_disconnected(self):
+        sockets = await self.connect_all()
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {self.tokens[0]}')
+        response = await database_sync_to_async(client.post)(f'/player/{self.players[1].pk}/kick/')
+        self.assertEqual(response.status_code, 200)
+        await self.dispatch_outbox()
+
+        closed = await sockets[1].receive_output()
+        self.assertEqual((closed['type'], closed['code']), ('websocket.close', 1000))
+        for communicator in sockets[:1] + sockets[2:]:
+            message = await communicator.receive_json_from()
+            self.assertEqual(message['message'], RoomConsumer.PLAYER_KICKED)
+            self.assertEqual(len(message['data']['room']['players']), len(PLAYER_SYMBOLS) - 1)
+        self.assertFalse(await database_sync_to_async(Player.objects.filter(pk=self.players[1].pk).exists)())
+
+
+class EventOutboxTestCase(TestCase):
+
+    def setUp(self):
+        self.outbox = EventOutbox(batch_size=2)
+        start = mock.patch.object(self.outbox, 'start')
+        start.start()
+        self.addCleanup(start.stop)
+
+    def queued(self):
+        entries = []
+        while not self.outbox.queue.empty():
+            entries.append(self.outbox.queue.get())
+        return entries
+
+    def test_events_are_queued_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.outbox.send('channel', {'type': 'event'})
+            self.outbox.group_send('group', {'type': 'event'})
+            self.assertEqual(self.queued(), [])
+        self.assertEqual(
+            self.queued(), [('send', 'channel', {'type': 'event'}), ('group_send', 'group', {'type': 'event'})]
+        )
+
+    def test_rolled_back_events_are_dropped(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                self.outbox.send('channel', {'type': 'event'})
+                raise RuntimeError
+        self.assertEqual(self.queued(), [])
+
+    def test_emitted_data_is_built_after_the_commit(self):
+        room = Room.objects.create(name='room', type=Room.RoomTypeChoices.PUBLIC)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.outbox.emit(room.pk, 'event', lambda: Room.objects.get(pk=room.pk).name)
+            Room.objects.filter(pk=room.pk).update(name='renamed')
+        self.assertEqual(EventOutbox._resolve(self.queued()), [('emit', room.pk, ('event', 'renamed'))])
+
+    def test_failing_data_is_dropped(self):
+        with self.assertLogs('room.outbox', 'ERROR'):
+            entries = EventOutbox._resolve([('emit', 'room', ('event', lambda: 1 / 0)), ('send', 'channel', {})])
+        self.assertEqual(entries, [('send', 'channel', {})])
+
+    def test_run_dispatches_batches_until_stopped(self):
+        batches = []
+
+        async def dispatch(entries):
+            batches.append(entries)
+
+        for index in range(3):
+            self.outbox.queue.put(('send', 'channel', {'index': index}))
+        self.outbox.wake()
+        with mock.patch.object(self.outbox, 'dispatch', side_effect=dispatch):
+            self.outbox.run()
+        self.assertEqual([[entry[2]['index'] for entry in batch] for batch in batches], [[0, 1], [2]])
+
+    @override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+    def test_dispatch_keeps_the_order_of_each_target(self):
+        async def dispatch():
+            channel_layer = get_channel_layer()
+            channels = [await channel_layer.new_channel() for _ in range(2)]
+            entries = [('send', channels[index % 2], {'type': 'event', 'index': index}) for index in range(6)]
+            await self.outbox.dispatch(entries)
+            return [[(await channel_layer.receive(channel))['index'] for _ in range(3)] for channel in channels]
+
+        self.assertEqual(async_to_sync(dispatch)(), [[0, 2, 4], [1, 3, 5]])
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS, SPECTATOR_SEND_INTERVAL=0.01)
+class SpectatorConsumerTestCase(TransactionTestCase):
+
+    def setUp(self):
+        self.room = Room.objects.create(name='room', type=Room.RoomTypeChoices.PUBLIC)
+        # the relay task of a hub lives on the event loop of the test that started it
+        hub = mock.patch.object(consumers, 'SPECTATOR_HUB', SpectatorHub())
+        hub.start()
+        self.addCleanup(hub.stop)
+
+    async def spectate(self, room_id) -> WebsocketCommunicator:
+        communicator = WebsocketCommunicator(websocket_urlpatterns, f'/room/{room_id}/spectate/')
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def test_snapshot_then_events(self):
+        communicator = await self.spectate(self.room.pk)
+        snapshot = await communicator.receive_json_from()
+        self.assertEqual(snapshot['message'], RoomConsumer.SNAPSHOT)
+        self.assertEqual(snapshot['data']['room']['name'], 'room')
+
+        seqs = [await emit_to_room(self.room.pk, 'event', index) for index in range(3)]
+        for index, seq in enumerate(seqs):
+            self.assertEqual(await communicator.receive_json_from(), {'message': 'event', 'data': index, 'seq': seq})
+        await communicator.disconnect()
+
+    async def test_private_rooms_are_refused(self):
+        await database_sync_to_async(Room.objects.filter(pk=self.room.pk).update)(type=Room.RoomTypeChoices.PRIVATE)
+        communicator = WebsocketCommunicator(websocket_urlpatterns, f'/room/{self.room.pk}/spectate/')
+        connected, code = await communicator.connect()
+        self.assertEqual((connected, code), (False, 3003))
+
+    async def test_failed_sends_resync(self):
+        snapshot = await database_sync_to_async(build_snapshot)(self.room.pk, 0)
+        with mock.patch.object(consumers, 'build_snapshot', side_effect=[RuntimeError, snapshot]):
+            with self.assertLogs('room.consumers', 'ERROR'):
+                communicator = await self.spectate(self.room.pk)
+                received = await communicator.receive_json_from()
+        # the sender kept going after the failure
+        self.assertEqual(received, snapshot)
+        seq = await emit_to_room(self.room.pk, 'event', None)
+        self.assertEqual((await communicator.receive_json_from())['seq'], seq)
+        await communicator.disconnect()
+
+class LocalRoomEventBufferTestCase(SimpleTestCase):
+
+    def buffer(self):
+        return LocalRoomEventBuffer(size=3, ttl=60, max_rooms=10)
+
+    def test_events_since_a_sequence_number(self):
+        buffer, room_id = self.buffer(), uuid.uuid4()
+        seqs = [buffer.append(room_id, {'message': 'event', 'data': index}) for index in range(3)]
+        self.assertEqual(seqs, list(range(seqs[0], seqs[0] + 3)))
+        current_seq, events = buffer.since(room_id, seqs[0])
+        self.assertEqual(current_seq, seqs[2])
+        self.assertEqual(events, [{'message': 'event', 'data': index, 'seq': seqs[index]} for index in (1, 2)])
+        self.assertEqual(buffer.since(room_id, seqs[2]), (seqs[2], []))
+
+    def test_events_no_longer_buffered(self):
+        buffer, room_id = self.buffer(), uuid.uuid4()
+        seqs = [buffer.append(room_id, {'message': 'event', 'data': index}) for index in range(5)]
+        # only the last 3 events are kept
+        self.assertIsNone(buffer.since(room_id, seqs[0])[1])
+        self.assertEqual([event['data'] for event in buffer.since(room_id, seqs[1])[1]], [2, 3, 4])
+
+    def test_sequence_numbers_of_another_buffer(self):
+        buffer, room_id = self.buffer(), uuid.uuid4()
+        seq = buffer.append(room_id, {'message': 'event', 'data': None})
+        self.assertIsNone(buffer.since(room_id, seq + 1)[1])
+        # a buffer created again starts after the sequence numbers of the previous one
+        self.assertIsNone(self.buffer().since(room_id, seq)[1])
+        with mock.patch('room.event_buffer.time.time', return_value=seq / 1000 + 1):
+            self.assertGreater(self.buffer().append(room_id, {'message': 'event', 'data': None}), seq)
+
+    def test_rooms_are_independent(self):
+        buffer, room_id, other_room_id = self.buffer(), uuid.uuid4(), uuid.uuid4()
+        seq = buffer.append(room_id, {'message': 'event', 'data': None})
+        buffer.append(other_room_id, {'message': 'other', 'data': None})
+        self.assertEqual(buffer.since(room_id, seq), (seq, []))
+
+
+class RedisRoomEventBufferTestCase(LocalRoomEventBufferTestCase):
+
+    def setUp(self):
+        self.client = fakeredis.FakeRedis()
+
+    def buffer(self):
+        return RedisRoomEventBuffer(client=self.client, size=3, ttl=60)
+
+    def test_sequence_numbers_of_another_buffer(self):
+        buffer, room_id = self.buffer(), uuid.uuid4()
+        seq = buffer.append(room_id, {'message': 'event', 'data': None})
+        self.assertIsNone(buffer.since(room_id, seq + 1)[1])
+        # the buffer of a room is shared by every worker until it expires
+        self.assertEqual(self.buffer().since(room_id, seq), (seq, []))
+        self.client.flushall()
+        self.assertIsNone(self.buffer().since(room_id, seq)[1])
+        with mock.patch('room.event_buffer.time.time', return_value=seq / 1000 + 1):
+            self.assertGreater(self.buffer().append(room_id, {'message': 'event', 'data': None}), seq)
+
+    def test_events_expire(self):
+        buffer, room_id = self.buffer(), uuid.uuid4()
+        buffer.append(room_id, {'message': 'event', 'data': None})
+        self.assertTrue(all(0 < self.client.ttl(key) <= 60 for key in buffer._keys(room_id)))
+
+
+class RoomSnapshotCacheTestCase(TestCase):
+
+    def setUp(self):
+        self.room = Room.objects.create(name='room', type=Room.RoomTypeChoices.PUBLIC)
+
+    def players(self):
+        return {player['name'] for player in ROOM_SNAPSHOTS.get(self.room.pk)['players']}
+
+    def test_snapshot_is_serialized_once_per_version(self):
+        snapshot = ROOM_SNAPSHOTS.get(self.room.pk)
+        self.assertEqual((snapshot['name'], snapshot['players'], snapshot['game']), ('room', [], None))
+        with self.assertNumQueries(0):
+            self.assertEqual(ROOM_SNAPSHOTS.get(self.room.pk), snapshot)
+
+    def test_changes_bump_the_version_on_commit(self):
+        self.assertEqual(self.players(), set())
+        with self.captureOnCommitCallbacks(execute=True):
+            player = take_seat(self.room, name='first')
+            # the snapshot of the old version is kept until the change is committed
+            self.assertEqual(self.players(), set())
+        self.assertEqual(self.players(), {'first'})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            swap_seat(player, HEART)
+        self.assertEqual(ROOM_SNAPSHOTS.get(self.room.pk)['players'][0]['player_symbol'], HEART)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Player.objects.create(name='second', room=self.room, player_symbol=SPADE)
+        self.assertEqual(self.players(), {'first', 'second'})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            board = TeamChessBoard()
+            Game.objects.create(room=self.room, fen=board.get_original_fen(), custom_fen=board.fen())
+        self.assertIsNotNone(ROOM_SNAPSHOTS.get(self.room.pk)['game'])
+
+    def test_rolled_back_changes_keep_the_version(self):
+        version = ROOM_SNAPSHOTS.version(self.room.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                take_seat(self.room, name='first')
+                raise RuntimeError
+        self.assertEqual(ROOM_SNAPSHOTS.version(self.room.pk), version)
+        self.assertEqual(self.players(), set())
+
+    def test_rooms_are_independent(self):
+        other_room = Room.objects.create(name='other', type=Room.RoomTypeChoices.PUBLIC)
+        version = ROOM_SNAPSHOTS.version(self.room.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            take_seat(other_room, name='other')
+        self.assertEqual(ROOM_SNAPSHOTS.version(self.room.pk), version)
+
+
+class LobbyTestCase(TestCase):
+
+    def create_rooms(self, count: int, **fields):
+        now = timezone.now()
+        rooms = []
+        for index in range(count):
+            room = Room.objects.create(name=f'room {index}', type=Room.RoomTypeChoices.PUBLIC, **fields)
+            # distinct creation dates, the newest room last
+            Room.objects.filter(pk=room.pk).update(created_at=now + datetime.timedelta(seconds=index))
+            rooms.append(room)
+        return rooms
+
+    def lobby(self, url: str = '/room/'):
+        response = APIClient().get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_only_joinable_rooms_are_listed(self):
+        joinable, full, in_game = self.create_rooms(3)
+        Room.objects.filter(pk=in_game.pk).update(status=Room.RoomStatusChoices.IN_GAME)
+        Room.objects.create(name='private', type=Room.RoomTypeChoices.PRIVATE, password='password')
+        take_seat(joinable, name='player')
+        for index in range(len(PLAYER_SYMBOLS)):
+            take_seat(full, name=f'player {index}')
+
+        rooms = self.lobby()['results']
+        self.assertEqual([(room['id'], room['player_count']) for room in rooms], [(str(joinable.pk), 1)])
+        self.assertNotIn('password', rooms[0])
+
+    def test_pages_follow_the_cursor(self):
+        rooms = self.create_rooms(7)
+        page = self.lobby('/room/?page_size=3')
+        listed = []
+        while True:
+            listed += [room['id'] for room in page['results']]
+            if page['next'] is None:
+                break
+            page = self.lobby(page['next'])
+        self.assertEqual(listed, [str(room.pk) for room in reversed(rooms)])
+
+    def test_page_size_is_capped(self):
+        self.create_rooms(101)
+        self.assertEqual(len(self.lobby()['results']), 20)
+        self.assertEqual(len(self.lobby('/room/?page_size=1000')['results']), 100)
+
+
+@contextlib.contextmanager
+def later(seconds: float):
+    """
+    Moves the clocks of the matchmaking module forward.
+    """
+    monotonic, now = time.monotonic() + seconds, time.time() + seconds
+    with mock.patch('room.matchmaking.time.monotonic', return_value=monotonic), \
+            mock.patch('room.matchmaking.time.time', return_value=now):
+        yield
+
+
+class LocalMatchmakingQueueTestCase(SimpleTestCase):
+
+    def queue(self):
+        return LocalMatchmakingQueue(result_ttl=60, max_results=100)
+
+    def test_tickets_are_popped_in_order(self):
+        queue = self.queue()
+        tickets = [new_ticket(f'player {index}') for index in range(3)]
+        for ticket in tickets:
+            queue.push(ticket)
+        popped = queue.pop(2)
+        self.assertEqual(popped, tickets[:2])
+        queue.requeue(popped)
+        self.assertEqual(queue.pop(10), tickets)
+        self.assertEqual(queue.pop(10), [])
+
+    def test_cancelled_tickets_are_not_popped(self):
+        queue = self.queue()
+        first, second = new_ticket('first'), new_ticket('second')
+        queue.push(first)
+        queue.push(second)
+        queue.cancel(first['id'])
+        self.assertEqual(queue.pop(10), [second])
+        self.assertEqual(queue.cancelled([first['id'], second['id']]), {first['id']})
+
+    def test_popped_tickets_cancelled_are_not_requeued(self):
+        queue = self.queue()
+        first, second = new_ticket('first'), new_ticket('second')
+        queue.push(first)
+        queue.push(second)
+        popped = queue.pop(10)
+        # the websocket of the ticket closed while it was being matched
+        queue.cancel(first['id'])
+        queue.requeue(popped)
+        self.assertEqual(queue.pop(10), [second])
+
+    def test_matches_are_claimed_once(self):
+        queue = self.queue()
+        queue.set_result('ticket', {'room_id': 'room', 'player_id': 1, 'token': 'token'})
+        self.assertEqual(queue.get_result('ticket')['player_id'], 1)
+        self.assertTrue(queue.claim('ticket'))
+        self.assertFalse(queue.claim('ticket'))
+        with later(61):
+            self.assertEqual(queue.pop_unclaimed(10), [])
+
+    def test_matches_not_claimed_in_time_are_unclaimed(self):
+        queue = self.queue()
+        for player_id in range(3):
+            queue.set_result(f'ticket {player_id}', {'room_id': 'room', 'player_id': player_id, 'token': 'token'})
+        self.assertEqual(queue.pop_unclaimed(10), [])
+        with later(61):
+            self.assertEqual(queue.pop_unclaimed(2), [0, 1])
+            self.assertEqual(queue.pop_unclaimed(2), [2])
+        self.assertFalse(queue.claim('ticket 0'))
+
+    def test_cancelled_matches_are_unclaimed_right_away(self):
+        queue = self.queue()
+        queue.set_result('first', {'room_id': 'room', 'player_id': 1, 'token': 'token'})
+        queue.set_result('second', {'room_id': 'room', 'player_id': 2, 'token': 'token'})
+        queue.cancel('second')
+        self.assertEqual(queue.pop_unclaimed(10), [2])
+        self.assertFalse(queue.claim('second'))
+        self.assertTrue(queue.claim('first'))
+
+
+class RedisMatchmakingQueueTestCase(LocalMatchmakingQueueTestCase):
+
+    def setUp(self):
+        self.client = fakeredis.FakeRedis()
+
+    def queue(self):
+        return RedisMatchmakingQueue(client=self.client, result_ttl=60)
+
+    def test_cancellations_expire(self):
+        queue = self.queue()
+        ticket = new_ticket('player')
+        queue.cancel(ticket['id'])
+        with later(61):
+            self.assertEqual(queue.cancelled([ticket['id']]), set())
+            queue.requeue([ticket])
+            # expired cancellations are dropped by the next cancellation
+            queue.cancel('other')
+        self.assertEqual(queue.pop(10), [ticket])
+        self.assertEqual(self.client.zrange(queue.cancelled_key, 0, -1), [b'other'])
+
+
+class MatcherTestCase(TestCase):
+
+    def setUp(self):
+        self.queue = LocalMatchmakingQueue(result_ttl=60, max_results=100)
+        self.matcher = Matcher(self.queue, interval=60, batch_size=8, max_wait=10)
+        outbox = mock.patch.object(matchmaking.EVENT_OUTBOX, 'group_send')
+        self.group_send = outbox.start()
+        self.addCleanup(outbox.stop)
+
+    def enqueue(self, count: int, enqueued_at: float = None):
+        tickets = [new_ticket(f'player {index}') for index in range(count)]
+        for ticket in tickets:
+            if enqueued_at is not None:
+                ticket['enqueued_at'] = enqueued_at
+            self.queue.push(ticket)
+        return tickets
+
+    def match(self) -> int:
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.matcher.match()
+
+    def test_full_rooms_are_created(self):
+        tickets = self.enqueue(4)
+        self.assertEqual(self.match(), 4)
+        room = Room.objects.get()
+        players = {player.name: player for player in room.players.all()}
+        for ticket, player_symbol in zip(tickets, PLAYER_SYMBOLS):
+            result = self.queue.get_result(ticket['id'])
+            player = players[ticket['player_name']]
+            self.assertEqual(result, {'room_id': str(room.pk), 'player_id': player.pk, 'token': player.auth_token.key})
+            self.assertEqual(player.player_symbol, player_symbol)
+        self.assertEqual([player.is_game_manager for player in room.players.order_by('player_symbol')].count(True), 1)
+        self.assertEqual(self.group_send.call_count, 4)
+
+    def test_joinable_rooms_are_filled_first(self):
+        room = Room.objects.create(name='room', type=Room.RoomTypeChoices.PUBLIC)
+        take_seat(room, name='host')
+        self.enqueue(3)
+        self.assertEqual(self.match(), 3)
+        self.assertEqual(room.players.count(), len(PLAYER_SYMBOLS))
+        self.assertEqual(Room.objects.count(), 1)
+
+    def test_left_over_tickets_wait(self):
+        self.enqueue(3)
+        self.assertEqual(self.match(), 0)
+        self.assertEqual(len(self.queue.tickets), 3)
+        with later(11):
+            self.assertEqual(self.match(), 3)
+        self.assertEqual(Room.objects.get().players.count(), 3)
+
+    def test_cancelled_tickets_are_not_seated(self):
+        tickets = self.enqueue(4)
+        popped = self.queue.pop(10)
+        # cancelled after the matcher popped it
+        self.queue.cancel(tickets[0]['id'])
+        with self.captureOnCommitCallbacks(execute=True):
+            matches, waiting = self.matcher.seat(popped)
+        self.assertEqual((matches, waiting), ([], tickets[1:]))
+        self.queue.requeue(waiting)
+        self.assertEqual(self.queue.pop(10), tickets[1:])
+        self.assertFalse(Player.objects.exists())
+
+    def test_seats_of_unclaimed_matches_are_freed(self):
+        tickets = self.enqueue(4)
+        self.match()
+        room = Room.objects.get()
+        self.assertTrue(self.queue.claim(tickets[0]['id']))
+        self.queue.cancel(tickets[1]['id'])
+        self.assertEqual(self.matcher.free_unclaimed(), 1)
+        self.assertEqual(room.players.count(), 3)
+
+        with later(61):
+            self.assertEqual(self.matcher.free_unclaimed(), 2)
+        self.assertEqual(list(room.players.values_list('name', flat=True)), [tickets[0]['player_name']])
+
+    def test_rooms_left_empty_are_deleted(self):
+        self.enqueue(4)
+        self.match()
+        with later(61):
+            self.matcher.free_unclaimed()
+        self.assertFalse(Room.objects.exists())
+        self.assertFalse(Player.objects.exists())
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class MatchmakingConsumerTestCase(TransactionTestCase):
+
+    def setUp(self):
+        queue = mock.patch.object(consumers, 'MATCHMAKING_QUEUE', LocalMatchmakingQueue(result_ttl=60, max_results=10))
+        self.queue = queue.start()
+        self.addCleanup(queue.stop)
+        self.ticket = new_ticket('player')
+        self.queue.push(self.ticket)
+        self.result = {'room_id': str(uuid.uuid4()), 'player_id': 1, 'token': 'token'}
+
+    async def connect(self) -> WebsocketCommunicator:
+        communicator = WebsocketCommunicator(websocket_urlpatterns, f'/matchmaking/{self.ticket["id"]}/')
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def test_match_is_sent_and_claimed(self):
+        communicator = await self.connect()
+        self.queue.set_result(self.ticket['id'], self.result)
+        await get_channel_layer().group_send(
+            matchmaking.ticket_group(self.ticket['id']), {'type': 'matchmaking.matched', 'result': self.result}
+        )
+        self.assertEqual(await communicator.receive_json_from(), {'message': 'matched', 'data': self.result})
+        self.assertEqual((await communicator.receive_output())['type'], 'websocket.close')
+        self.assertEqual(self.queue.pop_unclaimed(10), [])
+        self.assertEqual(self.queue.cancelled([self.ticket['id']]), set())
+
+    async def test_match_made_before_the_socket_connected(self):
+        self.queue.set_result(self.ticket['id'], self.result)
+        communicator = await self.connect()
+        self.assertEqual(await communicator.receive_json_from(), {'message': 'matched', 'data': self.result})
+        self.assertFalse(self.queue.claim(self.ticket['id']))
+
+    async def test_expired_match_is_not_sent(self):
+        self.queue.set_result(self.ticket['id'], self.result)
+        with later(61):
+            self.assertEqual(self.queue.pop_unclaimed(10), [1])
+        communicator = await self.connect()
+        closed = await communicator.receive_output()
+        self.assertEqual((closed['type'], closed['code']), ('websocket.close', 3008))
+
+    async def test_closing_the_socket_cancels_the_ticket(self):
+        communicator = await self.connect()
+        await communicator.disconnect()
+        self.assertEqual(self.queue.pop(10), [])
+        self.assertEqual(self.queue.cancelled([self.ticket['id']]), {self.ticket['id']})
+
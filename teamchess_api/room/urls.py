@@ -5,4 +5,5 @@ urlpatterns = [
     path('', views.ListCreateRoomView.as_view()),
     path('<uuid:pk>/', views.RetrieveRoomView.as_view()),
     path('<uuid:pk>/join/', views.JoinRoomView.as_view()),
+    path('matchmaking/', views.MatchmakingView.as_view()),
 ]
@@ -2,18 +2,36 @@ from rest_framework.generics import ListCreateAPIView, RetrieveAPIView, CreateAP
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
+from django.db.models import Count
+from engine.constants import PLAYER_SYMBOLS
 from player.auth import TokenAuthentication
+from .pagination import LobbyPagination
 from .permissions import CanAccessRoom
 from . import serializers
 from .models import Room
 
 
 class ListCreateRoomView(ListCreateAPIView):
+    """
+    Lists the lobby: the joinable rooms, public, waiting and not full, with their player count, newest first.
+    """
     queryset = Room.objects.all()
+    pagination_class = LobbyPagination
+
+    def get_queryset(self):
+        if self.request.method != 'GET':
+            return super().get_queryset()
+        return Room.objects.filter(
+            type=Room.RoomTypeChoices.PUBLIC, status=Room.RoomStatusChoices.WAITING
+        ).annotate(
+            player_count=Count('players')
+        ).filter(
+            player_count__lt=len(PLAYER_SYMBOLS)
+        ).defer('password')
 
     def get_serializer_class(self):
         if self.request.method == 'GET':
-            return serializers.ListRoomSerializer
+            return serializers.LobbyRoomSerializer
         else:
             return serializers.CreateRoomSerializer
 
@@ -35,3 +53,16 @@ class JoinRoomView(CreateAPIView):
         serializer.is_valid(raise_exception=True)
         self.perform_create(serializer)
         return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+class MatchmakingView(CreateAPIView):
+    """
+    Enqueues a player for matchmaking, the returned ticket is matched over the websocket matchmaking/<ticket>/.
+    """
+    serializer_class = serializers.EnqueueMatchmakingSerializer
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        self.perform_create(serializer)
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
@@ -0,0 +1,76 @@
+import atexit
+import logging
+import threading
+from typing import Optional
+
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundWorker:
+    """
+    Base of the services doing their work in a daemon thread of the process, started on first use and stopped when
+    the process exits gracefully. Subclasses implement run(), which must return once stopping is set.
+    """
+    thread_name: Optional[str] = None
+
+    def __init__(self):
+        self.stopping = threading.Event()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+    def start(self) -> None:
+        """
+        Starts the background thread, if it is not running yet.
+        """
+        if self._thread is not None:
+            return
+        with self._thread_lock:
+            if self._thread is None:
+                self.stopping.clear()
+                self._thread = threading.Thread(target=self.run, name=self.thread_name, daemon=True)
+                self._thread.start()
+                atexit.register(self.stop)
+
+    def stop(self) -> None:
+        """
+        Stops the background thread and waits for it to return.
+        """
+        self.stopping.set()
+        with self._thread_lock:
+            if self._thread is not None:
+                self.wake()
+                self._thread.join()
+                self._thread = None
+                atexit.unregister(self.stop)
+
+    def wake(self) -> None:
+        """
+        Called when stopping, for threads blocked on anything else than the stopping event to notice it.
+        """
+
+    def run(self) -> None:
+        raise NotImplementedError
+
+
+class PeriodicWorker(BackgroundWorker):
+    """
+    A background worker calling tick() every interval seconds, failures are logged and retried on the next interval.
+    """
+
+    def __init__(self, interval: float):
+        super().__init__()
+        self.interval = interval
+
+    def run(self) -> None:
+        while not self.stopping.wait(self.interval):
+            try:
+                self.tick()
+            except Exception:
+                logger.exception('%s failed', self.thread_name)
+            finally:
+                close_old_connections()
+
+    def tick(self) -> None:
+        raise NotImplementedError
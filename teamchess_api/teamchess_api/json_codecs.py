@@ -0,0 +1,89 @@
+"""
+JSON codecs shared by the room websocket frames and the REST API, selected by the JSON_CODEC setting.
+
+OrjsonCodec requires the optional orjson package, the default codec falls back to StdlibJsonCodec without it.
+"""
+import json
+from functools import lru_cache
+from typing import Any, Union
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+from rest_framework import parsers, renderers
+from rest_framework.exceptions import ParseError
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class StdlibJsonCodec:
+    """
+    Compact UTF-8 JSON through the standard library, encoding what DRF's encoder does (dates, UUIDs, decimals...).
+    """
+
+    def encode(self, obj: Any) -> bytes:
+        return self.encode_text(obj).encode()
+
+    def encode_text(self, obj: Any) -> str:
+        return json.dumps(obj, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':'))
+
+    def decode(self, data: Union[bytes, str]) -> Any:
+        return json.loads(data)
+
+
+class OrjsonCodec(StdlibJsonCodec):
+    """
+    Encodes and decodes through orjson, the types orjson doesn't support natively are encoded by DRF's encoder.
+    """
+    _default = JSONEncoder().default
+
+    def __init__(self):
+        if orjson is None:
+            raise ImportError('OrjsonCodec requires the orjson package')
+
+    def encode(self, obj: Any) -> bytes:
+        return orjson.dumps(obj, default=self._default)
+
+    def encode_text(self, obj: Any) -> str:
+        return self.encode(obj).decode()
+
+    def decode(self, data: Union[bytes, str]) -> Any:
+        return orjson.loads(data)
+
+
+@lru_cache(maxsize=None)
+def get_json_codec(codec: str = None) -> StdlibJsonCodec:
+    """
+    Returns the codec configured by the JSON_CODEC setting, the fastest one available by default.
+    """
+    codec = codec or settings.JSON_CODEC
+    if codec is None:
+        return OrjsonCodec() if orjson is not None else StdlibJsonCodec()
+    return import_string(codec)()
+
+
+class JSONRenderer(renderers.JSONRenderer):
+    """
+    Renders compact responses through the configured codec, indented responses (requested through the accept header)
+    are left to DRF.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        return get_json_codec().encode(data)
+
+
+class JSONParser(parsers.JSONParser):
+    renderer_class = JSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return get_json_codec().decode(stream.read())
+        except ValueError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
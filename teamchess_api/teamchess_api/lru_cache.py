@@ -0,0 +1,72 @@
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+class LRUCache:
+    """
+    An LRU cache bounded both by size and by idle time: entries not accessed for idle_ttl seconds are evicted along
+    with the least recently used ones past max_size, passing each evicted entry to on_evict.
+
+    Idle entries are evicted when touched and by evict(), which every insertion calls, so no timer is needed.
+    Keeps hit, miss and eviction counters.
+    """
+
+    def __init__(self, max_size: int, idle_ttl: float, on_evict: Optional[Callable[[str, Any], None]] = None):
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+        self.on_evict = on_evict
+        self.entries: 'OrderedDict[str, Tuple[float, Any]]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self.entries.get(key)
+        now = time.monotonic()
+        if entry is not None and now - entry[0] > self.idle_ttl:
+            self._evict(key)
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.entries[key] = (now, entry[1])
+        self.entries.move_to_end(key)
+        return entry[1]
+
+    def set(self, key: str, value: Any) -> None:
+        self.entries[key] = (time.monotonic(), value)
+        self.entries.move_to_end(key)
+        self.evict()
+
+    def pop(self, key: str) -> Optional[Any]:
+        """
+        Removes the entry without passing it to on_evict.
+        """
+        entry = self.entries.pop(key, None)
+        return entry[1] if entry is not None else None
+
+    def evict(self) -> None:
+        """
+        Evicts the least recently used entries past max_size, and the idle ones, which are the least recently used too.
+        """
+        deadline = time.monotonic() - self.idle_ttl
+        while self.entries:
+            key, (last_access, _) = next(iter(self.entries.items()))
+            if len(self.entries) <= self.max_size and last_access >= deadline:
+                break
+            self._evict(key)
+
+    def _evict(self, key: str) -> None:
+        _, value = self.entries.pop(key)
+        self.evictions += 1
+        if self.on_evict is not None:
+            self.on_evict(key, value)
+
+    def stats(self) -> Dict[str, int]:
+        return dict(size=len(self.entries), hits=self.hits, misses=self.misses, evictions=self.evictions)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.entries
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 import environ
 
@@ -91,6 +92,95 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Engine process pool, used to run CPU bound engine work (search, legal moves, game over detection) off the event loop.
+ENGINE_POOL_SIZE = env.int('ENGINE_POOL_SIZE', default=os.cpu_count() or 1)
+
+# Default deadline in seconds of an engine task, including the time it waits in the pool queue.
+ENGINE_TASK_TIMEOUT = env.float('ENGINE_TASK_TIMEOUT', default=5.0)
+
+# Store of the boards of games in progress, either the in-process game.active_boards.LocalActiveBoardStore, or
+# game.active_boards.RedisActiveBoardStore to share games between workers and keep them across restarts.
+ACTIVE_BOARDS_BACKEND = env.str('ACTIVE_BOARDS_BACKEND', default='game.active_boards.LocalActiveBoardStore')
+
+# Seconds a board is kept in Redis after its last write.
+ACTIVE_BOARDS_REDIS_TTL = env.int('ACTIVE_BOARDS_REDIS_TTL', default=60 * 60 * 24)
+
+# Boards kept in memory per worker, least recently used boards past the limit, or boards idle for longer than the TTL
+# (in seconds) are evicted, the in-process store writes them back to Game.custom_fen.
+ACTIVE_BOARDS_MAX_SIZE = env.int('ACTIVE_BOARDS_MAX_SIZE', default=10000)
+ACTIVE_BOARDS_IDLE_TTL = env.float('ACTIVE_BOARDS_IDLE_TTL', default=60 * 30)
+
+# Seconds between write-behind flushes of the positions of games in progress to the database.
+GAME_PERSIST_INTERVAL = env.float('GAME_PERSIST_INTERVAL', default=5.0)
+
+# Plies between the positions kept as keyframes in the move log, a position is replayed from the nearest keyframe.
+GAME_MOVE_KEYFRAME_INTERVAL = env.int('GAME_MOVE_KEYFRAME_INTERVAL', default=32)
+
+# Buffer of the last events of each room, replayed to reconnecting clients, either the in-process
+# room.event_buffer.LocalRoomEventBuffer, or room.event_buffer.RedisRoomEventBuffer to share it between workers.
+ROOM_EVENTS_BACKEND = env.str('ROOM_EVENTS_BACKEND', default='room.event_buffer.LocalRoomEventBuffer')
+
+# Events buffered per room, and seconds a room buffer is kept after its last event.
+ROOM_EVENTS_BUFFER_SIZE = env.int('ROOM_EVENTS_BUFFER_SIZE', default=100)
+ROOM_EVENTS_TTL = env.int('ROOM_EVENTS_TTL', default=60 * 60)
+
+# Rooms the in-process event buffer keeps events of, the least recently used rooms past the limit are dropped.
+ROOM_EVENTS_MAX_ROOMS = env.int('ROOM_EVENTS_MAX_ROOMS', default=10000)
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_HOST,
+    },
+}
+
+# Cache of the serialized rooms sent over the room websocket, and seconds a serialized room is kept, serialized rooms
+# are keyed by a room version bumped on every change so they never go stale.
+ROOM_SNAPSHOT_CACHE = env.str('ROOM_SNAPSHOT_CACHE', default='default')
+ROOM_SNAPSHOT_TTL = env.int('ROOM_SNAPSHOT_TTL', default=60 * 5)
+
+# JSON codec of the room websocket frames and the REST API, teamchess_api.json_codecs.OrjsonCodec (requires orjson) or
+# teamchess_api.json_codecs.StdlibJsonCodec, defaults to orjson when it is installed.
+JSON_CODEC = env.str('JSON_CODEC', default=None)
+
+# Spectator sockets send the events of the room at most once per interval (in seconds), spectators with more pending
+# events than the backlog limit receive a fresh snapshot instead.
+SPECTATOR_SEND_INTERVAL = env.float('SPECTATOR_SEND_INTERVAL', default=0.25)
+SPECTATOR_MAX_BACKLOG = env.int('SPECTATOR_MAX_BACKLOG', default=32)
+
+# Seconds the player of a websocket token is cached for, and the maximum number of cached tokens per process.
+WEBSOCKET_AUTH_CACHE_TTL = env.float('WEBSOCKET_AUTH_CACHE_TTL', default=30.0)
+WEBSOCKET_AUTH_CACHE_MAX_SIZE = env.int('WEBSOCKET_AUTH_CACHE_MAX_SIZE', default=10000)
+
+# Presence of the players on their room websocket, player.presence.RedisPresenceStore shares it between the workers
+# serving the sockets and the REST API, the in-process player.presence.LocalPresenceStore is meant for development and
+# tests only.
+PRESENCE_BACKEND = env.str('PRESENCE_BACKEND', default='player.presence.RedisPresenceStore')
+
+# Seconds between the heartbeats of a player socket, and seconds a player stays online after the last heartbeat.
+PRESENCE_HEARTBEAT_INTERVAL = env.float('PRESENCE_HEARTBEAT_INTERVAL', default=20.0)
+PRESENCE_TTL = env.float('PRESENCE_TTL', default=60.0)
+
+# Maximum number of channel layer events sent after commit that the outbox dispatches at once.
+EVENT_OUTBOX_BATCH_SIZE = env.int('EVENT_OUTBOX_BATCH_SIZE', default=500)
+
+# Queue of the players waiting for matchmaking, either the in-process room.matchmaking.LocalMatchmakingQueue, or
+# room.matchmaking.RedisMatchmakingQueue to match the players enqueued by every worker.
+MATCHMAKING_QUEUE_BACKEND = env.str('MATCHMAKING_QUEUE_BACKEND', default='room.matchmaking.LocalMatchmakingQueue')
+
+# Seconds between matching batches, and the maximum number of queued players matched per batch.
+MATCHMAKING_INTERVAL = env.float('MATCHMAKING_INTERVAL', default=1.0)
+MATCHMAKING_BATCH_SIZE = env.int('MATCHMAKING_BATCH_SIZE', default=400)
+
+# Seconds players wait for a full room before being matched in a partially filled one.
+MATCHMAKING_MAX_WAIT = env.float('MATCHMAKING_MAX_WAIT', default=10.0)
+
+# Seconds a match is kept for its player to pick it up, the seat of a match not picked up in time is freed.
+MATCHMAKING_RESULT_TTL = env.int('MATCHMAKING_RESULT_TTL', default=60)
+
+# Matches the in-process matchmaking queue keeps, the least recently used matches past the limit are dropped.
+MATCHMAKING_MAX_RESULTS = env.int('MATCHMAKING_MAX_RESULTS', default=10000)
+
 
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
@@ -138,6 +228,15 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [],
+    'DEFAULT_RENDERER_CLASSES': [
+        'teamchess_api.json_codecs.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'teamchess_api.json_codecs.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
 
 AUTH_USER_MODEL = 'player.Player'